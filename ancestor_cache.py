@@ -0,0 +1,156 @@
+from collections import OrderedDict
+import sys
+
+
+class AncestorCache:
+    """Class AncestorCache, a size-bounded LRU cache of resolved ancestor chains
+
+    The chains are kept by source id, from the least to the most recently
+    used, and the least recently used chains are evicted when the cache has
+    more than `max_entries` chains or more than `max_bytes` (estimated).
+
+    A chain is only valid for the data it was resolved from: `validate` is
+    called with a version of that data (e.g. the objects saved when a pass
+    starts) and the cache is emptied when the version changes. Each chain
+    also keeps the names it depends on, and `forget` drops the chains of the
+    names of new saved objects, so the rest of the chains stay valid.
+    """
+
+    def __init__(self, max_entries: int = 10000, max_bytes: int = None):
+        """Function to initialize the class
+
+        Args:
+            max_entries (int): The maximum number of chains
+            max_bytes (int): The maximum estimated size of the chains (None for
+            no limit)
+
+        """
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self.version = None
+        # The keys of the chains that depend on each name
+        self.dependents = {}
+
+    def sizeof(self, value):
+        """Function to estimate the memory used by a chain
+
+        Args:
+            value: A chain (lists, tuples and dictionaries of strings)
+
+        Returns:
+            size (int): The estimated size in bytes
+
+        """
+        size = sys.getsizeof(value)
+        if isinstance(value, dict):
+            size += sum(self.sizeof(item) for item in value.values())
+        elif isinstance(value, (list, tuple)):
+            size += sum(self.sizeof(item) for item in value)
+        return size
+
+    def validate(self, version):
+        """Function to drop all the chains if the data they come from changed
+
+        Args:
+            version: The version of the data the chains are resolved from
+
+        """
+        if version == self.version:
+            return
+        self.invalidations += len(self.entries)
+        self.entries.clear()
+        self.dependents = {}
+        self.bytes = 0
+        self.version = version
+
+    def forget(self, names):
+        """Function to drop the chains that depend on some names
+
+        Args:
+            names: The names of the new saved objects
+
+        """
+        for name in names:
+            for key in self.dependents.pop(name, ()):
+                if key in self.entries:
+                    self.remove(key)
+                    self.invalidations += 1
+
+    def get(self, key):
+        """Function to get a chain and mark it as the most recently used
+
+        Args:
+            key: The source id
+
+        Returns:
+            The chain, or None if it isn't on the cache
+
+        """
+        entry = self.entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.entries.move_to_end(key)
+        return entry[0]
+
+    def remove(self, key):
+        """Function to remove a chain
+
+        Args:
+            key: The source id
+
+        """
+        _, size, names = self.entries.pop(key)
+        self.bytes -= size
+        for name in names:
+            keys = self.dependents.get(name)
+            if keys is not None:
+                keys.discard(key)
+
+    def put(self, key, value, names=()):
+        """Function to add a chain, evicting the least recently used ones
+
+        Args:
+            key: The source id
+            value: The resolved chain
+            names: The names the chain depends on (see forget)
+
+        """
+        if key in self.entries:
+            self.remove(key)
+        size = self.sizeof(value) if self.max_bytes else 0
+        self.entries[key] = (value, size, tuple(names))
+        self.bytes += size
+        for name in names:
+            self.dependents.setdefault(name, set()).add(key)
+        while len(self.entries) > self.max_entries or (
+            self.max_bytes and self.bytes > self.max_bytes and len(self.entries) > 1
+        ):
+            self.remove(next(iter(self.entries)))
+            self.evictions += 1
+
+    def stats(self):
+        """Function to get the cache statistics
+
+        Returns:
+            dict: Hits, misses, evictions, invalidations, hit rate, entries and
+            bytes
+
+        """
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "entries": len(self.entries),
+            "bytes": self.bytes,
+        }
@@ -0,0 +1,309 @@
+from api_accounting import API_COSTS
+from api2 import API2
+from api3 import API3
+from concurrent.futures import ThreadPoolExecutor
+from http.client import HTTPConnection, RemoteDisconnected
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from queue import Queue
+from threading import Thread
+from urllib.parse import urlparse
+import argparse
+import json
+import logging
+import time
+
+
+class StableAPI3(API3):
+    """Class StableAPI3 to serve API3 without the random crashes"""
+
+    @staticmethod
+    def _maybe_crash():
+        """Never crashes, the server must stay up while benchmarking"""
+
+
+class API3RequestHandler(BaseHTTPRequestHandler):
+    """Class API3RequestHandler to expose API3 operations over HTTP
+
+    Routes:
+        POST /create: Body with one object, responds the created object
+        POST /bulk_create: Body with a list of objects, responds the list created
+        GET /objects/<id>: Responds the stored object (or null)
+    """
+
+    # HTTP/1.1 keeps the connections alive between requests
+    protocol_version = "HTTP/1.1"
+
+    def send_json(self, status: int, payload):
+        """Function to send a JSON response
+
+        Args:
+            status (int): The HTTP status code
+            payload: Any JSON serializable object
+
+        """
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        """Function to handle the GET requests"""
+        if not self.path.startswith("/objects/"):
+            self.send_json(404, {"error": f"Unknown path {self.path}"})
+            return
+        self.server.wait(API_COSTS["get"])
+        self.send_json(200, self.server.api.get(self.path[len("/objects/") :]))
+
+    def do_POST(self):
+        """Function to handle the POST requests"""
+        length = int(self.headers.get("Content-Length", 0))
+        data = json.loads(self.rfile.read(length) or b"null")
+        if self.path == "/create":
+            self.server.wait(API_COSTS["create"])
+            self.send_json(200, self.server.api.create(data))
+        elif self.path == "/bulk_create":
+            self.server.wait(API_COSTS["bulk_create"])
+            self.send_json(200, self.server.api.bulk_create(data))
+        else:
+            self.send_json(404, {"error": f"Unknown path {self.path}"})
+
+    def log_message(self, format: str, *args):
+        """Function to silence the default request logging"""
+
+
+class API3Server(ThreadingHTTPServer):
+    """Class API3Server, a local HTTP stand-in for the remote bulk API"""
+
+    daemon_threads = True
+
+    def __init__(self, address: tuple, latency: float = 0, crash: bool = False):
+        """Function to initialize the server
+
+        Args:
+            address (tuple): The (host, port) to listen to (port 0 picks one)
+            latency (float): Seconds injected per singular request
+            crash (bool): Keep the random crashes of API3 (exits the server)
+
+        """
+        super().__init__(address, API3RequestHandler)
+        self.api = API3() if crash else StableAPI3()
+        self.latency = latency
+
+    @property
+    def url(self):
+        """The base URL of the server"""
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def wait(self, cost: int):
+        """Function to simulate the network and processing latency
+
+        Args:
+            cost (int): The cost of the request in singular requests
+
+        """
+        if self.latency:
+            time.sleep(self.latency * cost)
+
+    def start(self):
+        """Function to serve on a background thread
+
+        Returns:
+            self: The running server
+
+        """
+        Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+
+class API3Client:
+    """Class API3Client to call the HTTP API with a keep-alive connection pool
+
+    It has the same interface as API3 (`get`, `create` and `bulk_create`), so
+    it can replace it on the challenge, plus `bulk_create_many` to keep up to
+    `pool_size` bulk requests in flight at the same time.
+    """
+
+    def __init__(self, url: str, pool_size: int = 4, timeout: float = 60):
+        """Function to initialize the client
+
+        Args:
+            url (str): The base URL of the API (e.g. http://127.0.0.1:8000)
+            pool_size (int): The number of persistent connections
+            timeout (float): Seconds to wait for each response
+
+        """
+        parsed = urlparse(url)
+        self.host = parsed.hostname
+        self.port = parsed.port
+        self.timeout = timeout
+        self.pool_size = pool_size
+        self.pool = Queue()
+        for _ in range(pool_size):
+            self.pool.put(HTTPConnection(self.host, self.port, timeout=timeout))
+        self.executor = ThreadPoolExecutor(max_workers=pool_size)
+
+    def request(self, method: str, path: str, payload=None):
+        """Function to make a request using a connection from the pool
+
+        A kept-alive connection closed by the server is reopened and the
+        request is sent once more. Other errors (timeouts included) are
+        raised, the request may have reached the server.
+
+        Args:
+            method (str): The HTTP method
+            path (str): The path of the request
+            payload: Any JSON serializable object for the body
+
+        Returns:
+            The parsed JSON response
+
+        Raises:
+            Exception: If the server responds with an error status
+
+        """
+        body = None if payload is None else json.dumps(payload).encode()
+        headers = {"Content-Type": "application/json"}
+        connection = self.pool.get()
+        try:
+            for attempt in range(2):
+                # A kept-alive connection may have been closed by the server
+                reused = connection.sock is not None
+                try:
+                    connection.request(method, path, body=body, headers=headers)
+                    response = connection.getresponse()
+                    result = response.read()
+                    break
+                except (RemoteDisconnected, BrokenPipeError, ConnectionResetError):
+                    connection.close()
+                    if attempt or not reused:
+                        raise
+                except OSError:
+                    # Timeouts too: the server may still create the objects, so
+                    # the request is never sent again
+                    connection.close()
+                    raise
+            if response.status != 200:
+                raise Exception(f"{method} {path} failed with {response.status}")
+            return json.loads(result)
+        finally:
+            self.pool.put(connection)
+
+    def get(self, obj_id: str):
+        """Get an object."""
+        return self.request("GET", f"/objects/{obj_id}")
+
+    def create(self, data: dict):
+        """Store one new object."""
+        return self.request("POST", "/create", data)
+
+    def bulk_create(self, data: list):
+        """Store multiple objects."""
+        return self.request("POST", "/bulk_create", data)
+
+    def bulk_create_many(self, packages: list):
+        """Function to store many packages with concurrent bulk requests
+
+        Args:
+            packages (list): List of packages (lists of objects)
+
+        Returns:
+            list: The created objects of each package, in the same order
+
+        """
+        return list(self.executor.map(self.bulk_create, packages))
+
+    def close(self):
+        """Function to close all the connections of the pool"""
+        self.executor.shutdown()
+        while not self.pool.empty():
+            self.pool.get().close()
+
+
+class CrashingAPI3Client(API3Client):
+    """Class CrashingAPI3Client, an API3Client that crashes like API3
+
+    The random crash happens on the client process before each create
+    request is sent, as it does when API3 is called in-process.
+    """
+
+    def request(self, method: str, path: str, payload=None):
+        """Function to make a request that may crash the program first"""
+        if method == "POST":
+            API2._maybe_crash()
+        return super().request(method, path, payload)
+
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format="%(name)s: %(levelname)s - %(message)s")
+
+
+def benchmark(products: list, package_size: int, concurrency: list, latency: float):
+    """
+    Function to measure the bulk throughput against a local server
+
+    Args:
+        products (list): The products to send (only the names are used)
+        package_size (int): The number of objects per bulk request
+        concurrency (list): The numbers of in-flight requests to measure
+        latency (float): Seconds injected per singular request
+
+    Returns:
+        results (dict): Objects per second for each concurrency
+
+    """
+    data = [{"name": item["name"], "parent_id": None} for item in products]
+    packages = [
+        data[index : index + package_size]
+        for index in range(0, len(data), package_size)
+    ]
+    results = {}
+    for workers in concurrency:
+        server = API3Server(("127.0.0.1", 0), latency=latency).start()
+        client = API3Client(server.url, pool_size=workers)
+        start = time.perf_counter()
+        created = sum(len(items) for items in client.bulk_create_many(packages))
+        elapsed = time.perf_counter() - start
+        client.close()
+        server.shutdown()
+        results[workers] = created / elapsed
+        logging.info(
+            f"[INFO] Concurrency {workers}: {created} objects in {elapsed:.2f}s "
+            f"({results[workers]:.0f} objects/s)"
+        )
+    return results
+
+
+def main():
+    """
+    Main function to serve the API or run the benchmark
+    """
+    parser = argparse.ArgumentParser(description="HTTP stand-in for API3")
+    parser.add_argument("command", choices=["serve", "benchmark"])
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument(
+        "--latency", type=float, default=0, help="seconds per singular request"
+    )
+    parser.add_argument(
+        "--crash", action="store_true", help="keep the random API3 crashes"
+    )
+    parser.add_argument("--package-size", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 2, 4, 8, 16])
+    options = parser.parse_args()
+
+    if options.command == "serve":
+        server = API3Server(
+            ("127.0.0.1", options.port), latency=options.latency, crash=options.crash
+        )
+        logging.info(f"[INFO] Serving API3 on {server.url}")
+        server.serve_forever()
+    else:
+        with open("product_groups.json", "r") as file:
+            products = json.load(file)
+        benchmark(products, options.package_size, options.concurrency, options.latency)
+
+
+if __name__ == "__main__":
+    main()
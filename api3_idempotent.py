@@ -0,0 +1,92 @@
+from api3 import API3
+from typing import List
+from uuid import uuid4
+import json
+import os
+
+
+class IdempotentAPI3(API3):
+    """Class IdempotentAPI3, a stand-in API3 with idempotent bulk requests
+
+    `bulk_create` accepts a batch token and a source key for each object. A
+    batch sent again with the same token gets the objects created the first
+    time, and an object with a key already stored gets the stored object,
+    so a client can always resend its last batch after a crash instead of
+    keeping a local log of what was created.
+
+    The stored objects, tokens and keys are kept on a journal file (like a
+    remote server, they survive the crashes of the client process). Besides
+    the crash of `API3` before storing, a request may also crash after the
+    objects are stored and before the response (the case the tokens are
+    for).
+    """
+
+    def __init__(self, journal_path: str = "/tmp/api3_idempotent.journal"):
+        """Function to initialize the class
+
+        Args:
+            journal_path (str): The path of the journal (loaded if it exists)
+
+        """
+        super().__init__()
+        self.journal_path = journal_path
+        # Ids of the objects of each token, and the id of each key
+        self._batches = {}
+        self._keys = {}
+        self.load_journal()
+
+    def load_journal(self):
+        """Function to load the objects stored by the previous executions"""
+        if not os.path.exists(self.journal_path):
+            return
+        with open(self.journal_path, "r") as file:
+            for line in file:
+                # A line cut by a crash was never committed
+                if not line.endswith("\n"):
+                    break
+                self.commit(json.loads(line))
+
+    def commit(self, entry: dict):
+        """Function to apply a journal entry to the storage
+
+        Args:
+            entry (dict): The token, the new objects and the ids of the batch
+
+        """
+        for key, obj in entry["created"]:
+            self._storage[obj["id"]] = obj
+            if key is not None:
+                self._keys[key] = obj["id"]
+        if entry["token"] is not None:
+            self._batches[entry["token"]] = entry["ids"]
+
+    def bulk_create(self, data: List[dict], token: str = None, keys: list = None):
+        """Store multiple objects, once for each token and key."""
+        self._maybe_crash()
+        if token is not None and token in self._batches:
+            return [self._storage[identifier] for identifier in self._batches[token]]
+        keys = keys or [None] * len(data)
+        created = []
+        ids = []
+        for obj, key in zip(data, keys):
+            if key is not None and key in self._keys:
+                ids.append(self._keys[key])
+                continue
+            new_obj = {**obj, "id": str(uuid4())}
+            created.append((key, new_obj))
+            ids.append(new_obj["id"])
+        entry = {"token": token, "created": created, "ids": ids}
+        with open(self.journal_path, "a") as file:
+            file.write(json.dumps(entry) + "\n")
+            file.flush()
+            os.fsync(file.fileno())
+        self.commit(entry)
+        # Stored, but the response may never reach the client
+        self._maybe_crash()
+        return [self._storage[identifier] for identifier in ids]
+
+    def get_by_keys(self, keys: list):
+        """Get the objects stored with some source keys."""
+        return {
+            key: self._storage[self._keys[key]] for key in keys if key in self._keys
+        }
@@ -0,0 +1,188 @@
+import json
+import logging
+import os
+import sys
+import threading
+import time
+
+# Cost units of each API call (one bulk request takes as much as 5 singular
+# requests), shared by the API wrappers, the servers and the planner
+API_COSTS = {"get": 1, "create": 1, "bulk_create": 5}
+
+
+class MeteredAPI:
+    """Class MeteredAPI to count the cost units of the calls to an API
+
+    Wraps an `API1`, `API2` or `API3` (or anything with the same methods)
+    and counts the calls, cost units (`API_COSTS`), objects and time
+    of each call type. An optional latency per cost unit is injected before
+    every call, so batching strategies can be compared on what the API owner
+    bills.
+
+    The counters are kept on a state file (if any), so the totals carry
+    across the crashes of the challenge. A call is counted before it is
+    made: a call that crashes the API is billed too. The observers (e.g.
+    `MigrationMetrics.count_call`) are called after every completed call, so
+    the calls are metered by a single wrapper.
+    """
+
+    STATE_PATH = "/tmp/api_costs.json"
+
+    def __init__(
+        self,
+        api,
+        latency: float = 0.0,
+        state_path: str = STATE_PATH,
+        costs: dict = None,
+    ):
+        """Function to initialize the class
+
+        Args:
+            api: The API to wrap
+            latency (float): Seconds injected per cost unit of each call
+            state_path (str): The path of the state file (None to keep the
+            counters only in memory)
+            costs (dict): The cost units of each call type (default API_COSTS)
+
+        """
+        self.api = api
+        self.latency = latency
+        self.state_path = state_path
+        self.costs = costs or API_COSTS
+        self.state = {}
+        # Functions called with (name, cost units, objects) after each call
+        self.observers = []
+        # The concurrent bulk requests count and save the state one at a time
+        self.lock = threading.Lock()
+        self.load_state()
+
+    def __getattr__(self, name: str):
+        """Function to reach the attributes of the API that aren't metered"""
+        return getattr(self.api, name)
+
+    def load_state(self):
+        """Function to load the counters of the previous executions"""
+        if self.state_path and os.path.exists(self.state_path):
+            with open(self.state_path, "r") as file:
+                self.state = json.load(file)
+
+    def save_state(self):
+        """Function to write the counters (atomically) to the state file"""
+        if not self.state_path:
+            return
+        temporary = self.state_path + ".tmp"
+        with open(temporary, "w") as file:
+            json.dump(self.state, file)
+        os.replace(temporary, self.state_path)
+
+    def call(self, name: str, *args, **kwargs):
+        """Function to count and make a call to the API
+
+        Args:
+            name (str): The name of the API method
+            *args: The arguments of the method
+            **kwargs: The keyword arguments of the method (e.g. a batch token)
+
+        Returns:
+            The result of the API method
+
+        """
+        cost = self.costs[name]
+        objects = len(args[0]) if name == "bulk_create" else 1
+        with self.lock:
+            counters = self.state.setdefault(
+                name, {"calls": 0, "cost_units": 0, "objects": 0, "seconds": 0.0}
+            )
+            counters["calls"] += 1
+            counters["cost_units"] += cost
+            counters["objects"] += objects
+            self.save_state()
+        start = time.perf_counter()
+        if self.latency:
+            time.sleep(self.latency * cost)
+        result = getattr(self.api, name)(*args, **kwargs)
+        with self.lock:
+            counters["seconds"] += time.perf_counter() - start
+            self.save_state()
+            self.notify(name, objects)
+        return result
+
+    def notify(self, name: str, objects: int):
+        """Function to tell the observers about a completed call
+
+        Args:
+            name (str): The name of the API method
+            objects (int): The objects of the call
+
+        """
+        for observer in self.observers:
+            observer(name, self.costs[name], objects)
+
+    def get(self, obj_id: str):
+        """Get an object."""
+        return self.call("get", obj_id)
+
+    def create(self, data: dict):
+        """Store one new object."""
+        return self.call("create", data)
+
+    def bulk_create(self, data: list, **kwargs):
+        """Store multiple objects."""
+        return self.call("bulk_create", data, **kwargs)
+
+    def bulk_create_many(self, packages: list):
+        """Store many packages with concurrent bulk requests (see api3_http.py)
+
+        Each package goes through `bulk_create` (and the wrappers of the
+        challenge on it, e.g. the profiler), so it is counted and delayed as
+        a bulk request of its own. The requests are made on the executor of
+        the API, so they are still in flight together.
+        """
+        executor = getattr(self.api, "executor", None)
+        if executor is None:
+            return [self.bulk_create(package) for package in packages]
+        return list(executor.map(self.bulk_create, packages))
+
+    def report(self):
+        """Function to get the counters of each call type and the totals
+
+        Returns:
+            report (dict): Calls, cost units, objects and seconds of each call
+            type, and of all of them on "total"
+
+        """
+        report = {name: dict(counters) for name, counters in self.state.items()}
+        total = {"calls": 0, "cost_units": 0, "objects": 0, "seconds": 0.0}
+        for counters in report.values():
+            for key in total:
+                total[key] += counters[key]
+        report["total"] = total
+        return report
+
+    def log_report(self):
+        """Function to log the report, with the cost units per object"""
+        report = self.report()
+        for name, counters in report.items():
+            per_object = (
+                counters["cost_units"] / counters["objects"]
+                if counters["objects"]
+                else 0.0
+            )
+            logging.info(
+                f"[INFO] API {name}: {counters['calls']} calls, "
+                f"{counters['cost_units']} cost units, {counters['objects']} "
+                f"objects ({per_object:.4f} units/object), "
+                f"{counters['seconds']:.3f}s"
+            )
+
+
+if __name__ == "__main__":
+    # Report of the state file of a migration (default /tmp/api_costs.json)
+    logging.basicConfig(
+        level=logging.INFO, format="%(name)s: %(levelname)s - %(message)s"
+    )
+    path = sys.argv[1] if len(sys.argv) > 1 else MeteredAPI.STATE_PATH
+    if not os.path.exists(path):
+        logging.error(f"[ERROR] {path} not found")
+        sys.exit(1)
+    MeteredAPI(None, state_path=path).log_report()
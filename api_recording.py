@@ -0,0 +1,342 @@
+from uuid import UUID, uuid5
+import argparse
+import json
+import logging
+import os
+import threading
+
+
+class RecordingAPI:
+    """Class RecordingAPI to record the calls to an API, crashes included
+
+    Every call is written to the recording (a JSON lines file) before it is
+    made, with the method and the number and bytes of the objects, and the
+    ids returned by the API are written after it. A call without ids is a
+    call that crashed the API. The recording is appended across the
+    restarts of the challenge, so it has the whole crash schedule of the
+    migration.
+    """
+
+    def __init__(self, api, path: str = "/tmp/api_recording.jsonl"):
+        """Function to initialize the class
+
+        Args:
+            api: The API to record
+            path (str): The path of the recording (appended)
+
+        """
+        self.api = api
+        self.path = path
+        # The calls of the previous executions
+        self.calls = len(read_recording(path)) if os.path.exists(path) else 0
+        # The concurrent bulk requests take their numbers one at a time
+        self.lock = threading.Lock()
+
+    def __getattr__(self, name: str):
+        """Function to reach the attributes of the API that aren't recorded"""
+        return getattr(self.api, name)
+
+    def write(self, line: dict):
+        """Function to append a line to the recording (flushed, the next
+        statement may be a crash)
+
+        Args:
+            line (dict): The line
+
+        """
+        with open(self.path, "a") as file:
+            file.write(json.dumps(line) + "\n")
+            file.flush()
+            os.fsync(file.fileno())
+
+    def start(self, name: str, data):
+        """Function to number a call and record it before it is made
+
+        Args:
+            name (str): The name of the API method
+            data: The object (create) or the objects (bulk_create)
+
+        Returns:
+            number (int): The number of the call
+
+        """
+        objects = data if name == "bulk_create" else [data]
+        with self.lock:
+            number = self.calls
+            self.calls += 1
+            self.write(
+                {
+                    "call": number,
+                    "method": name,
+                    "size": len(objects),
+                    "bytes": len(json.dumps(data)),
+                }
+            )
+        return number
+
+    def finish(self, number: int, name: str, result):
+        """Function to record the ids returned by a call
+
+        Args:
+            number (int): The number of the call
+            name (str): The name of the API method
+            result: The object (create) or the objects (bulk_create) returned
+
+        """
+        created = result if name == "bulk_create" else [result]
+        with self.lock:
+            self.write({"call": number, "ids": [obj["id"] for obj in created]})
+
+    def call(self, name: str, data, **kwargs):
+        """Function to record and make a call to the API
+
+        Args:
+            name (str): The name of the API method
+            data: The object (create) or the objects (bulk_create)
+            **kwargs: The keyword arguments of the method (e.g. a batch token)
+
+        Returns:
+            The result of the API method
+
+        """
+        number = self.start(name, data)
+        result = getattr(self.api, name)(data, **kwargs)
+        self.finish(number, name, result)
+        return result
+
+    def create(self, data: dict):
+        """Store one new object."""
+        return self.call("create", data)
+
+    def bulk_create(self, data: list, **kwargs):
+        """Store multiple objects."""
+        return self.call("bulk_create", data, **kwargs)
+
+    def bulk_create_many(self, packages: list):
+        """Store many packages with the concurrent requests of the API
+
+        The packages are recorded as one bulk request each, numbered in
+        package order. A failed group has no ids on any of its calls (the
+        requests were in flight together).
+        """
+        numbers = [self.start("bulk_create", package) for package in packages]
+        results = self.api.bulk_create_many(packages)
+        for number, result in zip(numbers, results):
+            self.finish(number, "bulk_create", result)
+        return results
+
+
+class ReplayAPI:
+    """Class ReplayAPI to replay a recording instead of calling the API
+
+    The n-th call of the migration gets the result of the n-th call of the
+    recording: the same crash (the process exits with signal 0, like
+    `API2._maybe_crash`) or the same ids. The position on the recording is
+    kept on a cursor file, so the restarts continue the schedule. Calls
+    beyond the recording never crash and get deterministic ids.
+
+    A migration that calls the API in a different way (other batch sizes)
+    still follows the crash schedule by call number, the differences are
+    counted and logged.
+    """
+
+    # Namespace of the ids of the calls beyond the recording
+    NAMESPACE = UUID("6f1c5a3e-2b7d-4d8e-9a1f-3c5e7b9d1f20")
+
+    def __init__(self, path: str, cursor_path: str = "/tmp/api_replay.cursor"):
+        """Function to initialize the class
+
+        Args:
+            path (str): The path of the recording
+            cursor_path (str): The path of the cursor file
+
+        """
+        self.path = path
+        self.cursor_path = cursor_path
+        self.recording = read_recording(path)
+        self.cursor = {"call": 0, "mismatches": 0}
+        if os.path.exists(cursor_path):
+            with open(cursor_path, "r") as file:
+                self.cursor = json.load(file)
+        self._storage = {}
+
+    def save_cursor(self):
+        """Function to write the cursor (atomically)"""
+        temporary = self.cursor_path + ".tmp"
+        with open(temporary, "w") as file:
+            json.dump(self.cursor, file)
+        os.replace(temporary, self.cursor_path)
+
+    def ids(self, number: int, size: int):
+        """Function to get the ids of a call
+
+        Args:
+            number (int): The number of the call
+            size (int): The number of objects
+
+        Returns:
+            ids (list): The recorded ids, completed with deterministic ids
+
+        """
+        recorded = []
+        if number < len(self.recording):
+            recorded = self.recording[number]["ids"] or []
+        return recorded[:size] + [
+            str(uuid5(self.NAMESPACE, f"{number}:{position}"))
+            for position in range(len(recorded), size)
+        ]
+
+    def take(self, name: str, objects: list):
+        """Function to move the cursor to the next call of the recording
+
+        Args:
+            name (str): The name of the API method
+            objects (list): The objects to create
+
+        Returns:
+            tuple: The number of the call and its entry on the recording (None
+            if beyond the recording)
+
+        """
+        number = self.cursor["call"]
+        entry = self.recording[number] if number < len(self.recording) else None
+        if entry and (entry["method"], entry["size"]) != (name, len(objects)):
+            if not self.cursor["mismatches"]:
+                logging.warning(
+                    f"[WARNING] Call {number} differs from the recording: "
+                    f"{name}({len(objects)}), recorded "
+                    f"{entry['method']}({entry['size']})"
+                )
+            self.cursor["mismatches"] += 1
+        self.cursor["call"] += 1
+        return number, entry
+
+    def created(self, number: int, objects: list):
+        """Function to get the objects created by a call
+
+        Args:
+            number (int): The number of the call
+            objects (list): The objects to create
+
+        Returns:
+            created (list): The objects with the ids of the recording
+
+        """
+        created = [
+            {**data, "id": identifier}
+            for data, identifier in zip(objects, self.ids(number, len(objects)))
+        ]
+        self._storage.update({obj["id"]: obj for obj in created})
+        return created
+
+    def call(self, name: str, objects: list):
+        """Function to replay the next call of the recording
+
+        Args:
+            name (str): The name of the API method
+            objects (list): The objects to create
+
+        Returns:
+            created (list): The objects with the ids of the recording
+
+        """
+        number, entry = self.take(name, objects)
+        self.save_cursor()
+        # Same crash as the recording
+        if entry and entry["ids"] is None:
+            os._exit(0)
+        return self.created(number, objects)
+
+    def get(self, obj_id: str):
+        """Get an object."""
+        return self._storage.get(obj_id)
+
+    def create(self, data: dict):
+        """Store one new object."""
+        return self.call("create", [data])[0]
+
+    def bulk_create(self, data: list):
+        """Store multiple objects."""
+        return self.call("bulk_create", data)
+
+    def bulk_create_many(self, packages: list):
+        """Store many packages, replayed as concurrent bulk requests
+
+        The calls of all the packages are replayed together: a crash recorded
+        on any of them loses the whole group once, like the requests in
+        flight together of the recorded run.
+        """
+        calls = [self.take("bulk_create", package) for package in packages]
+        self.save_cursor()
+        if any(entry and entry["ids"] is None for _, entry in calls):
+            os._exit(0)
+        return [
+            self.created(number, package)
+            for (number, _), package in zip(calls, packages)
+        ]
+
+    def summary(self):
+        """Function to get the position on the recording
+
+        Returns:
+            dict: Calls replayed, calls recorded, crashes recorded and calls
+            different from the recording
+
+        """
+        return {
+            "calls": self.cursor["call"],
+            "recorded": len(self.recording),
+            "crashes": sum(1 for entry in self.recording if entry["ids"] is None),
+            "mismatches": self.cursor["mismatches"],
+        }
+
+
+def read_recording(path: str):
+    """
+    Function to read the calls of a recording
+
+    Args:
+        path (str): The path of the recording
+
+    Returns:
+        calls (list): For each call the method, size, bytes and ids (None if
+        the call crashed)
+
+    """
+    calls = []
+    with open(path, "r") as file:
+        for line in file:
+            if not line.endswith("\n"):
+                # Cut by a crash while writing, the call was never made
+                break
+            record = json.loads(line)
+            if "ids" in record:
+                calls[record["call"]]["ids"] = record["ids"]
+            else:
+                calls.append({**record, "ids": None})
+    return calls
+
+
+def reset_recording(argv: list):
+    """
+    Function to start a new recording or replay for the options of a runner
+
+    Only the recording of `--record` is removed (a `--replay` recording is
+    kept) and the replay restarts from the first call.
+
+    Args:
+        argv (list): The command line arguments forwarded to the challenge
+
+    """
+    parser = argparse.ArgumentParser(add_help=False)
+    parser.add_argument("--record", nargs="?", const="/tmp/api_recording.jsonl")
+    parser.add_argument("--replay")
+    options, _ = parser.parse_known_args(argv)
+    paths = []
+    if options.replay:
+        paths.append("/tmp/api_replay.cursor")
+    elif options.record:
+        paths.append(options.record)
+    for path in paths:
+        if os.path.exists(path):
+            os.remove(path)
@@ -0,0 +1,366 @@
+from abc import ABC, abstractmethod
+from api_accounting import API_COSTS
+from api3 import API3
+from urllib.parse import urlparse
+import asyncio
+import json
+import logging
+
+
+class AsyncAPI(ABC):
+    """Class AsyncAPI, the interface of the APIs of the async engine
+
+    The same operations as API3 (`create` and `bulk_create`) as coroutines,
+    so a single process can keep many requests in flight, plus `close` to
+    release the connections at the end of the migration.
+    """
+
+    @abstractmethod
+    async def create(self, data: dict):
+        """Store one new object."""
+
+    @abstractmethod
+    async def bulk_create(self, data: list):
+        """Store multiple objects."""
+
+    async def close(self):
+        """Function to release the resources of the API"""
+
+
+class AsyncAPI3(AsyncAPI):
+    """Class AsyncAPI3 to use a local (synchronous) API from the async engine
+
+    The calls are made on the event loop, so the random crashes of API3 stop
+    the process as usual. The latency of a remote API can be injected: it is
+    awaited per cost unit of the call (see api_accounting.API_COSTS), so the
+    requests in flight wait together instead of one after the other.
+    """
+
+    def __init__(self, api=None, latency: float = 0.0):
+        """Function to initialize the class
+
+        Args:
+            api: The synchronous API (e.g. wrapped by MeteredAPI), default API3
+            latency (float): Seconds awaited per singular request
+
+        """
+        self.api = api or API3()
+        self.latency = latency
+
+    async def wait(self, cost: int):
+        """Function to simulate the latency of a request
+
+        Args:
+            cost (int): The cost of the request in singular requests
+
+        """
+        if self.latency:
+            await asyncio.sleep(self.latency * cost)
+
+    async def create(self, data: dict):
+        """Store one new object."""
+        await self.wait(API_COSTS["create"])
+        return self.api.create(data)
+
+    async def bulk_create(self, data: list):
+        """Store multiple objects."""
+        await self.wait(API_COSTS["bulk_create"])
+        return self.api.bulk_create(data)
+
+
+class AsyncAPI3Client(AsyncAPI):
+    """Class AsyncAPI3Client to call the HTTP API (api3_http.py) with asyncio
+
+    Up to `pool_size` keep-alive connections are opened on demand and each
+    request takes one of them, so there are never more requests in flight
+    than connections. Like API3Client, a kept-alive connection closed by the
+    server is reopened and the request is sent once more, other errors
+    (timeouts included) are raised.
+    """
+
+    def __init__(self, url: str, pool_size: int = 8, timeout: float = 60):
+        """Function to initialize the client
+
+        Args:
+            url (str): The base URL of the API (e.g. http://127.0.0.1:8000)
+            pool_size (int): The maximum number of connections
+            timeout (float): Seconds to wait for each response
+
+        """
+        parsed = urlparse(url)
+        self.host = parsed.hostname
+        self.port = parsed.port
+        self.pool_size = pool_size
+        self.timeout = timeout
+        # Created on the event loop of the first request
+        self.pool = None
+
+    async def read_response(self, reader: asyncio.StreamReader):
+        """Function to read an HTTP response
+
+        Args:
+            reader (asyncio.StreamReader): The reader of the connection
+
+        Returns:
+            tuple: The status code and the body
+
+        """
+        status = int((await reader.readuntil(b"\r\n")).split()[1])
+        length = 0
+        while True:
+            line = await reader.readuntil(b"\r\n")
+            if line == b"\r\n":
+                break
+            name, _, value = line.decode().partition(":")
+            if name.strip().lower() == "content-length":
+                length = int(value)
+        return status, await reader.readexactly(length)
+
+    async def request(self, method: str, path: str, payload=None):
+        """Function to make a request using a connection from the pool
+
+        Args:
+            method (str): The HTTP method
+            path (str): The path of the request
+            payload: Any JSON serializable object for the body
+
+        Returns:
+            The parsed JSON response
+
+        Raises:
+            Exception: If the server responds with an error status
+
+        """
+        if self.pool is None:
+            self.pool = asyncio.Queue()
+            for _ in range(self.pool_size):
+                self.pool.put_nowait(None)
+        body = b"" if payload is None else json.dumps(payload).encode()
+        head = (
+            f"{method} {path} HTTP/1.1\r\n"
+            f"Host: {self.host}:{self.port}\r\n"
+            "Content-Type: application/json\r\n"
+            f"Content-Length: {len(body)}\r\n\r\n"
+        )
+        connection = await self.pool.get()
+        try:
+            for attempt in range(2):
+                # A kept-alive connection may have been closed by the server
+                reused = connection is not None
+                try:
+                    if connection is None:
+                        connection = await asyncio.open_connection(self.host, self.port)
+                    reader, writer = connection
+                    writer.write(head.encode() + body)
+                    await writer.drain()
+                    status, result = await asyncio.wait_for(
+                        self.read_response(reader), self.timeout
+                    )
+                    break
+                except (
+                    BrokenPipeError,
+                    ConnectionResetError,
+                    asyncio.IncompleteReadError,
+                ):
+                    if connection is not None:
+                        connection[1].close()
+                        connection = None
+                    if attempt or not reused:
+                        raise
+                except (OSError, asyncio.TimeoutError):
+                    # Timeouts too: the server may still create the objects, so
+                    # the request is never sent again
+                    if connection is not None:
+                        connection[1].close()
+                        connection = None
+                    raise
+            if status != 200:
+                raise Exception(f"{method} {path} failed with {status}")
+            return json.loads(result)
+        finally:
+            self.pool.put_nowait(connection)
+
+    async def create(self, data: dict):
+        """Store one new object."""
+        return await self.request("POST", "/create", data)
+
+    async def bulk_create(self, data: list):
+        """Store multiple objects."""
+        return await self.request("POST", "/bulk_create", data)
+
+    async def close(self):
+        """Function to close all the connections of the pool"""
+        while self.pool is not None and not self.pool.empty():
+            connection = self.pool.get_nowait()
+            if connection is not None:
+                connection[1].close()
+                await connection[1].wait_closed()
+
+
+class AsyncMigration:
+    """Class AsyncMigration to create the products with asyncio
+
+    The products are created level by level (roots first), like the bounded
+    memory mode, with up to the limit of the level of bulk requests in
+    flight. Each response is appended to the object log (then the counter)
+    as soon as it arrives, on the event loop, before any other request can
+    run (and crash the process), so no created object is lost. The log has
+    the source id of every object, a restart skips the products already on
+    it whatever the order they were answered in. A level is released only
+    after every request of the level above it was written, so the parents
+    of its products are always on the log.
+    """
+
+    def __init__(self, challenge, api: AsyncAPI, limits: list = None):
+        """Function to initialize the class
+
+        Args:
+            challenge: The challenge3.Challenge (object log, ID_MAP, packages)
+            api (AsyncAPI): The API to call
+            limits (list): The bulk requests in flight on each level, the last
+            one for all the deeper levels (default 8)
+
+        """
+        self.challenge = challenge
+        self.api = api
+        self.limits = limits or [8]
+        # Products created and checkpointed
+        self.position = 0
+
+    def limit(self, depth: int):
+        """Function to get the bulk requests in flight of a level
+
+        Args:
+            depth (int): The depth of the level
+
+        Returns:
+            int: The limit of the level (at least 1)
+
+        """
+        return max(1, self.limits[min(depth, len(self.limits) - 1)])
+
+    def remaining(self, products: list):
+        """Function to get the products that aren't on the object log yet
+
+        Args:
+            products (list): The products ordered by depth
+
+        Returns:
+            remaining (list): The products not created, in the same order
+
+        """
+        created = {}
+        for source_id, _ in self.challenge.object_log:
+            created[source_id] = created.get(source_id, 0) + 1
+        remaining = []
+        for product in products:
+            # Duplicated products are created once each
+            if created.get(product["id"]):
+                created[product["id"]] -= 1
+            else:
+                remaining.append(product)
+        return remaining
+
+    def checkpoint(self, package: list, response: list, pending: dict):
+        """Function to write the objects of a package to the backup files
+
+        Args:
+            package (list): The source products of the package
+            response (list): The objects returned by the API (same order)
+            pending (dict): Number of pending children of each parent id
+
+        Raises:
+            Exception: If the objects couldn't be appended to the object log
+
+        """
+        created = [(item["id"], obj) for item, obj in zip(package, response)]
+        # Saves the objects into the log before moving the counter
+        if not self.challenge.object_log.append(created):
+            raise Exception("Couldn't append the objects to the log")
+        self.position += len(package)
+        self.challenge.save_last_execution(self.position)
+        self.challenge.register_created(package, response, pending)
+        logging.info(f"[INFO] Objects created: {len(package)}")
+        logging.info(f"[INFO] Storage size: {self.position}")
+
+    async def send(self, package: list, data: list, pending: dict):
+        """Function to create a package and checkpoint it as soon as it is answered
+
+        Args:
+            package (list): The source products of the package
+            data (list): The package on the new API format
+            pending (dict): Number of pending children of each parent id
+
+        """
+        response = await self.api.bulk_create(data)
+        # No await between the response and the checkpoint
+        self.checkpoint(package, response, pending)
+
+    async def wait(self, in_flight: set, keep: int = 0):
+        """Function to wait for requests until at most `keep` are in flight
+
+        Args:
+            in_flight (set): The tasks of the requests in flight
+            keep (int): The requests left in flight
+
+        Raises:
+            Exception: If a request or a checkpoint failed
+
+        """
+        while len(in_flight) > keep:
+            done, _ = await asyncio.wait(in_flight, return_when=asyncio.FIRST_COMPLETED)
+            in_flight -= done
+            for task in done:
+                task.result()
+
+    async def save_products(self, product_base: list):
+        """Function to save all products, many bulk requests in flight
+
+        Args:
+            product_base (list): The list of all products
+
+        Raises:
+            Exception: If a request or a checkpoint failed
+            Exception: If the quantity of products stored isn't the same a the
+            quantity of all products
+
+        """
+        challenge = self.challenge
+        # The packages are built one at a time, the tasks keep them in flight
+        challenge.CONCURRENCY = 1
+        size_all_products = len(product_base)
+        index = {product["id"]: product for product in product_base}
+        depths = challenge.get_depths(index)
+        # The object log is the source of truth of what was already saved
+        products = self.remaining(challenge.order_by_depth(product_base, depths))
+        self.position = size_all_products - len(products)
+        pending = challenge.count_pending_children(products)
+        challenge.load_id_map(pending)
+
+        in_flight = set()
+        position = 0
+        level = None
+        try:
+            while position < len(products):
+                depth = depths[products[position]["id"]]
+                # The parents of the next level must be on the log first
+                if depth != level:
+                    await self.wait(in_flight)
+                    level = depth
+                [(package, data)] = challenge.next_packages(
+                    products, depths, position, index
+                )
+                in_flight.add(asyncio.ensure_future(self.send(package, data, pending)))
+                position += len(package)
+                await self.wait(in_flight, self.limit(depth) - 1)
+            await self.wait(in_flight)
+        finally:
+            for task in in_flight:
+                task.cancel()
+            await self.api.close()
+
+        if size_all_products != challenge.object_log.count():
+            raise Exception(
+                f"Missing objects: Expected {size_all_products} "
+                f"- Stored: {challenge.object_log.count()}"
+            )
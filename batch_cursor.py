@@ -0,0 +1,55 @@
+class BatchCursor:
+    """Class BatchCursor to walk a list of products in batches by position
+
+    The list is never sliced nor changed: a batch is a range of positions
+    from the cursor, and the cursor only moves forward by the number of
+    products actually sent. Walking the whole list costs O(N), and the
+    cursor can start at any position (e.g. the checkpoint of a crashed
+    execution).
+    """
+
+    def __init__(self, products: list, position: int = 0):
+        """Function to initialize the class
+
+        Args:
+            products (list): The products to walk (not changed)
+            position (int): The position of the first product to send
+
+        """
+        self.products = products
+        self.position = min(max(position, 0), len(products))
+
+    def __len__(self):
+        """Function to get the number of products still to send"""
+        return len(self.products) - self.position
+
+    def __bool__(self):
+        """Function to check if there are products still to send"""
+        return self.position < len(self.products)
+
+    def peek(self, size: int):
+        """Function to iterate the next products without moving the cursor
+
+        Args:
+            size (int): The maximum number of products
+
+        Returns:
+            iterator: Up to `size` products from the cursor
+
+        """
+        # Indexed access, islice() would walk the list from the start
+        stop = min(self.position + size, len(self.products))
+        return (self.products[index] for index in range(self.position, stop))
+
+    def advance(self, count: int):
+        """Function to move the cursor after the products that were sent
+
+        Args:
+            count (int): The number of products sent
+
+        Returns:
+            position (int): The new position of the cursor
+
+        """
+        self.position = min(self.position + count, len(self.products))
+        return self.position
@@ -0,0 +1,274 @@
+from challenge3 import Challenge
+import argparse
+import gc
+import json
+import logging
+import math
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format="%(name)s: %(levelname)s - %(message)s")
+
+
+class Benchmark:
+    """Class Benchmark to time the hot functions of the Challenge class
+
+    Every function runs on samples of the catalog of several sizes (the
+    first products ordered by depth, so the parents of a sample are always
+    on it). The best time of each size is kept, with the growth exponent
+    between sizes (1 is linear, 2 is quadratic), and compared against a
+    JSON baseline.
+    """
+
+    FUNCTIONS = [
+        "remove_duplicates",
+        "get_ancestors",
+        "filter_products",
+        "transform_package",
+        "save_objects",
+        "get_saved_objects",
+    ]
+    # Number of products to search the ancestors of, on each size
+    ANCESTOR_LOOKUPS = 20
+
+    def __init__(
+        self, catalog: str = "product_groups.json", sizes: list = None, repeat: int = 5
+    ):
+        """Function to initialize the class
+
+        Args:
+            catalog (str): The catalog to sample the products from
+            sizes (list): The number of products of each sample
+            repeat (int): Times each function runs (the best time is kept)
+
+        """
+        self.challenge = Challenge(bounded_memory=True)
+        self.products = self.challenge.get_products(catalog)
+        self.sizes = sizes or [500, 2000, 8000]
+        self.repeat = repeat
+        index = {product["id"]: product for product in self.products}
+        self.depths = self.challenge.get_depths(index)
+        self.products = self.challenge.order_by_depth(self.products, self.depths)
+
+    def sample(self, size: int):
+        """Function to get the first products (by depth) and their objects
+
+        Args:
+            size (int): The number of products
+
+        Returns:
+            products (list): Copies of the products
+            objects (list): The objects the API would create for them
+
+        """
+        products = [dict(product) for product in self.products[:size]]
+        objects = [
+            {
+                "name": product["name"],
+                "parent_id": None,
+                "ancestors": None,
+                "id": f"{position:032x}",
+            }
+            for position, product in enumerate(products)
+        ]
+        return products, objects
+
+    def cases(self, size: int, directory: str):
+        """Function to prepare the call of each function for a sample size
+
+        Args:
+            size (int): The number of products
+            directory (str): A directory for the backup files
+
+        Returns:
+            cases (dict): A function without arguments for each name
+
+        """
+        challenge = self.challenge
+        products, objects = self.sample(size)
+        # The deepest products of the sample have the longest chains
+        deepest = products[-self.ANCESTOR_LOOKUPS :]
+        index = {product["id"]: product for product in products}
+        package = [
+            {**product, "ancestors": challenge.get_ancestor_names(index, product)}
+            for product in products
+        ]
+        challenge.OBJECTS_PATH = os.path.join(directory, f"objects.{size}.bkp")
+
+        def get_ancestors():
+            for product in deepest:
+                challenge.get_ancestors(products, product)
+
+        def save_objects():
+            challenge.SAVED_OBJECTS = objects
+            challenge.save_objects()
+
+        def get_saved_objects():
+            challenge.SAVED_OBJECTS = objects
+            challenge.get_saved_objects()
+
+        # The backup file read by get_saved_objects()
+        save_objects()
+        return {
+            "remove_duplicates": lambda: challenge.remove_duplicates(products),
+            "get_ancestors": get_ancestors,
+            "filter_products": lambda: challenge.filter_products(products),
+            "transform_package": lambda: challenge.transform_package(package),
+            "save_objects": save_objects,
+            "get_saved_objects": get_saved_objects,
+        }
+
+    def measure(self, function):
+        """Function to get the best time of a function
+
+        Args:
+            function: The function to call
+
+        Returns:
+            float: The best time in seconds
+
+        """
+        best = math.inf
+        # Like timeit, the garbage collector doesn't run while timing
+        enabled = gc.isenabled()
+        gc.disable()
+        try:
+            for _ in range(self.repeat):
+                start = time.perf_counter()
+                function()
+                best = min(best, time.perf_counter() - start)
+        finally:
+            if enabled:
+                gc.enable()
+        return best
+
+    def run(self, functions: list = None):
+        """Function to time the functions on every sample size
+
+        Args:
+            functions (list): The names of the functions (default FUNCTIONS)
+
+        Returns:
+            results (dict): For each function the seconds of each size and the
+            growth exponent between the smallest and the biggest size
+
+        """
+        functions = functions or self.FUNCTIONS
+        results = {name: {"seconds": {}} for name in functions}
+        directory = tempfile.mkdtemp(prefix="benchmarks.")
+        try:
+            for size in self.sizes:
+                cases = self.cases(size, directory)
+                for name in functions:
+                    seconds = self.measure(cases[name])
+                    results[name]["seconds"][str(size)] = seconds
+                    logging.info(f"[INFO] {name}({size}): {seconds:.6f}s")
+        finally:
+            shutil.rmtree(directory, ignore_errors=True)
+            self.challenge.SAVED_OBJECTS = []
+        smallest, biggest = min(self.sizes), max(self.sizes)
+        for name in functions:
+            seconds = results[name]["seconds"]
+            growth = None
+            if biggest > smallest and seconds[str(smallest)] > 0:
+                growth = math.log(
+                    seconds[str(biggest)] / seconds[str(smallest)]
+                ) / math.log(biggest / smallest)
+            results[name]["growth"] = growth
+        return results
+
+
+def compare(results: dict, baseline: dict, threshold: float, floor: float = 0.001):
+    """
+    Function to find the regressions of some results against a baseline
+
+    A time is a regression if it is more than `threshold` (e.g. 0.5 is 50%)
+    slower than the baseline, and the growth exponent if it is more than
+    `threshold` higher (e.g. from linear to quadratic). Times below `floor`
+    seconds on both sides are only noise and are not compared.
+
+    Args:
+        results (dict): The results of Benchmark.run()
+        baseline (dict): The results of the baseline
+        threshold (float): The tolerated slow down
+        floor (float): The smallest time compared
+
+    Returns:
+        regressions (list): A message for each regression
+
+    """
+    regressions = []
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        for size, seconds in result["seconds"].items():
+            before = baseline[name]["seconds"].get(size)
+            if before is None or max(before, seconds) < floor:
+                continue
+            if seconds > before * (1 + threshold):
+                regressions.append(
+                    f"{name}({size}): {seconds:.6f}s, baseline {before:.6f}s"
+                )
+        growth, before = result["growth"], baseline[name].get("growth")
+        if growth is not None and before is not None and growth > before + threshold:
+            regressions.append(f"{name}: growth {growth:.2f}, baseline {before:.2f}")
+    return regressions
+
+
+def main():
+    """
+    Main function to run the benchmarks and compare them with the baseline
+
+    Returns:
+        bool: True if there are no regressions, otherwise False
+
+    """
+    parser = argparse.ArgumentParser(description="Challenge micro-benchmarks")
+    parser.add_argument("--catalog", default="product_groups.json")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[500, 2000, 8000])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument(
+        "--functions", nargs="+", choices=Benchmark.FUNCTIONS, help="(default all)"
+    )
+    parser.add_argument("--baseline", default="benchmarks.baseline.json")
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.5,
+        help="tolerated slow down, 0.5 is 50%% (default)",
+    )
+    parser.add_argument(
+        "--update", action="store_true", help="write the results as the new baseline"
+    )
+    options = parser.parse_args()
+
+    benchmark = Benchmark(options.catalog, options.sizes, options.repeat)
+    results = benchmark.run(options.functions)
+    for name, result in results.items():
+        if result["growth"] is not None:
+            logging.info(f"[INFO] {name} growth: {result['growth']:.2f}")
+
+    if options.update:
+        with open(options.baseline, "w") as file:
+            json.dump(results, file, indent=4)
+        logging.info(f"[INFO] Baseline written to {options.baseline}")
+        return True
+    if not os.path.exists(options.baseline):
+        logging.error(f"[ERROR] Baseline {options.baseline} not found, use --update")
+        return False
+    with open(options.baseline, "r") as file:
+        baseline = json.load(file)
+    regressions = compare(results, baseline, options.threshold)
+    for regression in regressions:
+        logging.error(f"[ERROR] Regression: {regression}")
+    if not regressions:
+        logging.info("[INFO] No regressions against the baseline")
+    return not regressions
+
+
+if __name__ == "__main__":
+    sys.exit(0 if main() else 1)
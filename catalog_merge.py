@@ -0,0 +1,180 @@
+from jsonl_reader import read_catalog
+import argparse
+import hashlib
+import json
+import logging
+import sys
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format="%(name)s: %(levelname)s - %(message)s")
+
+
+class CatalogMerger:
+    """Class CatalogMerger to merge catalogs by the path of each group
+
+    The key of a group is a hash of its full path (the names from the root
+    to the group), chained from the hash of its parent, so every key takes
+    one hash no matter the depth. The groups of all catalogs are joined by
+    that key in one pass: the same path ("oil/olive oil") is one group of
+    the merged catalog, whatever its ids on the source catalogs (and the
+    duplicated records of a catalog are collapsed too).
+    """
+
+    def __init__(self, normalize: bool = False):
+        """Function to initialize the class
+
+        Args:
+            normalize (bool): Compare the names ignoring case and extra spaces
+
+        """
+        self.normalize = normalize
+        # Merged id of each path hash, and the merged groups
+        self.keys = {}
+        self.groups = []
+        # Merged id of each (catalog, source id)
+        self.mapping = {}
+        self.records = 0
+
+    def path_hash(self, parent_hash: bytes, name: str):
+        """Function to get the path hash of a group
+
+        Args:
+            parent_hash (bytes): The path hash of the parent (b"" for roots)
+            name (str): The name of the group
+
+        Returns:
+            bytes: The path hash
+
+        """
+        if self.normalize:
+            name = " ".join(name.split()).casefold()
+        return hashlib.blake2b(
+            parent_hash + b"\x00" + name.encode(), digest_size=16
+        ).digest()
+
+    def add(self, catalog: str, products: list):
+        """Function to join the groups of a catalog into the merged catalog
+
+        Args:
+            catalog (str): The name of the catalog (e.g. the file name)
+            products (list): The products of the catalog
+
+        Raises:
+            Exception: If a parent isn't on the catalog, or on a cycle
+
+        """
+        self.records += len(products)
+        index = {}
+        for product in products:
+            index.setdefault(product["id"], product)
+        hashes = {}
+        for identifier in index:
+            # Walk up until a group with known hash (or a root) is found
+            chain = []
+            current = identifier
+            while current is not None and current not in hashes:
+                if current not in index:
+                    raise Exception(f"Parent {current} not found on {catalog}")
+                if len(chain) > len(index):
+                    raise Exception(f"Cycle on the ancestors of {identifier}")
+                chain.append(current)
+                current = index[current]["parent_id"]
+            parent_hash = b"" if current is None else hashes[current]
+            # Hash and join on the way back down
+            for item in reversed(chain):
+                parent_hash = hashes[item] = self.path_hash(
+                    parent_hash, index[item]["name"]
+                )
+                merged = self.keys.get(parent_hash)
+                if merged is None:
+                    parent = index[item]["parent_id"]
+                    merged = self.keys[parent_hash] = len(self.groups) + 1
+                    self.groups.append(
+                        {
+                            "id": merged,
+                            "name": index[item]["name"],
+                            "parent_id": (
+                                None
+                                if parent is None
+                                else self.mapping[(catalog, parent)]
+                            ),
+                        }
+                    )
+                self.mapping[(catalog, item)] = merged
+
+    def products(self):
+        """Function to get the merged catalog
+
+        Returns:
+            products (list): The merged groups, with `children_ids` (all the
+            descendants, like the source catalogs)
+
+        """
+        descendants = {group["id"]: [] for group in self.groups}
+        parents = {group["id"]: group["parent_id"] for group in self.groups}
+        for group in self.groups:
+            parent = group["parent_id"]
+            while parent is not None:
+                descendants[parent].append(group["id"])
+                parent = parents[parent]
+        return [
+            {**group, "children_ids": descendants[group["id"]]} for group in self.groups
+        ]
+
+    def stats(self):
+        """Function to get the merge statistics
+
+        Returns:
+            dict: Records read, merged groups and records collapsed
+
+        """
+        return {
+            "records": self.records,
+            "groups": len(self.groups),
+            "collapsed": self.records - len(self.groups),
+        }
+
+
+def main():
+    """
+    Main function to merge catalogs into a single catalog to migrate
+
+    Returns:
+        bool: True if the catalogs were merged, otherwise False
+
+    """
+    parser = argparse.ArgumentParser(description="Merge catalogs by group path")
+    parser.add_argument("catalogs", nargs="+", help="JSON or JSON lines catalogs")
+    parser.add_argument("--output", default="/tmp/merged.json")
+    parser.add_argument(
+        "--mapping",
+        default="/tmp/merged.mapping.json",
+        help="merged id of each source id of each catalog",
+    )
+    parser.add_argument(
+        "--normalize",
+        action="store_true",
+        help="compare the names ignoring case and extra spaces",
+    )
+    options = parser.parse_args()
+
+    merger = CatalogMerger(options.normalize)
+    try:
+        for catalog in options.catalogs:
+            merger.add(catalog, list(read_catalog(catalog)))
+    except Exception as err:
+        logging.error(f"[ERROR] Couldn't merge the catalogs. Traceback: {err}")
+        return False
+    with open(options.output, "w") as file:
+        json.dump(merger.products(), file)
+    mapping = {catalog: {} for catalog in options.catalogs}
+    for (catalog, source_id), merged in merger.mapping.items():
+        mapping[catalog][source_id] = merged
+    with open(options.mapping, "w") as file:
+        json.dump(mapping, file)
+    logging.info(f"[INFO] Catalogs merged into {options.output}: {merger.stats()}")
+    return True
+
+
+if __name__ == "__main__":
+    sys.exit(0 if main() else 1)
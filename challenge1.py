@@ -1,4 +1,5 @@
 from api1 import API1
+from validation import CatalogValidator
 import json
 import logging
 
@@ -236,6 +237,9 @@ def main():
         challenge = Challenge()
         # Get all products
         product_base = challenge.get_products("product_groups.json")
+        # Validate the catalog before any API call
+        if not CatalogValidator().check(product_base):
+            raise Exception("Invalid catalog, check the validation errors")
         # Divide the products into independent (no parent) and dependent (with parents)
         independent, dependent = challenge.filter_products(product_base)
 
@@ -1,17 +1,28 @@
+from api_accounting import MeteredAPI
+from api_recording import RecordingAPI, ReplayAPI, read_recording
 from api2 import API2
+from framing import FrameCodec
+from metrics import MigrationMetrics
+from object_log import ObjectLog
+from profiling import PhaseProfiler
+from tracing import TraceRecorder
+from validation import CatalogValidator
+import argparse
 import json
 import logging
 import os
+import sys
 
 
 class Challenge:
     """Class Challenge to manage all the challenge operations"""
 
-    def __init__(self):
+    def __init__(self, bounded_memory: bool = False):
         """Function to initialize the class
 
         Args:
             self: self class object
+            bounded_memory (bool): Keep created objects only in the object log
         """
         # Define class API
         self.api = API2()
@@ -19,8 +30,17 @@ class Challenge:
         self.SAVED_OBJECTS = []
         # Initialize the total number of objects
         self.total = 0
+        # On bounded memory mode the created objects go straight to the object
+        # log and only the new ids of parents with pending children stay in
+        # ID_MAP (source id -> new id)
+        self.bounded_memory = bounded_memory
+        self.object_log = ObjectLog()
+        self.ID_MAP = {}
+        # Optional compression of the backup files (see framing.py)
+        self.codec = None
         # Load saved objects from file to continue the last execution
-        self.load_saved_objects()
+        if not bounded_memory:
+            self.load_saved_objects()
 
     def remove_duplicates(self, objects: list):
         """Function to remove identical objects from list
@@ -50,10 +70,8 @@ class Challenge:
         """
         try:
             base_path = "/tmp/objects.bkp"
-            # Open backup file for read and gets the string with all saved objects
-            file = open(base_path, "r")
-            result = file.read()
-            file.close()
+            # Gets the string with all saved objects (compressed or not)
+            result = FrameCodec.load(base_path)
         except Exception as err:
             logging.error(f"[ERROR] Couldn't save file. Traceback: {err}")
             return False
@@ -89,6 +107,10 @@ class Challenge:
         """
         try:
             base_path = "/tmp/objects.bkp"
+            # Write a compressed frame with the execution objects
+            if self.codec:
+                self.codec.dump(json.dumps(self.SAVED_OBJECTS).encode(), base_path)
+                return True
             # Open backup file for write
             file = open(base_path, "w")
             # Remove old content from file
@@ -234,6 +256,121 @@ class Challenge:
         self.total = len(independent) + len(dependent)
         return independent, dependent
 
+    def get_depths(self, index: dict):
+        """Function to get the depth of every product in the tree
+
+        Args:
+            index (dict): The products indexed by their ids
+
+        Returns:
+            depths (dict): The depth of each product id (roots have depth 0)
+
+        """
+        depths = {}
+        for identifier in index:
+            # Walk up until a product with known depth (or a root) is found
+            chain = []
+            current = identifier
+            while current is not None and current not in depths:
+                chain.append(current)
+                current = index[current]["parent_id"]
+            depth = -1 if current is None else depths[current]
+            # Assign the depths on the way back down
+            for item in reversed(chain):
+                depth += 1
+                depths[item] = depth
+        return depths
+
+    def order_by_depth(self, products: list, depths: dict):
+        """Function to order products so every parent comes before its children
+
+        Args:
+            products (list): The list of products to order
+            depths (dict): The depth of each product id
+
+        Returns:
+            list: The products ordered by depth and then by parent_id
+
+        """
+        return sorted(
+            products,
+            key=lambda item: (depths[item["id"]], item["parent_id"] or 0),
+        )
+
+    def get_ancestor_names(self, index: dict, product: dict):
+        """Function to get the names of all ancestors of a product
+
+        Args:
+            index (dict): The products indexed by their ids
+            product (dict): The product which wants to find ancestors
+
+        Returns:
+            names (list): The ancestors names, from the root to the parent
+
+        """
+        names = []
+        parent_identifier = product["parent_id"]
+        while parent_identifier is not None:
+            parent = index[parent_identifier]
+            names.append(parent["name"])
+            parent_identifier = parent["parent_id"]
+        names.reverse()
+        return names
+
+    def count_pending_children(self, products: list):
+        """Function to count the children still to be created for each parent
+
+        Args:
+            products (list): The products not created yet
+
+        Returns:
+            pending (dict): Number of pending children of each parent id
+
+        """
+        pending = {}
+        for product in products:
+            parent_identifier = product["parent_id"]
+            if parent_identifier is not None:
+                pending[parent_identifier] = pending.get(parent_identifier, 0) + 1
+        return pending
+
+    def load_id_map(self, pending: dict):
+        """Function to rebuild ID_MAP from the object log
+
+        Only the parents that still have children to be created are kept.
+
+        Args:
+            pending (dict): Number of pending children of each parent id
+
+        """
+        self.ID_MAP = {}
+        for source_id, obj in self.object_log:
+            # Duplicated products are all created, the first one is the parent
+            if source_id in pending and source_id not in self.ID_MAP:
+                self.ID_MAP[source_id] = obj["id"]
+
+    def register_created(self, products: list, response: list, pending: dict):
+        """Function to update ID_MAP after some products were created
+
+        Args:
+            products (list): The source products that were created
+            response (list): The objects returned by the API (same order)
+            pending (dict): Number of pending children of each parent id
+
+        """
+        for product, obj in zip(products, response):
+            if product["id"] in pending and product["id"] not in self.ID_MAP:
+                self.ID_MAP[product["id"]] = obj["id"]
+        for product in products:
+            parent_identifier = product["parent_id"]
+            if parent_identifier is None:
+                continue
+            pending[parent_identifier] -= 1
+            # No more children to come, the parent id isn't needed anymore
+            if not pending[parent_identifier]:
+                del pending[parent_identifier]
+                self.ID_MAP.pop(parent_identifier, None)
+
     def save_independent_products(self, products: list):
         """Function to save products without parents
 
@@ -363,24 +500,218 @@ class Challenge:
         else:
             return True
 
+    def save_products_bounded(self, product_base: list):
+        """Function to save all products keeping only pending parent ids in memory
+
+        The products are created level by level (roots first) and every
+        created object is appended to the object log instead of SAVED_OBJECTS.
+
+        Args:
+            product_base (list): The list of all products
+
+        Returns:
+            bool: True if all elements was inserted, otherwise False
+
+        Raises:
+            Exception: If the new id of a parent isn't on ID_MAP
+            Exception: If the quantity of products stored isn't the same a the
+            quantity of all products
+
+        """
+        try:
+            size_all_products = len(product_base)
+            index = {product["id"]: product for product in product_base}
+            depths = self.get_depths(index)
+            products = self.order_by_depth(product_base, depths)
+            # The object log is the source of truth of what was already saved
+            position = self.object_log.count()
+            pending = self.count_pending_children(products[position:])
+            self.load_id_map(pending)
+
+            for product in products[position:]:
+                parent_identifier = product["parent_id"]
+                if (
+                    parent_identifier is not None
+                    and parent_identifier not in self.ID_MAP
+                ):
+                    raise Exception(f"New id of parent {parent_identifier} not found")
+                # Creates each product in the API with the parent new id
+                response = self.api.create(
+                    data={
+                        "name": product["name"],
+                        "parent_id": self.ID_MAP.get(parent_identifier),
+                        "ancestors": self.get_ancestor_names(index, product) or None,
+                    }
+                )
+                # Saves the object into the log before moving the counter
+                if not self.object_log.append([(product["id"], response)]):
+                    raise Exception("Couldn't append the object to the log")
+                self.register_created([product], [response], pending)
+                position += 1
+                self.save_last_execution(position)
+                logging.info(f"[INFO] Object created: {response}")
+                logging.info(f"[INFO] Storage size: {position}")
+
+            if size_all_products != self.object_log.count():
+                raise Exception(
+                    f"Missing objects: Expected {size_all_products} "
+                    f"- Stored: {self.object_log.count()}"
+                )
+        except Exception as err:
+            logging.error(
+                f"[ERROR] Error while saving products (bounded). Traceback: {err}"
+            )
+            return False
+        else:
+            return True
+
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format="%(name)s: %(levelname)s - %(message)s")
 
 
-def create_products():
+def parse_args(argv: list):
+    """
+    Function to parse the command line options
+
+    Args:
+        argv (list): The command line arguments (without the program name)
+
+    Returns:
+        options (argparse.Namespace): The parsed options
+
+    """
+    parser = argparse.ArgumentParser(description="Challenge 2 - Random crashes")
+    parser.add_argument(
+        "--bounded-memory",
+        action="store_true",
+        help="keep created objects only on the object log (/tmp/objects.log)",
+    )
+    parser.add_argument(
+        "--intern-names",
+        action="store_true",
+        help="write names and ancestors on the object log as codes of a name "
+        "table (bounded memory mode)",
+    )
+    parser.add_argument(
+        "--compress",
+        choices=sorted(FrameCodec.CODECS),
+        help="compress the backup files (objects.bkp and the object log)",
+    )
+    parser.add_argument(
+        "--compress-level",
+        type=int,
+        default=6,
+        help="compression level, 0 (fast) to 9 (small), default 6",
+    )
+    parser.add_argument(
+        "--record",
+        nargs="?",
+        const="/tmp/api_recording.jsonl",
+        metavar="FILE",
+        help="record the API calls, crashes and returned ids to FILE (default "
+        "/tmp/api_recording.jsonl, appended)",
+    )
+    parser.add_argument(
+        "--replay",
+        metavar="FILE",
+        help="replay the crashes and ids of a recording instead of calling the API",
+    )
+    parser.add_argument(
+        "--api-costs",
+        action="store_true",
+        help="count the calls and cost units of the API (a bulk request costs 5) "
+        "on /tmp/api_costs.json, reported at the end",
+    )
+    parser.add_argument(
+        "--api-latency",
+        type=float,
+        default=0.0,
+        metavar="SECONDS",
+        help="inject SECONDS per cost unit before every API call (implies "
+        "--api-costs)",
+    )
+    parser.add_argument(
+        "--metrics",
+        nargs="?",
+        const="/tmp/metrics.prom",
+        metavar="FILE",
+        help="write throughput, cost, crashes and ETA metrics (Prometheus text "
+        "format) to FILE after every batch (default /tmp/metrics.prom)",
+    )
+    parser.add_argument(
+        "--trace",
+        nargs="?",
+        const="/tmp/trace.json",
+        metavar="FILE",
+        help="append the phases of every execution to a timeline in Chrome trace "
+        "format (default /tmp/trace.json, a new one unless the runner started it)",
+    )
+    parser.add_argument(
+        "--profile",
+        nargs="?",
+        const="/tmp/profile",
+        metavar="DIR",
+        help="write CPU and memory reports of each phase to DIR after every "
+        "batch (default /tmp/profile, merge them with `python3 profiling.py DIR`)",
+    )
+    return parser.parse_args(argv)
+
+
+def create_products(
+    options: argparse.Namespace,
+    metrics: MigrationMetrics = None,
+    tracer: TraceRecorder = None,
+):
     """
     Function to save all the products
 
+    Args:
+        options (argparse.Namespace): The command line options
+        metrics (MigrationMetrics): The metrics to update (None to disable)
+        tracer (TraceRecorder): The trace of the phases (None to disable)
+
     Returns:
         bool: True if executed without errors, otherwise False
 
     """
+    profiler = None
     try:
         # Instantiate the class and separate objects into two lists
-        challenge = Challenge()
+        challenge = Challenge(bounded_memory=options.bounded_memory)
+        if options.compress:
+            challenge.codec = FrameCodec(options.compress, options.compress_level)
+        challenge.object_log = ObjectLog(
+            intern_names=options.intern_names, codec=challenge.codec
+        )
+        # The recording is the closest to the API, the costs are counted on top
+        if options.replay:
+            challenge.api = ReplayAPI(options.replay)
+        elif options.record:
+            challenge.api = RecordingAPI(challenge.api, options.record)
+        # A single MeteredAPI counts the calls for the costs and the metrics
+        accounting = options.api_costs or options.api_latency
+        if accounting or metrics:
+            challenge.api = MeteredAPI(
+                challenge.api,
+                options.api_latency,
+                MeteredAPI.STATE_PATH if accounting else None,
+            )
+        if metrics:
+            metrics.instrument_challenge(challenge)
+        if tracer:
+            tracer.instrument_challenge(challenge)
+        # On profile mode every phase is wrapped by the profiler
+        if options.profile:
+            profiler = PhaseProfiler(options.profile)
+            profiler.instrument_challenge(challenge)
         # Get all products
         product_base = challenge.get_products("product_groups.json")
+        # On bounded memory mode all products are saved level by level
+        if options.bounded_memory:
+            if not challenge.save_products_bounded(product_base):
+                raise Exception("Function save_products_bounded() couldn't complete")
+            return True
         # Divide the products into independent (no parent) and dependent (with parents)
         independent, dependent = challenge.filter_products(product_base)
         if not challenge.save_independent_products(independent):
@@ -396,24 +727,66 @@ def create_products():
         return False
     else:
         return True
+    finally:
+        # Flush the reports of the phases after the last batch
+        if profiler:
+            profiler.flush()
 
 
 def main():
     """
     Main function to execute the process
     """
-    challenge = Challenge()
+    options = parse_args(sys.argv[1:])
+    challenge = Challenge(bounded_memory=options.bounded_memory)
+    validator = CatalogValidator()
+    # The timeline of this execution (the runner traces the restarts)
+    tracer = None
+    if options.trace:
+        tracer = TraceRecorder(options.trace)
+        tracer.process_name(f"challenge2.py (pid {os.getpid()})")
+        tracer.instrument(challenge, {"get_products": "parse"})
+        tracer.instrument(validator, {"check": "parse"})
+    # A replay without its recording can't be restarted into success
+    if options.replay:
+        try:
+            read_recording(options.replay)
+        except Exception as err:
+            logging.error(f"[ERROR] Invalid recording to replay. Traceback: {err}")
+            os._exit(2)
     # Get the number of saved files on last execution
     last_saved = challenge.get_last_execution()
-    # Get the total of products to save
-    total_objects = len(challenge.get_products("product_groups.json"))
+    product_base = challenge.get_products("product_groups.json")
+    # Validate the catalog before any API call, a bad catalog must fail fast
+    if not validator.check(product_base):
+        # Sends to runner a signal different from the crash and the terminated
+        # execution signals, indicates invalid catalog
+        os._exit(2)
+    # Get the total of products to save, each execution loads its own copy
+    total_objects = len(product_base)
+    del product_base
+
+    # The metrics carry the counters of the previous executions
+    metrics = None
+    if options.metrics:
+        metrics = MigrationMetrics(options.metrics)
+        metrics.start(total_objects, last_saved)
 
     # While there are products to be saved
     while last_saved < total_objects:
-        create_products()
+        create_products(options, metrics, tracer)
         # Updates last_saved number
         last_saved = challenge.get_last_execution()
 
+    if metrics:
+        metrics.finish()
+    if options.api_costs or options.api_latency:
+        MeteredAPI(challenge.api, options.api_latency).log_report()
+    if options.replay:
+        logging.info(f"[INFO] Replay: {ReplayAPI(options.replay).summary()}")
+    if tracer:
+        tracer.instant("done")
+        tracer.close()
     logging.info("[INFO] Execution done with no errors!")
     # Sends to runner a signal different from the crash signal
     # Indicates terminated execution
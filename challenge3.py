@@ -1,31 +1,84 @@
+from ancestor_cache import AncestorCache
+from api_accounting import MeteredAPI
+from api_recording import RecordingAPI, ReplayAPI, read_recording
+from array import array
+from async_engine import AsyncAPI, AsyncAPI3, AsyncAPI3Client, AsyncMigration
 from api3 import API3
+from api3_idempotent import IdempotentAPI3
+from api3_http import API3Client
+from batch_cursor import BatchCursor
+from external_sort import ExternalDepthSort
+from framing import FrameCodec
+from jsonl_reader import JSONLReader, read_catalog
+from metrics import MigrationMetrics
+from name_table import NameTable
+from object_log import ObjectLog
+from pending_buffer import PendingChildrenBuffer
+from planner import ExecutionPlan
+from profiling import PhaseProfiler
+from tracing import TraceRecorder
+from validation import CatalogValidator
+import argparse
+import asyncio
 import json
 import logging
 import os
+import sys
 
 
 class Challenge:
     """Class Challenge to manage all the challenge operations"""
 
-    def __init__(self):
+    def __init__(self, bounded_memory: bool = False, api=None, concurrency: int = 1):
         """Function to initialize the class
 
         Args:
             self: self class object
+            bounded_memory (bool): Keep created objects only in the object log
+            api: The API to use (e.g. an api3_http.API3Client), default API3
+            concurrency (int): Bulk requests in flight per level (bounded memory
+            mode, the API must have `bulk_create_many`)
         """
         # Define class API
-        self.api = API3()
+        self.api = api or API3()
+        # Define the backup files (objects saved and number of objects saved)
+        self.OBJECTS_PATH = "/tmp/objects.bkp"
+        self.LAST_PATH = "/tmp/last.bkp"
+        self.CONCURRENCY = concurrency
         # Initialize a list of SAVED_OBJECTS (used in get_ancestors)
         self.SAVED_OBJECTS = []
         # Initialize the total number of objects
         self.total = 0
+        # Number of objects created on sorted mode (see save_products_sorted)
+        self.position = 0
+        # On bounded memory mode the created objects go straight to the object
+        # log and only the new ids of parents with pending children stay in
+        # ID_MAP (source id -> new id)
+        self.bounded_memory = bounded_memory
+        self.object_log = ObjectLog()
+        self.ID_MAP = {}
+        # Interned names of the ancestors kept on memory
+        self.NAMES = NameTable()
+        # Worker processes to parse a JSON lines catalog (None for CPU count)
+        self.READ_WORKERS = None
+        # Optional compression of the backup files (see framing.py)
+        self.codec = None
+        # Optional LRU cache of the resolved ancestors (see ancestor_cache.py)
+        self.ancestor_cache = None
         # Load saved objects from file to continue the last execution
-        self.load_saved_objects()
+        if not bounded_memory:
+            self.load_saved_objects()
         # Define a package size for bulk operations
         # PS: The bigger the package is, fewer operations the API will make,
         # consequently, fewer crashes will happen and fewer accesses to the
         # backup files, speeding up the API
         self.PACKAGE_SIZE = 13100
+        # Define a limit of the estimated serialized size of a package (bulk
+        # endpoints limit the request bytes), None for no limit
+        self.MAX_PACKAGE_BYTES = None
+        # An object bigger than MAX_PACKAGE_BYTES fails the same way on every
+        # restart, so the execution must stop (see create_products)
+        self.oversized = False
 
     def remove_duplicates(self, objects: list):
         """Function to remove identical objects from list
@@ -54,11 +107,9 @@ class Challenge:
 
         """
         try:
-            base_path = "/tmp/objects.bkp"
-            # Open backup file for read and gets the string with all saved objects
-            file = open(base_path, "r")
-            result = file.read()
-            file.close()
+            base_path = self.OBJECTS_PATH
+            # Gets the string with all saved objects (compressed or not)
+            result = FrameCodec.load(base_path)
         except Exception as err:
             logging.error(f"[ERROR] Couldn't save file. Traceback: {err}")
             return False
@@ -93,7 +144,11 @@ class Challenge:
 
         """
         try:
-            base_path = "/tmp/objects.bkp"
+            base_path = self.OBJECTS_PATH
+            # Write a compressed frame with the execution objects
+            if self.codec:
+                self.codec.dump(json.dumps(self.SAVED_OBJECTS).encode(), base_path)
+                return True
             # Open backup file for write
             file = open(base_path, "w")
             # Remove old content from file
@@ -115,7 +170,7 @@ class Challenge:
 
         """
         try:
-            base_path = "/tmp/last.bkp"
+            base_path = self.LAST_PATH
             # Open backup file for write
             file = open(base_path, "w")
             # Remove the old number of objects saved
@@ -138,14 +193,14 @@ class Challenge:
 
         """
         try:
-            base_path = "/tmp/last.bkp"
+            base_path = self.LAST_PATH
             # Open backup file for read and gets the string the number os saved objects
             # from last execution
             file = open(base_path, "r")
             result = file.read()
             file.close()
         except FileNotFoundError as err:
-            logging.error(f"[ERROR] File last.bkp not found. Traceback: {err}")
+            logging.error(f"[ERROR] File {base_path} not found. Traceback: {err}")
             return False
         else:
             # Remove the EOL and convert to int before returning
@@ -155,7 +210,8 @@ class Challenge:
         """Function to load json file into list to further manipulation
 
         Args:
-            filename (str): The name of the JSON file with the products
+            filename (str): The name of the JSON file with the products (or a
+            JSON lines file, `.jsonl`, with one product per line)
 
         Returns:
             bool: Returns False if the file was not found
@@ -163,6 +219,9 @@ class Challenge:
 
         """
         try:
+            # JSON lines exports are parsed in parallel by byte ranges
+            if filename.endswith(".jsonl"):
+                return JSONLReader(filename, self.READ_WORKERS).read()
             file = open(filename, "r")
             products = json.load(file)
         except FileNotFoundError as err:
@@ -171,6 +230,58 @@ class Challenge:
         else:
             return products
 
+    def resolve_ancestors(self, products: list, parent_identifier):
+        """Function to resolve the ancestors of the children of a product
+
+        Args:
+            products (list): a list of all products to look up
+            parent_identifier: the id of the parent of the children
+
+        Returns:
+            tuple: The ancestors (names and ids) and the names of the products
+            they were resolved from (a new saved object with one of them
+            changes the ancestors)
+
+        """
+        # The ancestors only depend on the parent and the SAVED_OBJECTS with
+        # the names of its ancestors, so siblings and deeper products reuse the
+        # chain already resolved until an object with one of those names is
+        # saved (see save_dependent_products)
+        if self.ancestor_cache is not None:
+            cached = self.ancestor_cache.get(parent_identifier)
+            if cached is not None:
+                return cached
+        # Get all items
+        found = [item for item in products if item["id"] == parent_identifier]
+        found = self.remove_duplicates(found)
+
+        # Result list
+        ancestors = []
+        names = set()
+
+        for item in found:
+            names.add(item["name"])
+            # If item has a parent, search for its ancestors
+            if item["parent_id"] is not None:
+                chain, chain_names = self.resolve_ancestors(products, item["parent_id"])
+                ancestors.extend(chain)
+                names.update(chain_names)
+            # For each item of the SAVED_OBJECTS look up for the info of the
+            # ancestor
+            for i in range(len(self.SAVED_OBJECTS)):
+                if self.SAVED_OBJECTS[i].get("name") == item["name"]:
+                    ancestors.append(
+                        {
+                            "name": item["name"],
+                            "id": self.SAVED_OBJECTS[i].get("id"),
+                        }
+                    )
+
+        ancestors = self.remove_duplicates(ancestors)
+        if self.ancestor_cache is not None:
+            self.ancestor_cache.put(parent_identifier, (ancestors, names), names)
+        return ancestors, names
+
     def get_ancestors(self, products: list, product: dict):
         """Function to get all ancestor for given `product` on a `products` list
 
@@ -184,37 +295,12 @@ class Challenge:
 
         """
         try:
-            # Get the parent_id from the given product
-            parent_identifier = product["parent_id"]
-            # Get all items
-            found = [item for item in products if item["id"] == parent_identifier]
-            found = self.remove_duplicates(found)
-
-            # Result list
-            ancestors = []
-
-            for item in found:
-                # If item has a parent, search for its ancestors
-                if item["parent_id"] is not None:
-                    for result in self.get_ancestors(products, item):
-                        ancestors.append(result)
-                # For each item of the SAVED_OBJECTS look up for the info of the
-                # ancestor
-                for i in range(len(self.SAVED_OBJECTS)):
-                    if self.SAVED_OBJECTS[i].get("name") == item["name"]:
-                        ancestors.append(
-                            {
-                                "name": item["name"],
-                                "id": self.SAVED_OBJECTS[i].get("id"),
-                            }
-                        )
-
-            ancestors = self.remove_duplicates(ancestors)
+            ancestors, _ = self.resolve_ancestors(products, product["parent_id"])
         except Exception as err:
             logging.error(f"[ERROR] Error while searching ancestors. Traceback: {err}")
             return False
         else:
-            return ancestors
+            return list(ancestors)
 
     def filter_products(self, products: list):
         """Function to filter all products that does not have parent products
@@ -239,6 +325,121 @@ class Challenge:
         self.total = len(independent) + len(dependent)
         return independent, dependent
 
+    def get_depths(self, index: dict):
+        """Function to get the depth of every product in the tree
+
+        Args:
+            index (dict): The products indexed by their ids
+
+        Returns:
+            depths (dict): The depth of each product id (roots have depth 0)
+
+        """
+        depths = {}
+        for identifier in index:
+            # Walk up until a product with known depth (or a root) is found
+            chain = []
+            current = identifier
+            while current is not None and current not in depths:
+                chain.append(current)
+                current = index[current]["parent_id"]
+            depth = -1 if current is None else depths[current]
+            # Assign the depths on the way back down
+            for item in reversed(chain):
+                depth += 1
+                depths[item] = depth
+        return depths
+
+    def order_by_depth(self, products: list, depths: dict):
+        """Function to order products so every parent comes before its children
+
+        Args:
+            products (list): The list of products to order
+            depths (dict): The depth of each product id
+
+        Returns:
+            list: The products ordered by depth and then by parent_id
+
+        """
+        return sorted(
+            products,
+            key=lambda item: (depths[item["id"]], item["parent_id"] or 0),
+        )
+
+    def get_ancestor_names(self, index: dict, product: dict):
+        """Function to get the names of all ancestors of a product
+
+        Args:
+            index (dict): The products indexed by their ids
+            product (dict): The product which wants to find ancestors
+
+        Returns:
+            names (list): The ancestors names, from the root to the parent
+
+        """
+        names = []
+        parent_identifier = product["parent_id"]
+        while parent_identifier is not None:
+            parent = index[parent_identifier]
+            names.append(parent["name"])
+            parent_identifier = parent["parent_id"]
+        names.reverse()
+        return names
+
+    def count_pending_children(self, products: list):
+        """Function to count the children still to be created for each parent
+
+        Args:
+            products (list): The products not created yet
+
+        Returns:
+            pending (dict): Number of pending children of each parent id
+
+        """
+        pending = {}
+        for product in products:
+            parent_identifier = product["parent_id"]
+            if parent_identifier is not None:
+                pending[parent_identifier] = pending.get(parent_identifier, 0) + 1
+        return pending
+
+    def load_id_map(self, pending: dict):
+        """Function to rebuild ID_MAP from the object log
+
+        Only the parents that still have children to be created are kept.
+
+        Args:
+            pending (dict): Number of pending children of each parent id
+
+        """
+        self.ID_MAP = {}
+        for source_id, obj in self.object_log:
+            # Duplicated products are all created, the first one is the parent
+            if source_id in pending and source_id not in self.ID_MAP:
+                self.ID_MAP[source_id] = obj["id"]
+
+    def register_created(self, products: list, response: list, pending: dict):
+        """Function to update ID_MAP after some products were created
+
+        Args:
+            products (list): The source products that were created
+            response (list): The objects returned by the API (same order)
+            pending (dict): Number of pending children of each parent id
+
+        """
+        for product, obj in zip(products, response):
+            if product["id"] in pending and product["id"] not in self.ID_MAP:
+                self.ID_MAP[product["id"]] = obj["id"]
+        for product in products:
+            parent_identifier = product["parent_id"]
+            if parent_identifier is None:
+                continue
+            pending[parent_identifier] -= 1
+            # No more children to come, the parent id isn't needed anymore
+            if not pending[parent_identifier]:
+                del pending[parent_identifier]
+                self.ID_MAP.pop(parent_identifier, None)
+
     def transform_package(self, package: list):
         """Function to transform objects from old format to the new API format
 
@@ -271,6 +472,121 @@ class Challenge:
         else:
             return transformed_package
 
+    def estimate_size(self, item: dict):
+        """Function to estimate the serialized size of an object in a package
+
+        Args:
+            item (dict): An object on the new API format
+
+        Returns:
+            int: The bytes of the object as JSON plus its separator
+
+        """
+        return len(json.dumps(item)) + 2
+
+    def oversized_object(self, item: dict):
+        """Function to get the error of an object bigger than MAX_PACKAGE_BYTES
+
+        Args:
+            item (dict): The object on the new API format
+
+        Returns:
+            Exception: The error to raise (the challenge is marked as oversized)
+
+        """
+        self.oversized = True
+        return Exception(f"Object bigger than {self.MAX_PACKAGE_BYTES} bytes: {item}")
+
+    def fit_package(self, package: list):
+        """Function to count how many objects of a package fit MAX_PACKAGE_BYTES
+
+        Args:
+            package (list): The package on the new API format
+
+        Returns:
+            count (int): The number of objects, from the first, that fit
+
+        Raises:
+            Exception: If the first object alone is bigger than MAX_PACKAGE_BYTES
+
+        """
+        if not self.MAX_PACKAGE_BYTES:
+            return len(package)
+        # The brackets of the list
+        size = 2
+        for count, item in enumerate(package):
+            size += self.estimate_size(item)
+            if size > self.MAX_PACKAGE_BYTES:
+                if not count:
+                    raise self.oversized_object(item)
+                return count
+        return len(package)
+
+    def pack_products(self, cursor: BatchCursor, prepare=None):
+        """Function to take the next package of products by count and by size
+
+        The products are transformed one by one, so no work is done for the
+        products that don't fit the package. The cursor isn't moved.
+
+        Args:
+            cursor (BatchCursor): The cursor on the products to pack
+            prepare: Function that returns the product to transform (a new
+            dictionary, e.g. with the ancestors), called with each product
+
+        Returns:
+            package (list): Up to PACKAGE_SIZE objects on the new format that
+            fit MAX_PACKAGE_BYTES
+
+        Raises:
+            Exception: If can't transform a product to the new format
+            Exception: If the first object alone is bigger than MAX_PACKAGE_BYTES
+
+        """
+        package = []
+        size = 2
+        for product in cursor.peek(self.PACKAGE_SIZE):
+            if prepare:
+                product = prepare(product)
+            # Transform dictionaries objects to the new format
+            data = self.transform_package([product])
+            # If data is False, some error occurred during transformation
+            if not data:
+                raise Exception(
+                    "An error occurred on transform_package(). Check the traceback."
+                )
+            if self.MAX_PACKAGE_BYTES:
+                size += self.estimate_size(data[0])
+                if size > self.MAX_PACKAGE_BYTES:
+                    if not package:
+                        raise self.oversized_object(data[0])
+                    break
+            package.append(data[0])
+        return package
+
+    def add_ancestors(self, product_base: list, product: dict):
+        """Function to get a copy of a product with the key `ancestors`
+
+        Args:
+            product_base (list): The list of all products (used on get_ancestors)
+            product (dict): The product which wants to find ancestors (not
+            changed)
+
+        Returns:
+            dict: A new dictionary with the product and its ancestors
+
+        Raises:
+            Exception: If couldn't get the ancestors
+
+        """
+        ancestors = self.get_ancestors(product_base, product)
+        # If False some error occurred while searching
+        if not ancestors:
+            raise Exception(
+                "Error while saving dependent products. Couldn't"
+                " execute get_ancestors(). Verify traceback."
+            )
+        return {**product, "ancestors": ancestors}
+
     def save_independent_products(self, products: list):
         """Function to save products without parents
 
@@ -294,22 +610,14 @@ class Challenge:
             # were already saved
             if objects_saved > len(products):
                 return True
-            else:
-                # Otherwise remove the first size(objects_saved) from products list
-                products = products[objects_saved:]
+            # Otherwise start after the first size(objects_saved) products
+            cursor = BatchCursor(products, objects_saved)
 
-            while True:
-                # Resize the products to PACKAGE_SIZE
-                package = products[: self.PACKAGE_SIZE]
+            while cursor:
                 last = self.get_last_execution()
-                # Transform dictionaries objects to the new format
-                package = self.transform_package(package)
-                # If package is False, some error occurred during transformation
-                if not package:
-                    raise Exception(
-                        "An error occurred on transform_package()."
-                        "Check the traceback."
-                    )
+                # Take the next package (up to PACKAGE_SIZE objects and
+                # MAX_PACKAGE_BYTES) on the new format
+                package = self.pack_products(cursor)
                 # Bulk create objects
                 response = self.api.bulk_create(package)
 
@@ -323,12 +631,8 @@ class Challenge:
                 # Saves the number of saved objects and objects into the backup file
                 self.save_last_execution(last + len(package))
                 self.save_objects()
-                # Resize the remaining products
-                products = products[self.PACKAGE_SIZE :]
-
-                # If zero products, break the loop
-                if not len(products):
-                    break
+                # Move after the products sent
+                cursor.advance(len(package))
 
             if size_independent_products != len(self.SAVED_OBJECTS):
                 raise Exception(
@@ -372,41 +676,30 @@ class Challenge:
             # were already saved
             if objects_saved > len(product_base):
                 return True
-            else:
-                # Otherwise remove the first size(objects_saved - independent) from
-                # products list
-                products = products[objects_saved - size_independent :]
-
-            while True:
-                # Resize the products to PACKAGE_SIZE
-                package = products[: self.PACKAGE_SIZE]
+            # Otherwise start after the first size(objects_saved - independent)
+            # products
+            cursor = BatchCursor(products, objects_saved - size_independent)
+            # The cached chains are resolved from the objects saved on this pass
+            if self.ancestor_cache is not None:
+                self.ancestor_cache.validate(len(self.SAVED_OBJECTS))
+
+            while cursor:
                 last = self.get_last_execution()
-                # Search for ancestors of the items and adds the key with them
-                # onto the dictionary
-                for i in range(len(package)):
-                    ancestors = self.get_ancestors(product_base, package[i])
-                    # If False some error occurred while searching
-                    if not ancestors:
-                        raise Exception(
-                            "Error while saving dependent products. Couldn't"
-                            " execute get_ancestors(). Verify traceback."
-                        )
-                    else:
-                        package[i]["ancestors"] = ancestors
-                # Transform dictionaries objects to the new format
-                package = self.transform_package(package)
-                # If package is False, some error occurred during transformation
-                if not package:
-                    raise Exception(
-                        "An error occurred on transform_package()."
-                        "Check the traceback."
-                    )
+                # Take the next package (up to PACKAGE_SIZE objects and
+                # MAX_PACKAGE_BYTES) searching the ancestors of each item (on a
+                # copy of the product, product_base isn't changed)
+                package = self.pack_products(
+                    cursor, lambda item: self.add_ancestors(product_base, item)
+                )
 
                 # Bulk create objects
                 response = self.api.bulk_create(package)
                 # Save the created objects
                 for item in response:
                     self.SAVED_OBJECTS.append(item)
+                # The chains with the names of the new objects must be resolved again
+                if self.ancestor_cache is not None:
+                    self.ancestor_cache.forget({item["name"] for item in response})
 
                 logging.info(f"[INFO] Objects created: {response}")
                 logging.info(f"[INFO] Storage size: {len(self.SAVED_OBJECTS)}")
@@ -414,12 +707,8 @@ class Challenge:
                 # Saves the number of saved objects and objects into the backup file
                 self.save_last_execution(last + len(package))
                 self.save_objects()
-                # Resize the remaining products
-                products = products[self.PACKAGE_SIZE :]
-
-                # If zero products, break the loop
-                if not len(products):
-                    break
+                # Move after the products sent
+                cursor.advance(len(package))
 
             if size_all_products != len(self.SAVED_OBJECTS):
                 raise Exception(
@@ -434,24 +723,1003 @@ class Challenge:
         else:
             return True
 
+    def next_packages(self, products: list, depths: dict, position: int, index: dict):
+        """Function to get the next packages to create from a single level
+
+        Args:
+            products (list): The products ordered by depth
+            depths (dict): The depth of each product id
+            position (int): The index of the first product not created yet
+            index (dict): The products indexed by their ids
+
+        Returns:
+            packages (list): Up to CONCURRENCY (products, data) tuples of up to
+            PACKAGE_SIZE products (all with the same depth) and their payload,
+            that fit MAX_PACKAGE_BYTES
+
+        """
+        level = depths[products[position]["id"]]
+        packages = []
+        stop = position
+        while (
+            len(packages) < self.CONCURRENCY
+            and stop < len(products)
+            and depths[products[stop]["id"]] == level
+        ):
+            start = stop
+            end = min(start + self.PACKAGE_SIZE, len(products))
+            while stop < end and depths[products[stop]["id"]] == level:
+                stop += 1
+            data = self.build_package(index, products[start:stop])
+            # Cut the package to the objects that fit MAX_PACKAGE_BYTES
+            stop = start + self.fit_package(data)
+            packages.append((products[start:stop], data[: stop - start]))
+        return packages
+
+    def build_package(self, index: dict, package: list):
+        """Function to build the API payload of a package using ID_MAP
+
+        Args:
+            index (dict): The products indexed by their ids
+            package (list): The source products of the package
+
+        Returns:
+            data (list): The package on the new API format
+
+        Raises:
+            Exception: If the new id of a parent isn't on ID_MAP
+            Exception: If can't transform a package of products to the new format
+
+        """
+        for item in package:
+            if item["parent_id"] is not None and item["parent_id"] not in self.ID_MAP:
+                raise Exception(f"New id of parent {item['parent_id']} not found")
+        # Transform dictionaries objects to the new format
+        data = self.transform_package(
+            [
+                {
+                    "name": item["name"],
+                    "parent_id": self.ID_MAP.get(item["parent_id"]),
+                    "ancestors": self.get_ancestor_names(index, item),
+                }
+                for item in package
+            ]
+        )
+        if not data:
+            raise Exception(
+                "An error occurred on transform_package(). Check the traceback."
+            )
+        return data
+
+    def save_products_bounded(self, product_base: list):
+        """Function to save all products keeping only pending parent ids in memory
+
+        The products are created level by level (roots first) and every
+        created object is appended to the object log instead of SAVED_OBJECTS.
+
+        Args:
+            product_base (list): The list of all products
+
+        Returns:
+            bool: True if all elements was inserted, otherwise False
+
+        Raises:
+            Exception: If the objects couldn't be appended to the object log
+            Exception: If the quantity of products stored isn't the same a the
+            quantity of all products
+
+        """
+        try:
+            size_all_products = len(product_base)
+            index = {product["id"]: product for product in product_base}
+            depths = self.get_depths(index)
+            products = self.order_by_depth(product_base, depths)
+            # The object log is the source of truth of what was already saved
+            position = self.object_log.count()
+            pending = self.count_pending_children(products[position:])
+            self.load_id_map(pending)
+
+            while position < size_all_products:
+                # Take up to CONCURRENCY packages of the same level, so the
+                # parents are always created before their children
+                packages = self.next_packages(products, depths, position, index)
+                data = [payload for _, payload in packages]
+                packages = [package for package, _ in packages]
+                # Bulk create objects (in flight together if many packages)
+                if len(data) > 1:
+                    responses = self.api.bulk_create_many(data)
+                else:
+                    responses = [self.api.bulk_create(data[0])]
+
+                created = [
+                    (item["id"], obj)
+                    for package, response in zip(packages, responses)
+                    for item, obj in zip(package, response)
+                ]
+                # Saves the objects into the log before moving the counter
+                if not self.object_log.append(created):
+                    raise Exception("Couldn't append the objects to the log")
+                for package, response in zip(packages, responses):
+                    self.register_created(package, response, pending)
+                position += len(created)
+                self.save_last_execution(position)
+
+                logging.info(f"[INFO] Objects created: {len(created)}")
+                logging.info(f"[INFO] Storage size: {position}")
+
+            if size_all_products != self.object_log.count():
+                raise Exception(
+                    f"Missing objects: Expected {size_all_products} "
+                    f"- Stored: {self.object_log.count()}"
+                )
+        except Exception as err:
+            logging.error(
+                f"[ERROR] Error while saving products (bounded). Traceback: {err}"
+            )
+            return False
+        else:
+            return True
+
+    def save_products_planned(self, plan: ExecutionPlan):
+        """Function to save all products following an execution plan
+
+        The batches of the plan already have the ancestors and the new format,
+        only the parent ids are translated to the new ids (ID_MAP) before each
+        bulk request. A restart continues from the batch after the last one on
+        the object log.
+
+        Args:
+            plan (ExecutionPlan): The plan written by the `plan` command
+
+        Returns:
+            bool: True if all elements was inserted, otherwise False
+
+        Raises:
+            Exception: If the new id of a parent isn't on ID_MAP
+            Exception: If the objects couldn't be appended to the object log
+            Exception: If the quantity of products stored isn't the same a the
+            quantity of the plan
+
+        """
+        try:
+            size_all_products = plan.load_summary()["total"]
+            self.ID_MAP = {}
+            position = 0
+            for source_id, obj in self.object_log:
+                # Duplicated products are all created, the first one is the parent
+                self.ID_MAP.setdefault(source_id, obj["id"])
+                position += 1
+
+            for batch in plan.batches(position):
+                data = batch["data"]
+                for item in data:
+                    if item["parent_id"] is not None:
+                        if item["parent_id"] not in self.ID_MAP:
+                            raise Exception(
+                                f"New id of parent {item['parent_id']} not found"
+                            )
+                        item["parent_id"] = self.ID_MAP[item["parent_id"]]
+                # Bulk create objects
+                response = self.api.bulk_create(data)
+
+                # Saves the objects into the log before moving the counter
+                if not self.object_log.append(list(zip(batch["ids"], response))):
+                    raise Exception("Couldn't append the objects to the log")
+                for source_id, obj in zip(batch["ids"], response):
+                    self.ID_MAP.setdefault(source_id, obj["id"])
+                position += len(response)
+                self.save_last_execution(position)
+
+                logging.info(f"[INFO] Objects created: {len(response)}")
+                logging.info(f"[INFO] Storage size: {position}")
+
+            if size_all_products != self.object_log.count():
+                raise Exception(
+                    f"Missing objects: Expected {size_all_products} "
+                    f"- Stored: {self.object_log.count()}"
+                )
+        except Exception as err:
+            logging.error(
+                f"[ERROR] Error while saving products (planned). Traceback: {err}"
+            )
+            return False
+        else:
+            return True
+
+    def source_keys(self, products: list):
+        """Function to get a source key for each product of a list
+
+        The key is the source id and the occurrence of the id on the list (the
+        duplicated products are all created, as different objects).
+
+        Args:
+            products (list): The products in creation order
+
+        Returns:
+            keys (list): The key of each product, e.g. "2000:0"
+
+        """
+        keys = []
+        occurrences = {}
+        for product in products:
+            occurrence = occurrences.get(product["id"], 0)
+            occurrences[product["id"]] = occurrence + 1
+            keys.append(f"{product['id']}:{occurrence}")
+        return keys
+
+    def save_products_idempotent(self, product_base: list):
+        """Function to save all products with idempotent bulk requests
+
+        Needs an API with batch tokens and source keys (see api3_idempotent.py).
+        Only the counter is saved: after a crash the last batch is sent again
+        with the same token, and the new ids of the parents are asked to the
+        API by their source keys.
+
+        Args:
+            product_base (list): The list of all products
+
+        Returns:
+            bool: True if all elements was inserted, otherwise False
+
+        Raises:
+            Exception: If the quantity of products stored isn't the same a the
+            quantity of all products
+
+        """
+        try:
+            size_all_products = len(product_base)
+            index = {product["id"]: product for product in product_base}
+            depths = self.get_depths(index)
+            products = self.order_by_depth(product_base, depths)
+            keys = self.source_keys(products)
+            position = self.get_last_execution()
+            self.ID_MAP = {}
+            # A single batch (and token) at a time, only one package is built
+            self.CONCURRENCY = 1
+
+            while position < size_all_products:
+                # New ids of the parents created before the last crash
+                missing = {
+                    f"{item['parent_id']}:0"
+                    for item in products[position : position + self.PACKAGE_SIZE]
+                    if item["parent_id"] is not None
+                    and item["parent_id"] not in self.ID_MAP
+                }
+                for key, obj in self.api.get_by_keys(sorted(missing)).items():
+                    self.ID_MAP[int(key.split(":")[0])] = obj["id"]
+                # Take the next package of a single level
+                [(package, data)] = self.next_packages(
+                    products, depths, position, index
+                )
+                # The same batch always has the same token
+                response = self.api.bulk_create(
+                    data,
+                    token=f"{position}:{len(package)}",
+                    keys=keys[position : position + len(package)],
+                )
+                for item, obj in zip(package, response):
+                    self.ID_MAP.setdefault(item["id"], obj["id"])
+                position += len(response)
+                self.save_last_execution(position)
+
+                logging.info(f"[INFO] Objects created: {len(response)}")
+                logging.info(f"[INFO] Storage size: {position}")
+
+            stored = len(self.api.get_by_keys(keys))
+            if size_all_products != stored:
+                raise Exception(
+                    f"Missing objects: Expected {size_all_products} - Stored: {stored}"
+                )
+        except Exception as err:
+            logging.error(
+                f"[ERROR] Error while saving products (idempotent). Traceback: {err}"
+            )
+            return False
+        else:
+            return True
+
+    def save_products_async(self, product_base: list, api: AsyncAPI, limits: list):
+        """Function to save all products with the asyncio engine
+
+        Args:
+            product_base (list): The list of all products
+            api (AsyncAPI): The async API (async_engine.py)
+            limits (list): The bulk requests in flight on each level
+
+        Returns:
+            bool: True if all elements was inserted, otherwise False
+
+        """
+        try:
+            asyncio.run(AsyncMigration(self, api, limits).save_products(product_base))
+        except Exception as err:
+            logging.error(
+                f"[ERROR] Error while saving products (async). Traceback: {err}"
+            )
+            return False
+        else:
+            return True
+
+    def skip_sorted(self, stream, position: int):
+        """Function to skip the products of a sorted stream already created
+
+        Args:
+            stream: The (depth, product) tuples of the sorted stream
+            position (int): The number of products already created
+
+        Returns:
+            tuple: The depth of the last product created (-1 if none), the ids
+            of its level and the ids of the level before it
+
+        """
+        depth = -1
+        level = set()
+        previous = set()
+        for _ in range(position):
+            item_depth, product = next(stream)
+            if item_depth != depth:
+                depth, level, previous = item_depth, set(), level
+            level.add(product["id"])
+        return depth, level, previous
+
+    def load_levels(self, level: set, previous: set):
+        """Function to get the new ids and paths of two levels from the object log
+
+        Args:
+            level (set): The source ids of the last level created
+            previous (set): The source ids of the level before it
+
+        Returns:
+            tuple: For each of the two levels, the (new id, names from the root
+            to the product) of each source id
+
+        """
+        created = {}
+        parents = {}
+        for source_id, obj in self.object_log:
+            if source_id in level:
+                levels = created
+            elif source_id in previous:
+                levels = parents
+            else:
+                continue
+            # Duplicated products are all created, the first one is the parent
+            if source_id not in levels:
+                levels[source_id] = (
+                    obj["id"],
+                    (obj["ancestors"] or []) + [obj["name"]],
+                )
+        return created, parents
+
+    def create_sorted(self, package: list, parents: dict, created: dict):
+        """Function to create the first products of a package of a single level
+
+        Args:
+            package (list): The source products, all with the same depth
+            parents (dict): The (new id, path) of each product of the level above
+            created (dict): The (new id, path) of the products of this level,
+            updated with the new objects
+
+        Returns:
+            rest (list): The products that didn't fit MAX_PACKAGE_BYTES
+
+        Raises:
+            Exception: If the new id of a parent isn't known
+            Exception: If the objects couldn't be appended to the object log
+
+        """
+        items = []
+        for product in package:
+            parent = product["parent_id"]
+            if parent is not None and parent not in parents:
+                raise Exception(f"New id of parent {parent} not found")
+            new_id, path = parents[parent] if parent is not None else (None, [])
+            items.append(
+                {"name": product["name"], "parent_id": new_id, "ancestors": path}
+            )
+        data = self.transform_package(items)
+        if not data:
+            raise Exception(
+                "An error occurred on transform_package(). Check the traceback."
+            )
+        count = self.fit_package(data)
+        response = self.api.bulk_create(data[:count])
+        records = [(product["id"], obj) for product, obj in zip(package, response)]
+        # Saves the objects into the log before moving the counter
+        if not self.object_log.append(records):
+            raise Exception("Couldn't append the objects to the log")
+        for product, obj in zip(package, response):
+            if product["id"] not in created:
+                created[product["id"]] = (
+                    obj["id"],
+                    (obj["ancestors"] or []) + [obj["name"]],
+                )
+        self.position += count
+        self.save_last_execution(self.position)
+        logging.info(f"[INFO] Objects created: {count}")
+        logging.info(f"[INFO] Storage size: {self.position}")
+        return package[count:]
+
+    def save_products_sorted(self, sorter: ExternalDepthSort):
+        """Function to save all products from a stream sorted by depth on disk
+
+        The catalog is never loaded: the products come from the sorted stream
+        of the external sort, and only the new ids and paths of the level
+        being created and the level above it are kept in memory.
+
+        Args:
+            sorter (ExternalDepthSort): The external sort with the sorted stream
+
+        Returns:
+            bool: True if all elements was inserted, otherwise False
+
+        Raises:
+            Exception: If the quantity of products stored isn't the same a the
+            quantity of all products
+
+        """
+        try:
+            size_all_products = sorter.summary()["total"]
+            stream = sorter.read()
+            # The object log is the source of truth of what was already saved
+            self.position = self.object_log.count()
+            depth, level, previous = self.skip_sorted(stream, self.position)
+            created, parents = self.load_levels(level, previous)
+
+            package = []
+            for item_depth, product in stream:
+                # A new level: the packages never mix levels, so the parents
+                # are always created before their children
+                if item_depth != depth:
+                    while package:
+                        package = self.create_sorted(package, parents, created)
+                    depth, parents, created = item_depth, created, {}
+                package.append(product)
+                if len(package) == self.PACKAGE_SIZE:
+                    package = self.create_sorted(package, parents, created)
+            while package:
+                package = self.create_sorted(package, parents, created)
+
+            if size_all_products != self.object_log.count():
+                raise Exception(
+                    f"Missing objects: Expected {size_all_products} "
+                    f"- Stored: {self.object_log.count()}"
+                )
+        except Exception as err:
+            logging.error(
+                f"[ERROR] Error while saving products (sorted). Traceback: {err}"
+            )
+            return False
+        else:
+            return True
+
+    def load_created(self):
+        """Function to rebuild ID_MAP and PATHS from the object log
+
+        Returns:
+            created (dict): The number of objects created for each source id
+
+        """
+        created = {}
+        # New id and ancestors names (for its children, as codes of NAMES) of
+        # each source id
+        self.ID_MAP = {}
+        self.PATHS = {}
+        for source_id, obj in self.object_log:
+            created[source_id] = created.get(source_id, 0) + 1
+            if source_id not in self.ID_MAP:
+                self.ID_MAP[source_id] = obj["id"]
+                self.PATHS[source_id] = self.NAMES.encode(
+                    (obj["ancestors"] or []) + [obj["name"]]
+                )
+        return created
+
+    def enqueue(self, queue: list, levels: list):
+        """Function to add levels of products to the ready queue
+
+        Args:
+            queue (list): Levels of products, queue[0] has all parents created
+            levels (list): Levels of products to add, levels[0] has all parents
+            created and levels[i + 1] only parents on levels[i]
+
+        """
+        for depth, level in enumerate(levels):
+            if depth < len(queue):
+                queue[depth].extend(level)
+            else:
+                queue.append(list(level))
+
+    def create_ready(self, queue: list, buffer: PendingChildrenBuffer, position: int):
+        """Function to create one package of the ready queue
+
+        The subtrees waiting for the created products are released from the
+        buffer into the queue.
+
+        Args:
+            queue (list): Levels of products, queue[0] has all parents created
+            buffer (PendingChildrenBuffer): The buffer of parked products
+            position (int): The number of objects already saved
+
+        Returns:
+            position (int): The number of objects saved after this package
+
+        Raises:
+            Exception: If can't transform a package of products to the new format
+            Exception: If the objects couldn't be appended to the object log
+
+        """
+        package = queue[0][: self.PACKAGE_SIZE]
+        # Transform dictionaries objects to the new format
+        data = self.transform_package(
+            [
+                {
+                    "name": item["name"],
+                    "parent_id": self.ID_MAP.get(item["parent_id"]),
+                    "ancestors": self.NAMES.decode(
+                        self.PATHS.get(item["parent_id"], ())
+                    ),
+                }
+                for item in package
+            ]
+        )
+        if not data:
+            raise Exception(
+                "An error occurred on transform_package(). Check the traceback."
+            )
+        # Cut the package to the objects that fit MAX_PACKAGE_BYTES
+        count = self.fit_package(data)
+        package, data = package[:count], data[:count]
+        del queue[0][:count]
+        if not queue[0]:
+            queue.pop(0)
+        # Bulk create objects
+        response = self.api.bulk_create(data)
+
+        # Saves the objects into the log before moving the counter
+        if not self.object_log.append(
+            [(item["id"], obj) for item, obj in zip(package, response)]
+        ):
+            raise Exception("Couldn't append the objects to the log")
+        position += len(response)
+        self.save_last_execution(position)
+        for item, obj in zip(package, response):
+            if item["id"] not in self.ID_MAP:
+                self.ID_MAP[item["id"]] = obj["id"]
+                self.PATHS[item["id"]] = self.PATHS.get(
+                    item["parent_id"], array("I")
+                ) + array("I", [self.NAMES.code(item["name"])])
+                self.enqueue(queue, buffer.release(item["id"]))
+
+        logging.info(f"[INFO] Objects created: {len(response)}")
+        logging.info(f"[INFO] Storage size: {position}")
+        return position
+
+    def save_products_streaming(self, products, buffer: PendingChildrenBuffer):
+        """Function to save products that may arrive before their parents
+
+        Products with a created parent go to the ready queue, the others are
+        parked on the buffer until the parent is created. A package is created
+        every time PACKAGE_SIZE products are ready.
+
+        Args:
+            products: Iterable with the products (e.g. jsonl_reader.read_catalog())
+            buffer (PendingChildrenBuffer): The buffer of parked products
+
+        Returns:
+            bool: True if all elements was inserted, otherwise False
+
+        Raises:
+            Exception: If some products never had their parent on the stream
+
+        """
+        try:
+            created = self.load_created()
+            position = sum(created.values())
+            queue = []
+            for product in products:
+                # Skip the products created before the last crash
+                if created.get(product["id"]):
+                    created[product["id"]] -= 1
+                    continue
+                parent_identifier = product["parent_id"]
+                if parent_identifier is None or parent_identifier in self.ID_MAP:
+                    self.enqueue(queue, [[product]])
+                else:
+                    buffer.park(product)
+                while queue and len(queue[0]) >= self.PACKAGE_SIZE:
+                    position = self.create_ready(queue, buffer, position)
+
+            # End of the stream, create everything that is ready
+            while queue:
+                position = self.create_ready(queue, buffer, position)
+
+            if buffer.size:
+                missing = sorted(buffer.missing_parents())
+                raise Exception(
+                    f"{buffer.size} products without parent, missing: {missing[:10]}"
+                )
+        except Exception as err:
+            logging.error(
+                f"[ERROR] Error while saving products (streaming). Traceback: {err}"
+            )
+            return False
+        else:
+            return True
+        finally:
+            logging.info(f"[INFO] Pending children buffer: {buffer.metrics()}")
+
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format="%(name)s: %(levelname)s - %(message)s")
 
 
-def create_products():
+def parse_args(argv: list):
+    """
+    Function to parse the command line options
+
+    Args:
+        argv (list): The command line arguments (without the program name)
+
+    Returns:
+        options (argparse.Namespace): The parsed options
+
+    """
+    parser = argparse.ArgumentParser(
+        description="Challenge 3 - Product group tree bulk"
+    )
+    parser.add_argument(
+        "command",
+        nargs="?",
+        choices=["run", "plan"],
+        default="run",
+        help="run the migration (default) or write its execution plan (dry run, "
+        "no API calls) to the --plan file",
+    )
+    parser.add_argument(
+        "--plan",
+        nargs="?",
+        const="/tmp/plan.jsonl",
+        metavar="FILE",
+        help="follow the execution plan of FILE (default /tmp/plan.jsonl), a "
+        "restart continues from the next batch of the plan",
+    )
+    parser.add_argument(
+        "--plan-workers",
+        type=int,
+        default=1,
+        help="(plan) processes to resolve the ancestors, attached to a shared "
+        "memory snapshot of the tree (Python 3.8+)",
+    )
+    parser.add_argument(
+        "--catalog",
+        default="product_groups.json",
+        help="the products to migrate, a JSON file or a JSON lines file (.jsonl, "
+        "parsed in parallel), default product_groups.json",
+    )
+    parser.add_argument(
+        "--read-workers",
+        type=int,
+        help="processes to parse a JSON lines catalog (default CPU count)",
+    )
+    parser.add_argument(
+        "--bounded-memory",
+        action="store_true",
+        help="keep created objects only on the object log (/tmp/objects.log)",
+    )
+    parser.add_argument(
+        "--ancestor-cache",
+        type=int,
+        metavar="ENTRIES",
+        help="cache up to ENTRIES resolved ancestor chains (LRU)",
+    )
+    parser.add_argument(
+        "--ancestor-cache-bytes",
+        type=int,
+        metavar="BYTES",
+        help="limit the estimated memory of the ancestor cache",
+    )
+    parser.add_argument(
+        "--intern-names",
+        action="store_true",
+        help="write names and ancestors on the object log as codes of a name "
+        "table (bounded memory and streaming modes)",
+    )
+    parser.add_argument(
+        "--compress",
+        choices=sorted(FrameCodec.CODECS),
+        help="compress the backup files (objects.bkp and the object log)",
+    )
+    parser.add_argument(
+        "--compress-level",
+        type=int,
+        default=6,
+        help="compression level, 0 (fast) to 9 (small), default 6",
+    )
+    parser.add_argument(
+        "--idempotent",
+        action="store_true",
+        help="use the idempotent API3 stand-in (api3_idempotent.py): only the "
+        "counter is saved, the last batch is sent again after a crash",
+    )
+    parser.add_argument(
+        "--record",
+        nargs="?",
+        const="/tmp/api_recording.jsonl",
+        metavar="FILE",
+        help="record the API calls, crashes and returned ids to FILE (default "
+        "/tmp/api_recording.jsonl, appended)",
+    )
+    parser.add_argument(
+        "--replay",
+        metavar="FILE",
+        help="replay the crashes and ids of a recording instead of calling the API",
+    )
+    parser.add_argument(
+        "--api-costs",
+        action="store_true",
+        help="count the calls and cost units of the API (a bulk request costs 5) "
+        "on /tmp/api_costs.json, reported at the end",
+    )
+    parser.add_argument(
+        "--api-latency",
+        type=float,
+        default=0.0,
+        metavar="SECONDS",
+        help="inject SECONDS per cost unit before every API call (implies "
+        "--api-costs)",
+    )
+    parser.add_argument(
+        "--metrics",
+        nargs="?",
+        const="/tmp/metrics.prom",
+        metavar="FILE",
+        help="write throughput, cost, crashes and ETA metrics (Prometheus text "
+        "format) to FILE after every batch (default /tmp/metrics.prom)",
+    )
+    parser.add_argument(
+        "--trace",
+        nargs="?",
+        const="/tmp/trace.json",
+        metavar="FILE",
+        help="append the phases of every execution to a timeline in Chrome trace "
+        "format (default /tmp/trace.json, a new one unless the runner started it)",
+    )
+    parser.add_argument(
+        "--profile",
+        nargs="?",
+        const="/tmp/profile",
+        metavar="DIR",
+        help="write CPU and memory reports of each phase to DIR after every "
+        "batch (default /tmp/profile, merge them with `python3 profiling.py DIR`)",
+    )
+    parser.add_argument(
+        "--api-url",
+        help="use a remote API3 over HTTP (see api3_http.py) instead of in-process",
+    )
+    parser.add_argument(
+        "--max-package-bytes",
+        type=int,
+        help="limit of the estimated JSON size of each bulk request (bytes)",
+    )
+    parser.add_argument(
+        "--stream",
+        metavar="FILE",
+        help="create the products of a JSON lines file in the order they arrive "
+        "(children may come before their parents)",
+    )
+    parser.add_argument(
+        "--spill",
+        metavar="PATH",
+        help="spill the pending children buffer of --stream to this file",
+    )
+    parser.add_argument(
+        "--max-buffer",
+        type=int,
+        default=100000,
+        help="pending children kept in memory before spilling (default 100000)",
+    )
+    parser.add_argument(
+        "--async-engine",
+        action="store_true",
+        help="create the products with the asyncio engine, many bulk requests "
+        "in flight from a single thread (implies --bounded-memory)",
+    )
+    parser.add_argument(
+        "--level-concurrency",
+        type=int,
+        nargs="+",
+        default=[8],
+        metavar="N",
+        help="(async engine) bulk requests in flight on each level, the last "
+        "value for the deeper levels (default 8)",
+    )
+    parser.add_argument(
+        "--external-sort",
+        action="store_true",
+        help="order the catalog by depth with an external merge sort on disk "
+        "and create the products from the sorted stream, without loading the "
+        "catalog (implies --bounded-memory)",
+    )
+    parser.add_argument(
+        "--sort-dir",
+        default="/tmp/depth_sort",
+        help="directory of the sorted runs and stream of --external-sort",
+    )
+    parser.add_argument(
+        "--run-size",
+        type=int,
+        default=100000,
+        help="products sorted in memory on each run of --external-sort",
+    )
+    parser.add_argument(
+        "--package-size", type=int, help="objects per bulk request (default 13100)"
+    )
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=1,
+        help="bulk requests in flight per level (needs --api-url and "
+        "--bounded-memory)",
+    )
+    options = parser.parse_args(argv)
+    # Only the HTTP client has a pool to keep many bulk requests in flight
+    if options.concurrency > 1 and not options.api_url:
+        parser.error("--concurrency needs --api-url")
+    if options.idempotent and (options.replay or options.api_url):
+        parser.error("--idempotent can't be used with --replay or --api-url")
+    # The async client calls the remote API directly, without the wrappers of
+    # the challenge API (recording, costs, metrics, profile and trace)
+    if options.async_engine and options.api_url:
+        if (
+            options.record
+            or options.replay
+            or options.idempotent
+            or options.api_costs
+            or options.api_latency
+            or options.metrics
+            or options.profile
+            or options.trace
+        ):
+            parser.error(
+                "--async-engine with --api-url can't be used with --record, "
+                "--replay, --idempotent, --api-costs, --api-latency, --metrics, "
+                "--profile or --trace"
+            )
+    # The sorted stream and the async engine work on the object log only
+    if options.external_sort or options.async_engine:
+        options.bounded_memory = True
+    return options
+
+
+def get_challenge(options: argparse.Namespace):
+    """
+    Function to instantiate the challenge with the command line options
+
+    Args:
+        options (argparse.Namespace): The command line options
+
+    Returns:
+        challenge (Challenge): The configured challenge
+
+    """
+    api = None
+    # The async engine has its own client (see create_products)
+    if options.api_url and not options.async_engine:
+        api = API3Client(options.api_url, pool_size=options.concurrency)
+    elif options.idempotent:
+        api = IdempotentAPI3()
+    challenge = Challenge(
+        bounded_memory=options.bounded_memory,
+        api=api,
+        concurrency=options.concurrency if api else 1,
+    )
+    if options.compress:
+        challenge.codec = FrameCodec(options.compress, options.compress_level)
+    challenge.object_log = ObjectLog(
+        intern_names=options.intern_names, codec=challenge.codec
+    )
+    challenge.READ_WORKERS = options.read_workers
+    if options.package_size:
+        challenge.PACKAGE_SIZE = options.package_size
+    challenge.MAX_PACKAGE_BYTES = options.max_package_bytes
+    return challenge
+
+
+def create_products(
+    options: argparse.Namespace,
+    metrics: MigrationMetrics = None,
+    tracer: TraceRecorder = None,
+):
     """
     Function to save all the products
 
+    Args:
+        options (argparse.Namespace): The command line options
+        metrics (MigrationMetrics): The metrics to update (None to disable)
+        tracer (TraceRecorder): The trace of the phases (None to disable)
+
     Returns:
         bool: True if executed without errors, otherwise False
 
     """
+    challenge = None
+    profiler = None
     try:
         # Instantiate the class and separate objects into two lists
-        challenge = Challenge()
+        challenge = get_challenge(options)
+        if options.ancestor_cache:
+            challenge.ancestor_cache = AncestorCache(
+                options.ancestor_cache, options.ancestor_cache_bytes
+            )
+        # The recording is the closest to the API, the costs are counted on top
+        if options.replay:
+            challenge.api = ReplayAPI(options.replay)
+        elif options.record:
+            challenge.api = RecordingAPI(challenge.api, options.record)
+        # A single MeteredAPI counts the calls for the costs and the metrics
+        accounting = options.api_costs or options.api_latency
+        if accounting or metrics:
+            # The async engine awaits the latency instead of blocking the loop
+            latency = 0.0 if options.async_engine else options.api_latency
+            challenge.api = MeteredAPI(
+                challenge.api,
+                latency,
+                MeteredAPI.STATE_PATH if accounting else None,
+            )
+        if metrics:
+            metrics.instrument_challenge(challenge)
+        if tracer:
+            tracer.instrument_challenge(challenge)
+        # On profile mode every phase is wrapped by the profiler
+        if options.profile:
+            profiler = PhaseProfiler(options.profile)
+            profiler.instrument_challenge(challenge)
+        # On streaming mode the products are created as they arrive
+        if options.stream:
+            buffer = PendingChildrenBuffer(options.max_buffer, options.spill)
+            saved = challenge.save_products_streaming(
+                read_catalog(options.stream), buffer
+            )
+            buffer.close()
+            if not saved:
+                raise Exception("Function save_products_streaming() couldn't complete")
+            return True
+        # On planned mode the batches are read from the plan file
+        if options.plan:
+            if not challenge.save_products_planned(ExecutionPlan(options.plan)):
+                raise Exception("Function save_products_planned() couldn't complete")
+            return True
+        # On external sort mode the products come sorted from disk
+        if options.external_sort:
+            sorter = ExternalDepthSort(options.sort_dir, options.run_size)
+            if not challenge.save_products_sorted(sorter):
+                raise Exception("Function save_products_sorted() couldn't complete")
+            return True
         # Get all products
-        product_base = challenge.get_products("product_groups.json")
+        product_base = challenge.get_products(options.catalog)
+        # On idempotent mode only the counter is kept
+        if options.idempotent:
+            if not challenge.save_products_idempotent(product_base):
+                raise Exception("Function save_products_idempotent() couldn't complete")
+            return True
+        # On async mode many bulk requests of a level are in flight together
+        if options.async_engine:
+            if options.api_url:
+                api = AsyncAPI3Client(
+                    options.api_url, pool_size=max(options.level_concurrency)
+                )
+            else:
+                api = AsyncAPI3(challenge.api, options.api_latency)
+            if not challenge.save_products_async(
+                product_base, api, options.level_concurrency
+            ):
+                raise Exception("Function save_products_async() couldn't complete")
+            return True
+        # On bounded memory mode all products are saved level by level
+        if options.bounded_memory:
+            if not challenge.save_products_bounded(product_base):
+                raise Exception("Function save_products_bounded() couldn't complete")
+            return True
         # Divide the products into independent (no parent) and dependent (with parents)
         independent, dependent = challenge.filter_products(product_base)
         if not challenge.save_independent_products(independent):
@@ -467,24 +1735,122 @@ def create_products():
         return False
     else:
         return True
+    finally:
+        if challenge and challenge.ancestor_cache is not None:
+            logging.info(f"[INFO] Ancestor cache: {challenge.ancestor_cache.stats()}")
+        # Flush the reports of the phases after the last batch
+        if profiler:
+            profiler.flush()
+        # A restart can't send an object bigger than the package limit, sends to
+        # runner the invalid catalog signal instead of the crash signal
+        if challenge and challenge.oversized:
+            logging.error("[ERROR] Increase --max-package-bytes to fit every object")
+            os._exit(2)
+
+
+def write_plan(options: argparse.Namespace):
+    """
+    Function to write the execution plan of the catalog (dry run)
+
+    Args:
+        options (argparse.Namespace): The command line options
+
+    Returns:
+        bool: True if the plan was written, otherwise False
+
+    """
+    challenge = get_challenge(options)
+    product_base = challenge.get_products(options.catalog)
+    # A plan of a bad catalog can't be executed
+    if not CatalogValidator().check(product_base):
+        return False
+    plan = ExecutionPlan(options.plan or "/tmp/plan.jsonl")
+    if not plan.build(challenge, product_base, options.plan_workers):
+        return False
+    plan.log_summary()
+    return True
 
 
 def main():
     """
     Main function to execute the process
     """
-    challenge = Challenge()
+    options = parse_args(sys.argv[1:])
+    if options.command == "plan":
+        sys.exit(0 if write_plan(options) else 1)
+    challenge = Challenge(bounded_memory=options.bounded_memory)
+    validator = CatalogValidator()
+    # The timeline of this execution (the runner traces the restarts)
+    tracer = None
+    if options.trace:
+        tracer = TraceRecorder(options.trace)
+        tracer.process_name(f"challenge3.py (pid {os.getpid()})")
+        tracer.instrument(challenge, {"get_products": "parse"})
+        tracer.instrument(validator, {"check": "parse"})
+    challenge.READ_WORKERS = options.read_workers
+    # A replay without its recording can't be restarted into success
+    if options.replay:
+        try:
+            read_recording(options.replay)
+        except Exception as err:
+            logging.error(f"[ERROR] Invalid recording to replay. Traceback: {err}")
+            os._exit(2)
     # Get the number of saved files on last execution
     last_saved = challenge.get_last_execution()
-    # Get the total of products to save
-    total_objects = len(challenge.get_products("product_groups.json"))
+    if options.stream:
+        # A stream can't be validated up front, products without parent are
+        # found at the end of the stream
+        total_objects = sum(1 for _ in read_catalog(options.stream))
+    elif options.plan:
+        # The catalog was validated by the `plan` command
+        total_objects = ExecutionPlan(options.plan).load_summary()["total"]
+    elif options.external_sort:
+        sorter = ExternalDepthSort(options.sort_dir, options.run_size)
+        if tracer:
+            tracer.instrument(sorter, {"sort": "plan"})
+        # A new migration sorts the catalog again, a restart reuses the stream
+        if not last_saved:
+            sorter.clear()
+        try:
+            total_objects = sorter.sort(lambda: read_catalog(options.catalog))["total"]
+        except Exception as err:
+            logging.error(f"[ERROR] Couldn't sort the catalog. Traceback: {err}")
+            os._exit(2)
+        sorter.log_summary()
+    else:
+        product_base = challenge.get_products(options.catalog)
+        # Validate the catalog before any API call, a bad catalog must fail fast
+        if not validator.check(product_base):
+            # Sends to runner a signal different from the crash and the
+            # terminated execution signals, indicates invalid catalog
+            os._exit(2)
+        # Get the total of products to save, each execution loads its own copy
+        total_objects = len(product_base)
+        del product_base
+
+    # The metrics carry the counters of the previous executions
+    metrics = None
+    if options.metrics:
+        metrics = MigrationMetrics(options.metrics)
+        metrics.start(total_objects, last_saved)
 
     # While there are products to be saved
     while last_saved < total_objects:
-        create_products()
+        # A stream that couldn't complete has products without parent
+        if not create_products(options, metrics, tracer) and options.stream:
+            os._exit(2)
         # Updates last_saved number
         last_saved = challenge.get_last_execution()
 
+    if metrics:
+        metrics.finish()
+    if options.api_costs or options.api_latency:
+        MeteredAPI(challenge.api, options.api_latency).log_report()
+    if options.replay:
+        logging.info(f"[INFO] Replay: {ReplayAPI(options.replay).summary()}")
+    if tracer:
+        tracer.instant("done")
+        tracer.close()
     logging.info("[INFO] Execution done with no errors!")
     # Sends to runner a signal different from the crash signal
     # Indicates terminated execution
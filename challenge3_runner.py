@@ -1,26 +1,56 @@
+from api_recording import reset_recording
 from subprocess import call
+from tracing import run_traced, runner_tracer
 import logging
+import sys
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format="%(name)s: %(levelname)s - %(message)s")
 
 
 def main():
-    """Main function to execute the runner process"""
+    """Main function to execute the runner process
+
+    The command line options are forwarded to the challenge on every restart
+    (e.g. `--bounded-memory`).
+    """
     # Creates backup files
     call(["touch", "/tmp/last.bkp"])
     call(["touch", "/tmp/objects.bkp"])
+    call(["touch", "/tmp/objects.log"])
 
     # Initialize the backup files
     call("echo 0 > /tmp/last.bkp", shell=True)
     call("echo '[]' > /tmp/objects.bkp", shell=True)
+    call(": > /tmp/objects.log", shell=True)
+    # Start the metrics (if enabled) of a new migration
+    call(["rm", "-f", "/tmp/metrics.state.json"])
+    # Start the API cost accounting (if enabled) of a new migration
+    call(["rm", "-f", "/tmp/api_costs.json"])
+    # Start a new recording (if enabled) or the replay from the first call
+    reset_recording(sys.argv[1:])
+    # Start the idempotent API stand-in (if enabled) without objects
+    call(["rm", "-f", "/tmp/api3_idempotent.journal"])
+
+    # The timeline (if enabled) of the executions, crashes and restarts
+    tracer = runner_tracer(sys.argv[1:], "challenge3_runner.py")
 
     crash_counter = 0
-    # While don't recieve signal 1 (terminated execution [check challenge2.py])
-    # call challenge2.py to execute
-    while not call(["python3", "challenge3.py"]):
+    # While don't recieve signal 1 (terminated execution [check challenge3.py])
+    # call challenge3.py to execute
+    command = ["python3", "challenge3.py"] + sys.argv[1:]
+    status = run_traced(command, tracer)
+    while not status:
         crash_counter += 1
-        continue
+        status = run_traced(command, tracer)
+
+    # Signal 2 means the catalog (or the replay recording, or the package size
+    # limit) is invalid and a restart would fail the same way
+    if status == 2:
+        logging.error(
+            "[ERROR] Invalid catalog, recording or package size, check the errors"
+        )
+        return False
 
     logging.info(
         f"[INFO]The challenge 3 crashed {crash_counter} times before completion"
@@ -0,0 +1,186 @@
+from heapq import merge
+import json
+import logging
+import os
+import shutil
+
+
+class ExternalDepthSort:
+    """Class ExternalDepthSort to order a catalog larger than memory by depth
+
+    The depths are found level by level, one sequential pass over the
+    catalog per level: the products whose parent is on the previous level
+    (the roots on the first pass) are on the next one, so only the ids of a
+    single level are kept in memory. The products of each pass are buffered
+    up to `run_size`, sorted by (depth, parent_id, position on the catalog)
+    and spilled to disk as a sorted run, and the runs are merged into one
+    stream ordered by depth and then by parent (the order of
+    `Challenge.order_by_depth`). The duplicated ids of the catalog must have
+    the same parent (see validation.py), so each product is on one level.
+
+    The sorted stream is a JSON lines file: the first line has the summary
+    (total and products per level) and every other line is a
+    `[depth, product]` pair. It is written once and kept until the runner
+    starts a new migration, so the restarts don't sort again.
+    """
+
+    def __init__(self, directory: str = "/tmp/depth_sort", run_size: int = 100000):
+        """Function to initialize the class
+
+        Args:
+            directory (str): The directory of the runs and the sorted stream
+            run_size (int): The products sorted in memory on each run
+
+        """
+        self.directory = directory
+        self.run_size = run_size
+        self.path = os.path.join(directory, "sorted.jsonl")
+        self.runs = 0
+
+    def depths(self, read):
+        """Function to find the depth of every product, one pass per level
+
+        Args:
+            read: A function returning a new iterator over the catalog
+
+        Returns:
+            generator: (depth, position, product) tuples, level by level
+
+        Raises:
+            Exception: If some products have no path to a root (their parent
+            isn't on the catalog, or they are on a cycle)
+
+        """
+        total = 0
+        assigned = 0
+        frontier = None
+        depth = 0
+        while frontier is None or frontier:
+            level = set()
+            for position, product in enumerate(read()):
+                if frontier is None:
+                    total += 1
+                    found = product["parent_id"] is None
+                else:
+                    found = product["parent_id"] in frontier
+                if found:
+                    level.add(product["id"])
+                    assigned += 1
+                    yield depth, position, product
+            frontier = level
+            depth += 1
+        if assigned != total:
+            raise Exception(
+                f"{total - assigned} products have no path to a root (missing "
+                f"parents or cycles)"
+            )
+
+    def spill(self, run: list):
+        """Function to sort a run in memory and write it to disk
+
+        Args:
+            run (list): [depth, parent key, position, product] entries
+
+        Returns:
+            path (str): The path of the run file
+
+        """
+        run.sort(key=lambda entry: entry[:3])
+        path = os.path.join(self.directory, f"run.{self.runs:06d}.jsonl")
+        with open(path, "w") as file:
+            for entry in run:
+                file.write(json.dumps(entry) + "\n")
+        self.runs += 1
+        return path
+
+    def read_run(self, path: str):
+        """Function to read a sorted run
+
+        Args:
+            path (str): The path of the run file
+
+        Returns:
+            generator: The [depth, parent key, position, product] entries
+
+        """
+        with open(path, "r") as file:
+            for line in file:
+                yield json.loads(line)
+
+    def sort(self, read):
+        """Function to write the sorted stream of a catalog (if not written)
+
+        Args:
+            read: A function returning a new iterator over the catalog
+
+        Returns:
+            summary (dict): The total and the products per level
+
+        Raises:
+            Exception: If some products have no path to a root
+
+        """
+        if os.path.exists(self.path):
+            return self.summary()
+        os.makedirs(self.directory, exist_ok=True)
+        paths = []
+        run = []
+        levels = []
+        for depth, position, product in self.depths(read):
+            if depth == len(levels):
+                levels.append(0)
+            levels[depth] += 1
+            run.append([depth, product["parent_id"] or 0, position, product])
+            if len(run) == self.run_size:
+                paths.append(self.spill(run))
+                run = []
+        if run:
+            paths.append(self.spill(run))
+        summary = {"total": sum(levels), "levels": levels, "runs": len(paths)}
+        temporary = self.path + ".tmp"
+        with open(temporary, "w") as file:
+            file.write(json.dumps(summary) + "\n")
+            # The positions are unique, the products are never compared
+            for depth, _, _, product in merge(
+                *[self.read_run(path) for path in paths], key=lambda e: e[:3]
+            ):
+                file.write(json.dumps([depth, product]) + "\n")
+        for path in paths:
+            os.remove(path)
+        os.replace(temporary, self.path)
+        return summary
+
+    def summary(self):
+        """Function to read the summary of the sorted stream
+
+        Returns:
+            summary (dict): The total, the products per level and the runs
+
+        """
+        with open(self.path, "r") as file:
+            return json.loads(file.readline())
+
+    def read(self):
+        """Function to read the sorted stream
+
+        Returns:
+            generator: (depth, product) tuples, ordered by depth and parent
+
+        """
+        with open(self.path, "r") as file:
+            file.readline()
+            for line in file:
+                depth, product = json.loads(line)
+                yield depth, product
+
+    def log_summary(self):
+        """Function to log the summary of the sorted stream"""
+        summary = self.summary()
+        logging.info(
+            f"[INFO] Sorted {summary['total']} products by depth "
+            f"({summary['runs']} runs): {summary['levels']} per level"
+        )
+
+    def clear(self):
+        """Function to remove the runs and the sorted stream"""
+        shutil.rmtree(self.directory, ignore_errors=True)
@@ -0,0 +1,134 @@
+import lzma
+import struct
+import zlib
+
+
+class FrameCodec:
+    """Class FrameCodec to compress data in frames that are safe to append
+
+    Each frame is compressed on its own and has a header with a magic
+    number, the codec, the size and the CRC32 of the compressed payload:
+
+        b"CK" | codec (1 byte) | size (4 bytes) | crc32 (4 bytes) | payload
+
+    A frame cut by a crash (short or with a wrong CRC) is detected when
+    reading, so it can be discarded and the file truncated before the next
+    append.
+    """
+
+    MAGIC = b"CK"
+    HEADER = struct.Struct(">2scII")
+    CODECS = {
+        "zlib": (
+            b"z",
+            lambda data, level: zlib.compress(data, level),
+            zlib.decompress,
+        ),
+        "lzma": (
+            b"x",
+            lambda data, level: lzma.compress(data, preset=level),
+            lzma.decompress,
+        ),
+    }
+
+    def __init__(self, codec: str = "zlib", level: int = 6):
+        """Function to initialize the class
+
+        Args:
+            codec (str): The compression to write, "zlib" or "lzma"
+            level (int): The compression level (zlib 0-9, lzma preset 0-9)
+
+        """
+        self.codec = codec
+        self.level = level
+
+    def encode(self, data: bytes):
+        """Function to compress data into a frame
+
+        Args:
+            data (bytes): The data to compress
+
+        Returns:
+            bytes: The frame
+
+        """
+        identifier, compress, _ = self.CODECS[self.codec]
+        payload = compress(data, self.level)
+        header = self.HEADER.pack(
+            self.MAGIC, identifier, len(payload), zlib.crc32(payload)
+        )
+        return header + payload
+
+    @classmethod
+    def read_frame(cls, file):
+        """Function to read and decompress the next frame of a binary file
+
+        Args:
+            file: A file opened for binary reading, at the start of a frame
+
+        Returns:
+            bytes: The decompressed data, or None if the frame is incomplete
+            or invalid
+
+        """
+        header = file.read(cls.HEADER.size)
+        if len(header) < cls.HEADER.size:
+            return None
+        magic, identifier, size, crc = cls.HEADER.unpack(header)
+        if magic != cls.MAGIC:
+            return None
+        payload = file.read(size)
+        if len(payload) < size or zlib.crc32(payload) != crc:
+            return None
+        for codec_identifier, _, decompress in cls.CODECS.values():
+            if codec_identifier == identifier:
+                return decompress(payload)
+        return None
+
+    @classmethod
+    def is_frame(cls, data: bytes):
+        """Function to check if some data starts with a frame
+
+        Args:
+            data (bytes): The first bytes of a file
+
+        Returns:
+            bool: True if the data starts with the magic number of a frame
+
+        """
+        return data[: len(cls.MAGIC)] == cls.MAGIC
+
+    def dump(self, data: bytes, path: str):
+        """Function to write a whole file as a single frame
+
+        Args:
+            data (bytes): The data to compress
+            path (str): The path of the file
+
+        """
+        with open(path, "wb") as file:
+            file.write(self.encode(data))
+
+    @classmethod
+    def load(cls, path: str):
+        """Function to read a whole file written by dump() (or uncompressed)
+
+        Args:
+            path (str): The path of the file
+
+        Returns:
+            bytes: The data of the file
+
+        Raises:
+            Exception: If the frame is incomplete or invalid
+
+        """
+        with open(path, "rb") as file:
+            if not cls.is_frame(file.read(len(cls.MAGIC))):
+                file.seek(0)
+                return file.read()
+            file.seek(0)
+            data = cls.read_frame(file)
+        if data is None:
+            raise Exception(f"Incomplete or invalid frame on {path}")
+        return data
@@ -0,0 +1,118 @@
+from concurrent.futures import ProcessPoolExecutor
+import json
+import os
+
+
+def read_range(path: str, start: int, end: int):
+    """
+    Function to parse the lines of a byte range of a JSON lines file
+
+    Args:
+        path (str): The path of the file
+        start (int): The offset of the first line of the range
+        end (int): The offset after the last line of the range
+
+    Returns:
+        products (list): The objects of the lines, in file order
+
+    """
+    with open(path, "rb") as file:
+        file.seek(start)
+        data = file.read(end - start)
+    return [json.loads(line) for line in data.splitlines() if line.strip()]
+
+
+def read_catalog(filename: str):
+    """
+    Function to read a catalog one product at a time
+
+    Args:
+        filename (str): A JSON lines file (`.jsonl`, streamed) or a JSON file
+        (loaded as a whole on every read)
+
+    Returns:
+        generator: The products in the order of the file
+
+    """
+    if not filename.endswith(".jsonl"):
+        with open(filename, "r") as file:
+            yield from json.load(file)
+        return
+    with open(filename, "r") as file:
+        for line in file:
+            if line.strip():
+                yield json.loads(line)
+
+
+class JSONLReader:
+    """Class JSONLReader to parse a JSON lines file in parallel processes
+
+    The file is split into byte ranges aligned to the start of the lines and
+    each range is parsed by a worker process. The products are returned in
+    file order, the same list `get_products()` reads from a JSON file.
+    """
+
+    def __init__(self, path: str, workers: int = None, min_range_bytes: int = 1 << 20):
+        """Function to initialize the class
+
+        Args:
+            path (str): The path of the JSON lines file
+            workers (int): The number of worker processes (default CPU count)
+            min_range_bytes (int): The minimum size of a range, smaller files
+            are parsed with fewer workers (or on the calling process)
+
+        """
+        self.path = path
+        self.workers = workers or os.cpu_count()
+        self.min_range_bytes = min_range_bytes
+
+    def ranges(self):
+        """Function to split the file into ranges aligned to newlines
+
+        Returns:
+            ranges (list): (start, end) offsets of each range, covering the file
+
+        """
+        size = os.path.getsize(self.path)
+        count = max(1, min(self.workers, size // self.min_range_bytes))
+        ranges = []
+        start = 0
+        with open(self.path, "rb") as file:
+            for number in range(1, count + 1):
+                if start >= size:
+                    break
+                end = size * number // count
+                if end < size and end > start:
+                    # Move the boundary to the start of the next line (the
+                    # byte before tells if it already is a line start)
+                    file.seek(end - 1)
+                    file.readline()
+                    end = file.tell()
+                if end > start:
+                    ranges.append((start, end))
+                    start = end
+        return ranges
+
+    def read(self):
+        """Function to parse the whole file
+
+        Returns:
+            products (list): The objects of all lines, in file order
+
+        """
+        ranges = self.ranges()
+        if len(ranges) < 2:
+            return [
+                product
+                for start, end in ranges
+                for product in read_range(self.path, start, end)
+            ]
+        products = []
+        with ProcessPoolExecutor(max_workers=len(ranges)) as executor:
+            futures = [
+                executor.submit(read_range, self.path, start, end)
+                for start, end in ranges
+            ]
+            for future in futures:
+                products.extend(future.result())
+        return products
@@ -0,0 +1,257 @@
+from api_accounting import API_COSTS
+import functools
+import json
+import logging
+import os
+import time
+
+
+class MigrationMetrics:
+    """Class MigrationMetrics to export the migration progress in Prometheus format
+
+    The counters are kept on a state file, so they carry across the crashes
+    and restarts of the challenge. A process that starts while the state
+    says another one was running counts as a crash of the previous one.
+
+    The metrics file is rewritten (atomically) after every batch.
+    """
+
+    CHECKPOINT_FILES = ("/tmp/last.bkp", "/tmp/objects.bkp", "/tmp/objects.log")
+
+    def __init__(
+        self,
+        path: str = "/tmp/metrics.prom",
+        state_path: str = "/tmp/metrics.state.json",
+    ):
+        """Function to initialize the class
+
+        Args:
+            path (str): The path of the metrics file (Prometheus text format)
+            state_path (str): The path of the state file
+
+        """
+        self.path = path
+        self.state_path = state_path
+        self.state = {
+            "started_at": time.time(),
+            "updated_at": time.time(),
+            "running": False,
+            "total": 0,
+            "saved": 0,
+            "objects": 0,
+            "batches": 0,
+            "cost_units": 0,
+            "last_call_cost": 0,
+            "crashes": 0,
+            "restarts": 0,
+            "restart_latency": 0.0,
+            "restart_latency_total": 0.0,
+        }
+
+    def load_state(self):
+        """Function to load the state saved by the previous executions
+
+        Returns:
+            bool: True if there was a state file, otherwise False
+
+        """
+        try:
+            with open(self.state_path, "r") as file:
+                self.state.update(json.load(file))
+        except (FileNotFoundError, ValueError):
+            return False
+        else:
+            return True
+
+    def start(self, total: int, saved: int = 0):
+        """Function to register the start of an execution
+
+        Args:
+            total (int): The total of objects to save
+            saved (int): The number of objects already saved
+
+        """
+        now = time.time()
+        if self.load_state():
+            self.state["restarts"] += 1
+            if self.state["running"]:
+                # The previous execution didn't finish, it crashed during the
+                # API call made after its last update
+                latency = now - self.state["updated_at"]
+                self.state["crashes"] += 1
+                self.state["cost_units"] += self.state["last_call_cost"]
+                self.state["restart_latency"] = latency
+                self.state["restart_latency_total"] += latency
+        self.state["running"] = True
+        self.state["total"] = total
+        self.state["saved"] = saved
+        self.write()
+
+    def finish(self):
+        """Function to register the end of the migration"""
+        self.state["running"] = False
+        self.write()
+
+    def count_call(self, name: str, cost: int, objects: int):
+        """Function to count a completed API call (a MeteredAPI observer)
+
+        Args:
+            name (str): The name of the API method
+            cost (int): The cost units of the call
+            objects (int): The objects created by the call
+
+        """
+        self.state["cost_units"] += cost
+        self.state["last_call_cost"] = cost
+        self.state["objects"] += objects
+        self.state["batches"] += 1
+
+    def wrap_checkpoint(self, function):
+        """Function to wrap the checkpoint counter to write the metrics
+
+        Args:
+            function: The save_last_execution method
+
+        Returns:
+            The wrapped function
+
+        """
+
+        @functools.wraps(function)
+        def wrapper(last: int):
+            result = function(last)
+            self.state["saved"] = last
+            self.write()
+            return result
+
+        return wrapper
+
+    def instrument_challenge(self, challenge):
+        """Function to collect the metrics of a challenge
+
+        Args:
+            challenge: A Challenge object (challenge2.py or challenge3.py), its
+            API wrapped by a MeteredAPI (api_accounting.py) that counts the calls
+
+        """
+        challenge.api.observers.append(self.count_call)
+        challenge.save_last_execution = self.wrap_checkpoint(
+            challenge.save_last_execution
+        )
+
+    def checkpoint_bytes(self):
+        """Function to get the size of the checkpoint files
+
+        Returns:
+            int: The sum of the sizes of the existing checkpoint files
+
+        """
+        size = 0
+        for path in self.CHECKPOINT_FILES:
+            if os.path.exists(path):
+                size += os.path.getsize(path)
+        return size
+
+    def render(self):
+        """Function to render the metrics in Prometheus text format
+
+        Returns:
+            text (str): The metrics exposition
+
+        """
+        state = self.state
+        elapsed = max(state["updated_at"] - state["started_at"], 1e-9)
+        objects_per_second = state["objects"] / elapsed
+        remaining = max(state["total"] - state["saved"], 0)
+        metrics = [
+            ("objects_total", "gauge", "Objects to save", state["total"]),
+            ("objects_saved", "gauge", "Objects saved (checkpoint)", state["saved"]),
+            (
+                "objects_created_total",
+                "counter",
+                "Objects created by the API",
+                state["objects"],
+            ),
+            ("batches_total", "counter", "API calls completed", state["batches"]),
+            (
+                "api_cost_units_total",
+                "counter",
+                f"API cost in singular requests (bulk costs {API_COSTS['bulk_create']})",
+                state["cost_units"],
+            ),
+            ("crashes_total", "counter", "Executions crashed", state["crashes"]),
+            ("restarts_total", "counter", "Executions restarted", state["restarts"]),
+            (
+                "restart_latency_seconds",
+                "gauge",
+                "Time from the last update before a crash to the restart",
+                state["restart_latency"],
+            ),
+            (
+                "restart_latency_seconds_total",
+                "counter",
+                "Time lost on all the restarts",
+                state["restart_latency_total"],
+            ),
+            (
+                "checkpoint_bytes",
+                "gauge",
+                "Size of the checkpoint files",
+                self.checkpoint_bytes(),
+            ),
+            (
+                "elapsed_seconds",
+                "gauge",
+                "Time since the start of the migration",
+                elapsed,
+            ),
+            (
+                "objects_per_second",
+                "gauge",
+                "Objects created per second since the start",
+                objects_per_second,
+            ),
+            (
+                "batches_per_second",
+                "gauge",
+                "API calls per second since the start",
+                state["batches"] / elapsed,
+            ),
+            (
+                "eta_seconds",
+                "gauge",
+                "Estimated time to save the remaining objects",
+                remaining / objects_per_second if objects_per_second else -1,
+            ),
+            ("running", "gauge", "1 while an execution is running", state["running"]),
+        ]
+        lines = []
+        for name, kind, description, value in metrics:
+            lines.append(f"# HELP migration_{name} {description}")
+            lines.append(f"# TYPE migration_{name} {kind}")
+            value = float(value)
+            value = int(value) if value.is_integer() else round(value, 6)
+            lines.append(f"migration_{name} {value}")
+        return "\n".join(lines) + "\n"
+
+    def write(self):
+        """Function to save the state and write the metrics file atomically
+
+        Returns:
+            bool: True if the files were written, otherwise False
+
+        """
+        try:
+            self.state["updated_at"] = time.time()
+            for path, content in (
+                (self.state_path, json.dumps(self.state)),
+                (self.path, self.render()),
+            ):
+                with open(path + ".tmp", "w") as file:
+                    file.write(content)
+                os.replace(path + ".tmp", path)
+        except Exception as err:
+            logging.error(f"[ERROR] Couldn't write the metrics. Traceback: {err}")
+            return False
+        else:
+            return True
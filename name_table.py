@@ -0,0 +1,69 @@
+from array import array
+
+
+class NameTable:
+    """Class NameTable to intern the names of the product groups
+
+    Each distinct name has an integer code (its position on the table), so
+    the ancestors can be kept as arrays of codes instead of lists of
+    repeated strings.
+    """
+
+    def __init__(self):
+        """Function to initialize the class"""
+        self.codes = {}
+        self.names = []
+
+    def __len__(self):
+        """Function to get the number of distinct names"""
+        return len(self.names)
+
+    def code(self, name: str):
+        """Function to get the code of a name, adding it to the table if new
+
+        Args:
+            name (str): The name to intern
+
+        Returns:
+            int: The code of the name
+
+        """
+        code = self.codes.get(name)
+        if code is None:
+            code = self.codes[name] = len(self.names)
+            self.names.append(name)
+        return code
+
+    def add(self, names: list):
+        """Function to add names loaded from a checkpoint (in code order)
+
+        Args:
+            names (list): The names to add
+
+        """
+        for name in names:
+            self.code(name)
+
+    def encode(self, names: list):
+        """Function to encode a list of names
+
+        Args:
+            names (list): The names to encode
+
+        Returns:
+            array: The codes of the names
+
+        """
+        return array("I", (self.code(name) for name in names))
+
+    def decode(self, codes):
+        """Function to decode a list of codes
+
+        Args:
+            codes: The codes to decode (list or array)
+
+        Returns:
+            list: The names of the codes
+
+        """
+        return [self.names[code] for code in codes]
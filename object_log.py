@@ -0,0 +1,207 @@
+from framing import FrameCodec
+from name_table import NameTable
+import json
+import logging
+import os
+
+
+class ObjectLog:
+    """Class ObjectLog to keep created objects in an append-only file
+
+    Each line of the log is a JSON object with the source id of the product
+    and the object returned by the API, so the file can be appended after
+    every batch instead of being rewritten as a whole.
+
+    With `intern_names` the names and ancestors of the objects are written
+    as codes of a name table. The table is appended to the log too, each
+    name only once (on a `{"names": [...]}` line before the first object that
+    uses it), so the log stays append-only.
+
+    With a `codec` the lines of each append are written as one compressed
+    frame (see framing.py). Lines and frames can be mixed on the same log.
+    A line or frame cut by a crash ends the log, and it is truncated before
+    the next append.
+    """
+
+    def __init__(
+        self,
+        path: str = "/tmp/objects.log",
+        intern_names: bool = False,
+        codec: FrameCodec = None,
+    ):
+        """Function to initialize the class
+
+        Args:
+            path (str): The path of the log file
+            intern_names (bool): Write names and ancestors as codes
+            codec (FrameCodec): Compress each append as a frame (None to write
+            plain JSON lines)
+
+        """
+        self.path = path
+        self.names = NameTable() if intern_names else None
+        self.codec = codec
+        # Number of names of the table already on the log (None if not loaded)
+        self.written = None
+        # The end of the log is checked before the first append
+        self.repaired = False
+
+    def read_units(self):
+        """Function to read the complete lines and frames of the log
+
+        Returns:
+            generator: (lines, end) tuples, the text lines of each line or
+            frame and the offset of its end
+
+        """
+        try:
+            file = open(self.path, "rb")
+        except FileNotFoundError:
+            return
+        with file:
+            while True:
+                start = file.tell()
+                head = file.read(len(FrameCodec.MAGIC))
+                if not head:
+                    break
+                file.seek(start)
+                if FrameCodec.is_frame(head):
+                    data = FrameCodec.read_frame(file)
+                    if data is None:
+                        break
+                    yield data.decode().splitlines(keepends=True), file.tell()
+                else:
+                    line = file.readline()
+                    if not line.endswith(b"\n"):
+                        break
+                    yield [line.decode()], file.tell()
+
+    def iter_lines(self):
+        """Function to iterate the text lines of the log
+
+        Returns:
+            generator: The complete lines, plain or from frames
+
+        """
+        for lines, _ in self.read_units():
+            yield from lines
+
+    def repair(self):
+        """Function to truncate a line or frame cut by a crash at the end"""
+        end = 0
+        for _, end in self.read_units():
+            pass
+        if os.path.exists(self.path) and os.path.getsize(self.path) > end:
+            logging.warning(
+                f"[WARNING] Discarding {os.path.getsize(self.path) - end} bytes "
+                f"cut by a crash at the end of {self.path}"
+            )
+            os.truncate(self.path, end)
+        self.repaired = True
+
+    def load_names(self):
+        """Function to load the name table already written on the log"""
+        self.names = NameTable()
+        for line in self.iter_lines():
+            if line.startswith('{"names"'):
+                self.names.add(json.loads(line)["names"])
+        self.written = len(self.names)
+
+    def encode(self, obj: dict):
+        """Function to replace the names of an object by their codes
+
+        Args:
+            obj (dict): The object returned by the API
+
+        Returns:
+            dict: The object with the codes
+
+        """
+        ancestors = obj.get("ancestors")
+        return {
+            **obj,
+            "name": self.names.code(obj["name"]),
+            "ancestors": list(self.names.encode(ancestors)) if ancestors else None,
+        }
+
+    def append(self, records: list):
+        """Function to append created objects to the log
+
+        Args:
+            records (list): List of (source_id, object) tuples
+
+        Returns:
+            bool: True if the records were written, otherwise False
+
+        """
+        try:
+            if not self.repaired:
+                self.repair()
+            names = ""
+            if self.names is not None:
+                if self.written is None:
+                    self.load_names()
+                records = [(source_id, self.encode(obj)) for source_id, obj in records]
+                # Names used for the first time go on the log before the objects
+                if len(self.names) > self.written:
+                    new = self.names.names[self.written :]
+                    names = json.dumps({"names": new}) + "\n"
+            lines = names + "".join(
+                json.dumps({"source_id": source_id, "object": obj}) + "\n"
+                for source_id, obj in records
+            )
+            data = lines.encode()
+            if self.codec:
+                data = self.codec.encode(data)
+            with open(self.path, "ab") as file:
+                file.write(data)
+                # Make sure the records are on disk before the counter moves
+                file.flush()
+                os.fsync(file.fileno())
+        except Exception as err:
+            logging.error(f"[ERROR] Couldn't append to {self.path}. Traceback: {err}")
+            # The table must be loaded again from what is on the log
+            self.written = None
+            return False
+        else:
+            if self.names is not None:
+                self.written = len(self.names)
+            return True
+
+    def __iter__(self):
+        """Function to iterate the log without loading it into memory
+
+        Returns:
+            generator: (source_id, object) tuples in creation order, with the
+            names decoded if the log has a name table
+
+        """
+        table = NameTable()
+        for line in self.iter_lines():
+            record = json.loads(line)
+            if "names" in record:
+                table.add(record["names"])
+                continue
+            obj = record["object"]
+            if isinstance(obj["name"], int):
+                obj["name"] = table.names[obj["name"]]
+                if obj["ancestors"]:
+                    obj["ancestors"] = table.decode(obj["ancestors"])
+            yield record["source_id"], obj
+
+    def count(self):
+        """Function to get the number of objects in the log
+
+        Returns:
+            int: The number of complete records
+
+        """
+        return sum(1 for line in self.iter_lines() if not line.startswith('{"names"'))
+
+    def reset(self):
+        """Function to empty the log before a new migration"""
+        open(self.path, "w").close()
+        self.repaired = True
+        if self.names is not None:
+            self.names = NameTable()
+            self.written = 0
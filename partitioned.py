@@ -0,0 +1,247 @@
+from api3_http import API3Server, CrashingAPI3Client
+from challenge3 import Challenge
+from concurrent.futures import ThreadPoolExecutor
+from object_log import ObjectLog
+from subprocess import call
+from validation import CatalogValidator
+import argparse
+import heapq
+import json
+import logging
+import os
+import shutil
+import sys
+
+
+class Coordinator:
+    """Class Coordinator to migrate independent partitions of the catalog at once
+
+    The catalog is split into partitions of whole root subtrees (a product
+    and its parent are always on the same partition), and each partition is
+    migrated by its own worker process against a shared local API. Every
+    worker has its own object log and counter, so a crash only restarts
+    that worker while the others keep going.
+    """
+
+    def __init__(self, workers: int, directory: str = "/tmp/partitions"):
+        """Function to initialize the class
+
+        Args:
+            workers (int): The number of partitions (and worker processes)
+            directory (str): The directory of the partitions and checkpoints
+
+        """
+        self.workers = workers
+        self.directory = directory
+
+    def partition_path(self, partition: int):
+        """Function to get the path of the products of a partition"""
+        return os.path.join(self.directory, f"partition.{partition}.json")
+
+    def log_path(self, partition: int):
+        """Function to get the path of the object log of a partition"""
+        return os.path.join(self.directory, f"objects.{partition}.log")
+
+    def last_path(self, partition: int):
+        """Function to get the path of the counter of a partition"""
+        return os.path.join(self.directory, f"last.{partition}.bkp")
+
+    def partition(self, products: list):
+        """Function to split the products into partitions of root subtrees
+
+        The subtrees are assigned from the biggest to the smallest, each one to
+        the partition with fewer products at the moment.
+
+        Args:
+            products (list): The list of all products
+
+        Returns:
+            partitions (list): A list of products for each partition
+
+        """
+        index = {product["id"]: product for product in products}
+        roots = {}
+        subtrees = {}
+        for product in products:
+            # Walk up until a product with known root (or a root) is found
+            chain = []
+            current = product["id"]
+            while current not in roots and index[current]["parent_id"] is not None:
+                chain.append(current)
+                current = index[current]["parent_id"]
+            root = roots.get(current, current)
+            for identifier in chain + [current]:
+                roots[identifier] = root
+            subtrees.setdefault(root, []).append(product)
+
+        partitions = [[] for _ in range(self.workers)]
+        loads = [(0, number) for number in range(self.workers)]
+        for subtree in sorted(subtrees.values(), key=len, reverse=True):
+            load, number = heapq.heappop(loads)
+            partitions[number].extend(subtree)
+            heapq.heappush(loads, (load + len(subtree), number))
+        return partitions
+
+    def prepare(self, products: list):
+        """Function to write the partitions and empty the checkpoints
+
+        Args:
+            products (list): The list of all products
+
+        Returns:
+            sizes (list): The number of products of each partition
+
+        """
+        shutil.rmtree(self.directory, ignore_errors=True)
+        os.makedirs(self.directory)
+        sizes = []
+        for number, partition in enumerate(self.partition(products)):
+            with open(self.partition_path(number), "w") as file:
+                json.dump(partition, file)
+            ObjectLog(self.log_path(number)).reset()
+            sizes.append(len(partition))
+        return sizes
+
+    def run_worker(self, partition: int, url: str, package_size: int = None):
+        """Function to run a worker process until its partition is saved
+
+        Args:
+            partition (int): The number of the partition
+            url (str): The base URL of the shared API
+            package_size (int): Objects per bulk request (None for default)
+
+        Returns:
+            crashes (int): The number of crashes, or -1 if the worker failed
+
+        """
+        command = [
+            sys.executable,
+            __file__,
+            "worker",
+            "--partition",
+            str(partition),
+            "--api-url",
+            url,
+            "--directory",
+            self.directory,
+        ]
+        if package_size:
+            command += ["--package-size", str(package_size)]
+        crashes = 0
+        # Signal 0 is a crash, restart only this worker
+        status = call(command)
+        while not status:
+            crashes += 1
+            status = call(command)
+        if status != 1:
+            logging.error(f"[ERROR] Worker {partition} failed with signal {status}")
+            return -1
+        return crashes
+
+    def merge(self):
+        """Function to merge the object logs of all partitions
+
+        Returns:
+            id_map (dict): The new id of each source id (first object created)
+
+        """
+        id_map = {}
+        for partition in range(self.workers):
+            for source_id, obj in ObjectLog(self.log_path(partition)):
+                id_map.setdefault(source_id, obj["id"])
+        with open(os.path.join(self.directory, "id_map.json"), "w") as file:
+            json.dump(id_map, file)
+        return id_map
+
+    def run(self, products: list, package_size: int = None, latency: float = 0):
+        """Function to migrate all products with one worker per partition
+
+        Args:
+            products (list): The list of all products
+            package_size (int): Objects per bulk request (None for default)
+            latency (float): Seconds injected per singular request on the API
+
+        Returns:
+            bool: True if all products were saved, otherwise False
+
+        """
+        sizes = self.prepare(products)
+        logging.info(f"[INFO] Partitions sizes: {sizes}")
+        server = API3Server(("127.0.0.1", 0), latency=latency).start()
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            crashes = list(
+                executor.map(
+                    lambda number: self.run_worker(number, server.url, package_size),
+                    range(self.workers),
+                )
+            )
+        stored = len(server.api._storage)
+        server.shutdown()
+        logging.info(f"[INFO] Crashes of each worker: {crashes}")
+        if -1 in crashes or stored != len(products):
+            logging.error(
+                f"[ERROR] Missing objects: Expected {len(products)} - Stored: {stored}"
+            )
+            return False
+        id_map = self.merge()
+        logging.info(f"[INFO] {stored} objects saved, {len(id_map)} ids mapped")
+        return True
+
+
+def worker(options: argparse.Namespace):
+    """
+    Function to migrate one partition (executed on its own process)
+
+    Exits with signal 1 when the partition is saved, 0 on a crash (by the
+    API) and 3 if the partition couldn't be saved.
+
+    Args:
+        options (argparse.Namespace): The command line options
+
+    """
+    coordinator = Coordinator(0, options.directory)
+    with open(coordinator.partition_path(options.partition), "r") as file:
+        products = json.load(file)
+    challenge = Challenge(
+        bounded_memory=True, api=CrashingAPI3Client(options.api_url, pool_size=1)
+    )
+    challenge.object_log = ObjectLog(coordinator.log_path(options.partition))
+    challenge.LAST_PATH = coordinator.last_path(options.partition)
+    if options.package_size:
+        challenge.PACKAGE_SIZE = options.package_size
+    if not challenge.save_products_bounded(products):
+        os._exit(3)
+    os._exit(1)
+
+
+def main():
+    """
+    Main function to run the coordinator or a worker
+    """
+    parser = argparse.ArgumentParser(description="Partitioned migration")
+    parser.add_argument("command", choices=["run", "worker"], nargs="?", default="run")
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--directory", default="/tmp/partitions")
+    parser.add_argument("--package-size", type=int)
+    parser.add_argument(
+        "--latency", type=float, default=0, help="seconds per singular request"
+    )
+    parser.add_argument("--partition", type=int, help="(worker) partition number")
+    parser.add_argument("--api-url", help="(worker) base URL of the shared API")
+    options = parser.parse_args()
+
+    if options.command == "worker":
+        worker(options)
+
+    with open("product_groups.json", "r") as file:
+        products = json.load(file)
+    # Validate the catalog before any API call, a bad catalog must fail fast
+    if not CatalogValidator().check(products):
+        sys.exit(2)
+    coordinator = Coordinator(options.workers, options.directory)
+    if not coordinator.run(products, options.package_size, options.latency):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+import shelve
+import time
+
+
+class PendingChildrenBuffer:
+    """Class PendingChildrenBuffer to park products that arrive before their parent
+
+    Products whose parent has no new id yet are kept by the missing parent
+    id. When a parent is created, its whole waiting subtree is released at
+    once, grouped by level (the children, then the grandchildren...), so the
+    levels can be created in order.
+
+    When `spill_path` is given and more than `max_in_memory` products are
+    parked, the buffer is moved to a shelve file on disk.
+    """
+
+    def __init__(self, max_in_memory: int = 0, spill_path: str = None):
+        """Function to initialize the class
+
+        Args:
+            max_in_memory (int): Parked products kept in memory before spilling
+            spill_path (str): The path of the spill file (no spill if None)
+
+        """
+        # Parked products by missing parent id: [(product, parked_at), ...]
+        self.waiting = {}
+        self.max_in_memory = max_in_memory
+        self.spill = shelve.open(spill_path, flag="n") if spill_path else None
+        self.in_memory = 0
+        # Metrics
+        self.size = 0
+        self.peak_size = 0
+        self.parked = 0
+        self.spilled = 0
+        self.released = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    def park(self, product: dict):
+        """Function to park a product until its parent is created
+
+        Args:
+            product (dict): The product waiting for its parent
+
+        """
+        self.waiting.setdefault(product["parent_id"], []).append(
+            (product, time.monotonic())
+        )
+        self.in_memory += 1
+        self.size += 1
+        self.parked += 1
+        self.peak_size = max(self.peak_size, self.size)
+        if self.spill is not None and self.in_memory > self.max_in_memory:
+            self.spill_to_disk()
+
+    def spill_to_disk(self):
+        """Function to move the parked products from memory to the spill file"""
+        for parent_identifier, items in self.waiting.items():
+            key = str(parent_identifier)
+            self.spill[key] = self.spill.get(key, []) + items
+        self.spilled += self.in_memory
+        self.waiting = {}
+        self.in_memory = 0
+
+    def pop_children(self, parent_identifier):
+        """Function to remove the products waiting for a parent
+
+        Args:
+            parent_identifier: The source id of the parent
+
+        Returns:
+            items (list): (product, parked_at) tuples
+
+        """
+        items = self.waiting.pop(parent_identifier, [])
+        self.in_memory -= len(items)
+        if self.spill is not None:
+            items += self.spill.pop(str(parent_identifier), [])
+        return items
+
+    def release(self, parent_identifier):
+        """Function to release the subtree waiting for a created parent
+
+        Args:
+            parent_identifier: The source id of the created parent
+
+        Returns:
+            levels (list): Lists of products, levels[0] are the children of
+            the parent, levels[1] their children and so on
+
+        """
+        now = time.monotonic()
+        levels = []
+        parents = [parent_identifier]
+        while parents:
+            level = []
+            for identifier in parents:
+                for product, parked_at in self.pop_children(identifier):
+                    wait = now - parked_at
+                    self.total_wait += wait
+                    self.max_wait = max(self.max_wait, wait)
+                    level.append(product)
+            if not level:
+                break
+            self.size -= len(level)
+            self.released += len(level)
+            levels.append(level)
+            parents = {product["id"] for product in level}
+        return levels
+
+    def missing_parents(self):
+        """Function to get the parent ids that never arrived
+
+        Returns:
+            set: The parent ids with parked products
+
+        """
+        missing = set(self.waiting)
+        if self.spill is not None:
+            missing.update(int(key) for key in self.spill)
+        return missing
+
+    def metrics(self):
+        """Function to get the buffer metrics
+
+        Returns:
+            dict: Current and peak size, parked, spilled and released products,
+            mean and max wait (seconds) of the released products
+
+        """
+        return {
+            "size": self.size,
+            "peak_size": self.peak_size,
+            "parked": self.parked,
+            "spilled": self.spilled,
+            "released": self.released,
+            "mean_wait": self.total_wait / self.released if self.released else 0.0,
+            "max_wait": self.max_wait,
+        }
+
+    def close(self):
+        """Function to close the spill file"""
+        if self.spill is not None:
+            self.spill.close()
@@ -0,0 +1,208 @@
+from api_accounting import API_COSTS
+from bisect import bisect_right
+from tree_snapshot import TreeSnapshot, ancestor_names
+import json
+import logging
+import os
+import shutil
+
+
+class ExecutionPlan:
+    """Class ExecutionPlan to compute the whole migration before any API call
+
+    The plan is a JSON lines file: the first line has the summary (levels,
+    batch boundaries, bytes, cost and expected crashes) and every other line
+    is one batch, with the source ids of its products and the payload
+    already transformed (ancestors resolved, `parent_id` still as the source
+    id, translated to the new id when the batch is created).
+
+    The batches are created in order and the object log says how many
+    products were saved, so a restart goes straight to the next batch of the
+    plan without ordering, resolving or transforming anything again.
+    """
+
+    # Chance of a crash on every API call (see API2._maybe_crash)
+    CRASH_RATE = 0.01
+
+    def __init__(self, path: str = "/tmp/plan.jsonl"):
+        """Function to initialize the class
+
+        Args:
+            path (str): The path of the plan file
+
+        """
+        self.path = path
+        self.summary = None
+
+    def make_batches(self, challenge, product_base: list, workers: int = 1):
+        """Function to split the products into batches of a single level
+
+        With more than one worker the ancestors are resolved by worker
+        processes attached to a shared memory snapshot of the tree.
+
+        Args:
+            challenge: The challenge3.Challenge (PACKAGE_SIZE, MAX_PACKAGE_BYTES)
+            product_base (list): The list of all products
+            workers (int): The number of processes to resolve the ancestors
+
+        Returns:
+            generator: (depth, ids, data) tuples, the source ids and the payload
+            of each batch in creation order
+
+        """
+        index = {product["id"]: product for product in product_base}
+        paths = None
+        if workers > 1:
+            snapshot = TreeSnapshot.publish(product_base)
+            try:
+                paths = dict(
+                    zip(
+                        (product["id"] for product in product_base),
+                        snapshot.map(ancestor_names, workers),
+                    )
+                )
+            finally:
+                snapshot.unlink()
+        depths = challenge.get_depths(index)
+        products = challenge.order_by_depth(product_base, depths)
+        position = 0
+        while position < len(products):
+            level = depths[products[position]["id"]]
+            stop = position
+            end = min(position + challenge.PACKAGE_SIZE, len(products))
+            while stop < end and depths[products[stop]["id"]] == level:
+                stop += 1
+            data = challenge.transform_package(
+                [
+                    {
+                        "name": item["name"],
+                        "parent_id": item["parent_id"],
+                        "ancestors": (
+                            paths[item["id"]]
+                            if paths
+                            else challenge.get_ancestor_names(index, item)
+                        ),
+                    }
+                    for item in products[position:stop]
+                ]
+            )
+            if not data:
+                raise Exception(
+                    "An error occurred on transform_package(). Check the traceback."
+                )
+            # Cut the batch to the objects that fit MAX_PACKAGE_BYTES
+            stop = position + challenge.fit_package(data)
+            yield level, [item["id"] for item in products[position:stop]], data[
+                : stop - position
+            ]
+            position = stop
+
+    def build(self, challenge, product_base: list, workers: int = 1):
+        """Function to compute the plan and write it to the plan file
+
+        Args:
+            challenge: The challenge3.Challenge (PACKAGE_SIZE, MAX_PACKAGE_BYTES)
+            product_base (list): The list of all products
+            workers (int): The number of processes to resolve the ancestors
+
+        Returns:
+            summary (dict): The summary of the plan, or False if it couldn't be
+            written
+
+        """
+        levels = {}
+        boundaries = []
+        sizes = []
+        position = 0
+        # The batches are written first, the summary is only known at the end
+        temporary = self.path + ".tmp"
+        try:
+            with open(temporary, "w") as file:
+                for depth, ids, data in self.make_batches(
+                    challenge, product_base, workers
+                ):
+                    file.write(json.dumps({"depth": depth, "ids": ids, "data": data}))
+                    file.write("\n")
+                    boundaries.append(position)
+                    sizes.append(
+                        2 + sum(challenge.estimate_size(item) for item in data)
+                    )
+                    levels[depth] = levels.get(depth, 0) + len(ids)
+                    position += len(ids)
+            calls = len(boundaries)
+            self.summary = {
+                "total": position,
+                "package_size": challenge.PACKAGE_SIZE,
+                "max_package_bytes": challenge.MAX_PACKAGE_BYTES,
+                "levels": [levels[depth] for depth in sorted(levels)],
+                "batches": calls,
+                "boundaries": boundaries,
+                "payload_bytes": sum(sizes),
+                "max_batch_bytes": max(sizes, default=0),
+                "cost_units": calls * API_COSTS["bulk_create"],
+                # Every call crashes with CRASH_RATE and is repeated after the
+                # restart, so each batch takes 1 / (1 - CRASH_RATE) calls
+                "expected_crashes": calls * self.CRASH_RATE / (1 - self.CRASH_RATE),
+            }
+            with open(self.path + ".new", "w") as target:
+                target.write(json.dumps(self.summary) + "\n")
+                with open(temporary, "r") as source:
+                    shutil.copyfileobj(source, target)
+            os.replace(self.path + ".new", self.path)
+        except Exception as err:
+            logging.error(f"[ERROR] Couldn't write the plan. Traceback: {err}")
+            return False
+        else:
+            return self.summary
+        finally:
+            # The partial files of a failed plan aren't left behind
+            for path in (temporary, self.path + ".new"):
+                if os.path.exists(path):
+                    os.remove(path)
+
+    def load_summary(self):
+        """Function to read the summary of the plan file
+
+        Returns:
+            summary (dict): The summary of the plan
+
+        """
+        with open(self.path, "r") as file:
+            self.summary = json.loads(file.readline())
+        return self.summary
+
+    def batches(self, position: int = 0):
+        """Function to read the batches from the one that starts at a position
+
+        The batches before the position are skipped without being parsed.
+
+        Args:
+            position (int): The number of products already saved
+
+        Returns:
+            generator: The batches (dictionaries with depth, ids and data)
+
+        Raises:
+            Exception: If the position isn't the boundary of a batch
+
+        """
+        if self.summary is None:
+            self.load_summary()
+        boundaries = self.summary["boundaries"]
+        if position >= self.summary["total"]:
+            return
+        batch = bisect_right(boundaries, position) - 1
+        if boundaries[batch] != position:
+            raise Exception(f"Position {position} isn't a batch boundary of the plan")
+        with open(self.path, "r") as file:
+            # The summary and the batches already created
+            for _ in range(batch + 1):
+                file.readline()
+            for line in file:
+                yield json.loads(line)
+
+    def log_summary(self):
+        """Function to log the summary of the plan"""
+        summary = dict(self.summary)
+        summary.pop("boundaries")
+        logging.info(f"[INFO] Execution plan {self.path}: {summary}")
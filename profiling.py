@@ -0,0 +1,240 @@
+from contextlib import contextmanager
+import cProfile
+import functools
+import glob
+import io
+import json
+import logging
+import os
+import pstats
+import sys
+import threading
+import time
+import tracemalloc
+
+
+class PhaseProfiler:
+    """Class PhaseProfiler to profile each phase of the migration
+
+    Every phase (e.g. `get_ancestors`, `bulk_create`) has its own cProfile
+    profile and tracemalloc counters (bytes kept and peak bytes allocated
+    during the phase). Nested phases pause the profile of the outer phase,
+    so each CPU report has only the time spent on that phase.
+
+    The reports are written by `flush()` on files named by the process id,
+    so the results of every execution survive the `os._exit` crashes and
+    `report()` can merge them at the end.
+    """
+
+    # The profiler of the root logger calls, the logger is patched only once
+    # per process (a new profiler is created on every `create_products`)
+    logging_profiler = None
+
+    def __init__(self, directory: str = "/tmp/profile"):
+        """Function to initialize the class
+
+        Args:
+            directory (str): The directory of the report files
+
+        """
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self.pid = os.getpid()
+        self.profiles = {}
+        self.stats = {}
+        # Stack of the active phases of each thread (the concurrent bulk
+        # requests run on executor threads)
+        self.local = threading.local()
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    @property
+    def active(self):
+        """The stack of the active phases of this thread (inner phase on the end)"""
+        if not hasattr(self.local, "active"):
+            self.local.active = []
+        return self.local.active
+
+    @contextmanager
+    def phase(self, name: str):
+        """Function to profile a block of code as a phase
+
+        Args:
+            name (str): The name of the phase
+
+        """
+        # Recursive calls of the same phase are part of the outer call
+        if self.active and self.active[-1] == name:
+            yield
+            return
+        if self.active:
+            self.profiles[self.active[-1]].disable()
+        profile = self.profiles.setdefault(name, cProfile.Profile())
+        stats = self.stats.setdefault(
+            name, {"calls": 0, "seconds": 0.0, "bytes": 0, "peak_bytes": 0}
+        )
+        self.active.append(name)
+        memory_before = tracemalloc.get_traced_memory()[0]
+        if hasattr(tracemalloc, "reset_peak"):
+            tracemalloc.reset_peak()
+        start = time.perf_counter()
+        profile.enable()
+        try:
+            yield
+        finally:
+            profile.disable()
+            current, peak = tracemalloc.get_traced_memory()
+            stats["calls"] += 1
+            stats["seconds"] += time.perf_counter() - start
+            stats["bytes"] += current - memory_before
+            stats["peak_bytes"] = max(stats["peak_bytes"], peak - memory_before)
+            self.active.pop()
+            if self.active:
+                self.profiles[self.active[-1]].enable()
+
+    def wrap(self, name: str, function, flush: bool = False):
+        """Function to wrap a function as a phase
+
+        Args:
+            name (str): The name of the phase
+            function: The function to wrap
+            flush (bool): Flush the reports after each call
+
+        Returns:
+            The wrapped function
+
+        """
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with self.phase(name):
+                result = function(*args, **kwargs)
+            if flush:
+                self.flush()
+            return result
+
+        return wrapper
+
+    def instrument(self, obj, methods: dict, flush: tuple = ()):
+        """Function to replace methods of an object by profiled versions
+
+        Args:
+            obj: The object with the methods
+            methods (dict): The phase name of each method name
+            flush (tuple): The method names that flush the reports after a call
+
+        """
+        for method, name in methods.items():
+            if hasattr(obj, method):
+                function = getattr(obj, method)
+                setattr(obj, method, self.wrap(name, function, method in flush))
+
+    def instrument_challenge(self, challenge):
+        """Function to profile the phases of a challenge
+
+        The reports are flushed after every batch (the checkpoint counter is
+        saved once per batch).
+
+        Args:
+            challenge: A Challenge object (challenge2.py or challenge3.py)
+
+        """
+        self.instrument(
+            challenge,
+            {
+                "get_ancestors": "get_ancestors",
+                "get_ancestor_names": "get_ancestors",
+                "remove_duplicates": "remove_duplicates",
+                "filter_products": "filter_products",
+                "transform_package": "transform_package",
+                "save_objects": "save_objects",
+                "save_last_execution": "save_objects",
+            },
+            flush=("save_last_execution",),
+        )
+        self.instrument(
+            challenge.api,
+            {"create": "create", "bulk_create": "bulk_create"},
+        )
+        self.instrument(challenge.object_log, {"append": "save_objects"})
+        if PhaseProfiler.logging_profiler is None:
+            logger = logging.getLogger()
+            handle = logger.handle
+
+            @functools.wraps(handle)
+            def wrapper(record):
+                with PhaseProfiler.logging_profiler.phase("logging"):
+                    return handle(record)
+
+            logger.handle = wrapper
+        PhaseProfiler.logging_profiler = self
+
+    def flush(self):
+        """Function to write the reports of this process
+
+        Writes `<phase>.<pid>.prof` (pstats format) for each phase and
+        `phases.<pid>.json` with the counters of each phase.
+        """
+        try:
+            for name, profile in self.profiles.items():
+                # The profile of an active phase can't be dumped while enabled
+                if name in self.active:
+                    continue
+                profile.dump_stats(
+                    os.path.join(self.directory, f"{name}.{self.pid}.prof")
+                )
+            path = os.path.join(self.directory, f"phases.{self.pid}.json")
+            with open(path + ".tmp", "w") as file:
+                json.dump(self.stats, file)
+            os.replace(path + ".tmp", path)
+        except Exception as err:
+            logging.error(f"[ERROR] Couldn't flush the profile. Traceback: {err}")
+
+
+def report(directory: str = "/tmp/profile", limit: int = 15):
+    """
+    Function to merge the reports of all executions
+
+    Args:
+        directory (str): The directory of the report files
+        limit (int): Number of functions on the CPU report of each phase
+
+    Returns:
+        text (str): The counters of each phase followed by its CPU report
+
+    """
+    totals = {}
+    for path in glob.glob(os.path.join(directory, "phases.*.json")):
+        with open(path, "r") as file:
+            for name, stats in json.load(file).items():
+                total = totals.setdefault(
+                    name, {"calls": 0, "seconds": 0.0, "bytes": 0, "peak_bytes": 0}
+                )
+                total["calls"] += stats["calls"]
+                total["seconds"] += stats["seconds"]
+                total["bytes"] += stats["bytes"]
+                total["peak_bytes"] = max(total["peak_bytes"], stats["peak_bytes"])
+
+    output = io.StringIO()
+    output.write(
+        f"{'phase':<20} {'calls':>10} {'seconds':>10} {'kept KiB':>10} "
+        f"{'peak KiB':>10}\n"
+    )
+    for name, total in sorted(totals.items(), key=lambda item: -item[1]["seconds"]):
+        output.write(
+            f"{name:<20} {total['calls']:>10} {total['seconds']:>10.3f} "
+            f"{total['bytes'] / 1024:>10.1f} {total['peak_bytes'] / 1024:>10.1f}\n"
+        )
+    for name in totals:
+        files = glob.glob(os.path.join(directory, f"{name}.*.prof"))
+        if not files:
+            continue
+        output.write(f"\n===== {name} =====\n")
+        stats = pstats.Stats(*files, stream=output)
+        stats.sort_stats("cumulative").print_stats(limit)
+    return output.getvalue()
+
+
+if __name__ == "__main__":
+    # Print the merged report of a profile directory
+    print(report(*sys.argv[1:2]))
@@ -0,0 +1,181 @@
+from itertools import islice
+from object_log import ObjectLog
+import argparse
+import json
+import logging
+import os
+import sqlite3
+import sys
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format="%(name)s: %(levelname)s - %(message)s")
+
+
+class ClosureExporter:
+    """Class ClosureExporter to export the created objects to SQLite
+
+    The objects go to the `objects` table and the hierarchy to a closure
+    table, `closure(ancestor, descendant, depth)`, with a row for every
+    ancestor of every object (and the object itself, depth 0), so the
+    ancestors or the descendants of a group are a single indexed query:
+
+        SELECT descendant FROM closure WHERE ancestor = ? AND depth > 0
+
+    The rows are inserted with `executemany` in chunks on a WAL database and
+    the indexes are created after the load.
+    """
+
+    SCHEMA = [
+        "CREATE TABLE objects (id TEXT PRIMARY KEY, name TEXT NOT NULL, "
+        "parent_id TEXT, source_id INTEGER, ancestors TEXT)",
+        "CREATE TABLE closure (ancestor TEXT NOT NULL, descendant TEXT NOT NULL, "
+        "depth INTEGER NOT NULL)",
+    ]
+    INDEXES = [
+        "CREATE UNIQUE INDEX closure_ancestor ON closure (ancestor, depth, descendant)",
+        "CREATE INDEX closure_descendant ON closure (descendant, depth)",
+        "CREATE INDEX objects_parent ON objects (parent_id)",
+        "CREATE INDEX objects_source ON objects (source_id)",
+    ]
+
+    def __init__(self, path: str = "/tmp/catalog.sqlite", chunk_size: int = 10000):
+        """Function to initialize the class
+
+        Args:
+            path (str): The path of the SQLite file (replaced)
+            chunk_size (int): Rows inserted by each executemany
+
+        """
+        self.path = path
+        self.chunk_size = chunk_size
+
+    def insert(self, connection, statement: str, rows):
+        """Function to insert rows in chunks
+
+        Args:
+            connection (sqlite3.Connection): The database
+            statement (str): The INSERT statement
+            rows: Iterable with the rows
+
+        Returns:
+            count (int): The number of rows inserted
+
+        """
+        count = 0
+        rows = iter(rows)
+        while True:
+            chunk = list(islice(rows, self.chunk_size))
+            if not chunk:
+                return count
+            connection.executemany(statement, chunk)
+            count += len(chunk)
+
+    def closure_rows(self, parents: dict):
+        """Function to get the rows of the closure table
+
+        Args:
+            parents (dict): The parent id of each object id (None for roots)
+
+        Returns:
+            generator: (ancestor, descendant, depth) tuples
+
+        Raises:
+            Exception: If a parent isn't one of the objects, or on a cycle
+
+        """
+        for identifier in parents:
+            yield identifier, identifier, 0
+            depth = 0
+            current = parents[identifier]
+            while current is not None:
+                depth += 1
+                if current not in parents:
+                    raise Exception(f"Parent {current} of {identifier} not exported")
+                if depth > len(parents):
+                    raise Exception(f"Cycle on the ancestors of {identifier}")
+                yield current, identifier, depth
+                current = parents[current]
+
+    def export(self, records):
+        """Function to write the objects and the closure table
+
+        Args:
+            records: Iterable with (source_id, object) tuples, like an ObjectLog
+
+        Returns:
+            counts (dict): The number of objects and closure rows
+
+        """
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(self.path + suffix):
+                os.remove(self.path + suffix)
+        connection = sqlite3.connect(self.path)
+        try:
+            connection.execute("PRAGMA journal_mode=WAL")
+            # The file is rebuilt from scratch if the export fails
+            connection.execute("PRAGMA synchronous=OFF")
+            for statement in self.SCHEMA:
+                connection.execute(statement)
+            parents = {}
+
+            def objects():
+                for source_id, obj in records:
+                    parents[obj["id"]] = obj.get("parent_id")
+                    ancestors = obj.get("ancestors")
+                    yield (
+                        obj["id"],
+                        obj["name"],
+                        obj.get("parent_id"),
+                        source_id,
+                        json.dumps(ancestors) if ancestors is not None else None,
+                    )
+
+            with connection:
+                count = self.insert(
+                    connection, "INSERT INTO objects VALUES (?, ?, ?, ?, ?)", objects()
+                )
+                rows = self.insert(
+                    connection,
+                    "INSERT INTO closure VALUES (?, ?, ?)",
+                    self.closure_rows(parents),
+                )
+            # Indexes after the load, faster than keeping them while inserting
+            with connection:
+                for statement in self.INDEXES:
+                    connection.execute(statement)
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.execute("ANALYZE")
+        finally:
+            connection.close()
+        return {"objects": count, "closure": rows}
+
+
+def main():
+    """
+    Main function to export the objects of the last migration
+
+    Returns:
+        bool: True if the export completed, otherwise False
+
+    """
+    parser = argparse.ArgumentParser(description="Export the objects to SQLite")
+    parser.add_argument("--output", default="/tmp/catalog.sqlite")
+    # Only the object log has the new parent ids (the legacy mode sends the
+    # source parent ids to the API)
+    parser.add_argument("--log", default="/tmp/objects.log")
+    options = parser.parse_args()
+
+    try:
+        counts = ClosureExporter(options.output).export(ObjectLog(options.log))
+    except Exception as err:
+        logging.error(f"[ERROR] Couldn't export the objects. Traceback: {err}")
+        return False
+    logging.info(
+        f"[INFO] {counts['objects']} objects and {counts['closure']} closure rows "
+        f"written to {options.output}"
+    )
+    return True
+
+
+if __name__ == "__main__":
+    sys.exit(0 if main() else 1)
@@ -0,0 +1,278 @@
+from object_log import ObjectLog
+import argparse
+import json
+import logging
+import sys
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format="%(name)s: %(levelname)s - %(message)s")
+
+
+class SubtreeUpdater:
+    """Class SubtreeUpdater to propagate renames and moves to the migrated data
+
+    A rename changes the name of a group and the `ancestors` of all its
+    descendants, a move changes the parent of a group and the `ancestors`
+    of the group and all its descendants. Only those groups are visited (a
+    child index gives the subtree of each group), and an update payload is
+    emitted for each of their migrated objects, so the cost is proportional
+    to the size of the subtrees instead of the catalog.
+
+    Operations are dictionaries:
+
+        {"op": "rename", "id": 2000, "name": "New name"}
+        {"op": "move", "id": 2000, "parent_id": 404}  (None to make it a root)
+    """
+
+    def __init__(self, products: list, id_map: dict = None):
+        """Function to initialize the class
+
+        Args:
+            products (list): The source catalog
+            id_map (dict): The new ids of the migrated objects of each source
+            id (None to emit the updates with the source ids)
+
+        """
+        self.names = {}
+        self.parents = {}
+        for product in products:
+            self.names.setdefault(product["id"], product["name"])
+            self.parents.setdefault(product["id"], product["parent_id"])
+        # Direct children of each group: `children_ids` has all descendants,
+        # only the ones pointing back with their parent_id are direct children
+        self.children = {identifier: [] for identifier in self.names}
+        for product in products:
+            if self.children[product["id"]]:
+                continue
+            for child in product["children_ids"]:
+                if self.parents.get(child) == product["id"]:
+                    self.children[product["id"]].append(child)
+        # Children missing from `children_ids` of their parent
+        for identifier, parent in self.parents.items():
+            if parent is not None and identifier not in self.children[parent]:
+                self.children[parent].append(identifier)
+        self.id_map = id_map
+        self.affected = set()
+
+    def subtree(self, identifier):
+        """Function to get a group and all its descendants
+
+        Args:
+            identifier: The source id of the group
+
+        Returns:
+            nodes (list): The ids of the subtree, parents before children
+
+        """
+        nodes = [identifier]
+        for node in nodes:
+            nodes.extend(self.children[node])
+        return nodes
+
+    def rename(self, identifier, name: str):
+        """Function to rename a group
+
+        Args:
+            identifier: The source id of the group
+            name (str): The new name
+
+        """
+        self.names[identifier] = name
+        # The group itself gets the new name, the descendants the new ancestors
+        self.affected.update(self.subtree(identifier))
+
+    def move(self, identifier, parent_id):
+        """Function to move a group (and its subtree) to another parent
+
+        Args:
+            identifier: The source id of the group
+            parent_id: The source id of the new parent (None for a root)
+
+        Raises:
+            Exception: If the new parent is on the subtree of the group
+
+        """
+        nodes = self.subtree(identifier)
+        if parent_id is not None and parent_id in set(nodes):
+            raise Exception(f"Can't move {identifier} under its descendant {parent_id}")
+        old_parent = self.parents[identifier]
+        if old_parent is not None:
+            self.children[old_parent].remove(identifier)
+        if parent_id is not None:
+            self.children[parent_id].append(identifier)
+        self.parents[identifier] = parent_id
+        self.affected.update(nodes)
+
+    def apply(self, operation: dict):
+        """Function to apply an operation
+
+        Args:
+            operation (dict): A rename or move operation
+
+        Raises:
+            Exception: If the operation or its groups are unknown
+
+        """
+        identifier = operation["id"]
+        if identifier not in self.names:
+            raise Exception(f"Unknown group {identifier}")
+        if operation["op"] == "rename":
+            self.rename(identifier, operation["name"])
+        elif operation["op"] == "move":
+            if (
+                operation["parent_id"] is not None
+                and operation["parent_id"] not in self.names
+            ):
+                raise Exception(f"Unknown parent {operation['parent_id']}")
+            self.move(identifier, operation["parent_id"])
+        else:
+            raise Exception(f"Unknown operation {operation['op']}")
+
+    def ancestor_names(self, identifier):
+        """Function to get the names of the ancestors of a group
+
+        Args:
+            identifier: The source id of the group
+
+        Returns:
+            names (list): The ancestors names, from the root to the parent
+
+        """
+        names = []
+        parent = self.parents[identifier]
+        while parent is not None:
+            names.append(self.names[parent])
+            parent = self.parents[parent]
+        names.reverse()
+        return names
+
+    def updates(self):
+        """Function to get the update payloads of the affected groups
+
+        The ancestors of the top of each affected subtree are resolved once
+        and extended on the way down.
+
+        Returns:
+            generator: The payloads (id, name, parent_id and ancestors) of every
+            migrated object of the affected groups, parents before children
+
+        """
+        for top in self.affected:
+            parent = self.parents[top]
+            # Every descendant of an affected group is affected, the subtrees
+            # start on the groups with a parent that isn't
+            if parent in self.affected:
+                continue
+            paths = {top: self.ancestor_names(top)}
+            for node in self.subtree(top):
+                parent = self.parents[node]
+                if node not in paths:
+                    paths[node] = paths[parent] + [self.names[parent]]
+                parent_ids = self.new_ids(parent) if parent is not None else [None]
+                for new_id in self.new_ids(node):
+                    yield {
+                        "id": new_id,
+                        "name": self.names[node],
+                        "parent_id": parent_ids[0],
+                        "ancestors": paths[node] or None,
+                    }
+
+    def new_ids(self, identifier):
+        """Function to get the ids of the migrated objects of a group
+
+        Args:
+            identifier: The source id of the group
+
+        Returns:
+            list: The new ids (the source id if there is no id map)
+
+        """
+        if self.id_map is None:
+            return [identifier]
+        return self.id_map.get(identifier, [])
+
+    def batches(self, size: int):
+        """Function to split the update payloads into batches
+
+        Args:
+            size (int): The maximum number of payloads of a batch
+
+        Returns:
+            generator: Lists of up to `size` payloads
+
+        """
+        batch = []
+        for payload in self.updates():
+            batch.append(payload)
+            if len(batch) == size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+
+def load_id_map(log: ObjectLog):
+    """
+    Function to get the new ids of each source id from an object log
+
+    Args:
+        log (ObjectLog): The object log of the migration
+
+    Returns:
+        id_map (dict): The new ids of each source id, in creation order
+
+    """
+    id_map = {}
+    for source_id, obj in log:
+        id_map.setdefault(source_id, []).append(obj["id"])
+    return id_map
+
+
+def main():
+    """
+    Main function to write the update batches of a file of operations
+
+    Returns:
+        bool: True if the updates were written, otherwise False
+
+    """
+    parser = argparse.ArgumentParser(description="Propagate renames and moves")
+    parser.add_argument("operations", help="JSON lines file with the operations")
+    parser.add_argument("--catalog", default="product_groups.json")
+    parser.add_argument(
+        "--log",
+        default="/tmp/objects.log",
+        help="object log with the new ids (empty for the source ids)",
+    )
+    parser.add_argument("--output", default="/tmp/updates.jsonl")
+    parser.add_argument("--package-size", type=int, default=500)
+    options = parser.parse_args()
+
+    try:
+        with open(options.catalog, "r") as file:
+            products = json.load(file)
+        id_map = load_id_map(ObjectLog(options.log)) if options.log else None
+        updater = SubtreeUpdater(products, id_map)
+        with open(options.operations, "r") as file:
+            for line in file:
+                if line.strip():
+                    updater.apply(json.loads(line))
+        count = 0
+        batches = 0
+        with open(options.output, "w") as file:
+            for batch in updater.batches(options.package_size):
+                file.write(json.dumps(batch) + "\n")
+                count += len(batch)
+                batches += 1
+    except Exception as err:
+        logging.error(f"[ERROR] Couldn't propagate the operations. Traceback: {err}")
+        return False
+    logging.info(
+        f"[INFO] {len(updater.affected)} groups affected, {count} updates in "
+        f"{batches} batches written to {options.output}"
+    )
+    return True
+
+
+if __name__ == "__main__":
+    sys.exit(0 if main() else 1)
@@ -0,0 +1,103 @@
+from ancestor_cache import AncestorCache
+from api3_http import StableAPI3
+import challenge3
+import json
+import os
+import pytest
+
+CATALOG = os.path.join(
+    os.path.dirname(os.path.dirname(__file__)), "product_groups.json"
+)
+
+
+class SentAPI(StableAPI3):
+    """API3 without crashes that keeps the names and ancestors names sent"""
+
+    def __init__(self):
+        super().__init__()
+        self.sent = []
+
+    def keep(self, data: dict):
+        ancestors = [ancestor["name"] for ancestor in data["ancestors"] or []]
+        self.sent.append((data["name"], ancestors))
+
+    def create(self, data: dict):
+        self.keep(data)
+        return super().create(data)
+
+    def bulk_create(self, data: list):
+        for item in data:
+            self.keep(item)
+        return super().bulk_create(data)
+
+
+def load_catalog(size: int):
+    with open(CATALOG, "r") as file:
+        products = json.load(file)[:size]
+    # Keep only the products with all their ancestors on the catalog
+    while True:
+        identifiers = {product["id"] for product in products}
+        kept = [
+            product
+            for product in products
+            if product["parent_id"] is None or product["parent_id"] in identifiers
+        ]
+        if len(kept) == len(products):
+            return kept
+        products = kept
+
+
+def migrate(products: list, tmp_path, cache: AncestorCache):
+    # Bounded memory skips loading the default backup files, the legacy mode is
+    # run on backup files of the test
+    challenge = challenge3.Challenge(bounded_memory=True)
+    challenge.bounded_memory = False
+    challenge.api = SentAPI()
+    challenge.OBJECTS_PATH = str(tmp_path / "objects.bkp")
+    challenge.LAST_PATH = str(tmp_path / "last.bkp")
+    challenge.save_objects()
+    challenge.save_last_execution(0)
+    challenge.PACKAGE_SIZE = 100
+    challenge.ancestor_cache = cache
+    independent, dependent = challenge.filter_products(products)
+    assert challenge.save_independent_products(independent)
+    assert challenge.save_dependent_products(dependent, products, len(independent))
+    return challenge.api.sent
+
+
+@pytest.mark.parametrize("entries", [100000, 50])
+def test_same_output_with_and_without_cache(entries, tmp_path):
+    products = load_catalog(2000)
+    cache = AncestorCache(entries)
+    without_cache = migrate(products, tmp_path / "plain", None)
+    with_cache = migrate(products, tmp_path / "cached", cache)
+    assert with_cache == without_cache
+
+
+def test_validate_drops_chains_of_another_version():
+    cache = AncestorCache()
+    cache.validate(1)
+    cache.put(404, [{"name": "various", "id": "a"}])
+    cache.validate(1)
+    assert cache.get(404) == [{"name": "various", "id": "a"}]
+    cache.validate(2)
+    assert cache.get(404) is None
+    assert cache.stats()["invalidations"] == 1
+
+
+def test_forget_drops_only_the_chains_of_a_name():
+    cache = AncestorCache()
+    cache.put(1, ["chain of 1"], {"oil", "various"})
+    cache.put(2, ["chain of 2"], {"wine"})
+    cache.forget({"various"})
+    assert cache.get(1) is None
+    assert cache.get(2) == ["chain of 2"]
+    assert cache.stats()["invalidations"] == 1
+
+
+def test_cache_hits_across_packages(tmp_path):
+    # The chains are kept across the packages until an object with one of
+    # their names is saved
+    cache = AncestorCache(100000)
+    migrate(load_catalog(2000), tmp_path, cache)
+    assert cache.stats()["hits"]
@@ -0,0 +1,55 @@
+from api3_http import API3Client, API3Server
+from async_engine import AsyncAPI3Client
+import asyncio
+import pytest
+import time
+
+
+def test_timeout_is_not_sent_again():
+    # One bulk request takes 5 x 0.1s on the server, the client waits 0.2s
+    server = API3Server(("127.0.0.1", 0), latency=0.1).start()
+    client = API3Client(server.url, pool_size=1, timeout=0.2)
+    try:
+        with pytest.raises(TimeoutError):
+            client.bulk_create([{"name": "beets", "parent_id": None}])
+        # Wait for the server to finish the request
+        time.sleep(1.5)
+        assert len(server.api._storage) == 1
+    finally:
+        client.close()
+        server.shutdown()
+
+
+def test_closed_keep_alive_connection_is_reopened():
+    server = API3Server(("127.0.0.1", 0)).start()
+    client = API3Client(server.url, pool_size=1)
+    try:
+        client.bulk_create([{"name": "beets", "parent_id": None}])
+        # The server closes the kept-alive connection meanwhile
+        connection = client.pool.get()
+        connection.sock.shutdown(2)
+        client.pool.put(connection)
+        assert len(client.bulk_create([{"name": "swine", "parent_id": None}])) == 1
+        assert len(server.api._storage) == 2
+    finally:
+        client.close()
+        server.shutdown()
+
+
+def test_async_timeout_is_not_sent_again():
+    server = API3Server(("127.0.0.1", 0), latency=0.1).start()
+    client = AsyncAPI3Client(server.url, pool_size=1, timeout=0.2)
+
+    async def create():
+        try:
+            await client.bulk_create([{"name": "beets", "parent_id": None}])
+        finally:
+            await client.close()
+
+    try:
+        with pytest.raises(asyncio.TimeoutError):
+            asyncio.run(create())
+        time.sleep(1.5)
+        assert len(server.api._storage) == 1
+    finally:
+        server.shutdown()
@@ -0,0 +1,42 @@
+from api3_http import StableAPI3
+from api_recording import RecordingAPI, ReplayAPI, read_recording
+
+
+class ConcurrentAPI(StableAPI3):
+    """API3 without crashes that keeps the groups of concurrent packages"""
+
+    def __init__(self):
+        super().__init__()
+        self.groups = []
+
+    def bulk_create_many(self, packages: list):
+        self.groups.append(len(packages))
+        return [self.bulk_create(package) for package in packages]
+
+
+def packages():
+    return [
+        [{"name": f"group {number}.{item}"} for item in range(number)]
+        for number in (1, 2, 3)
+    ]
+
+
+def test_recording_keeps_the_concurrent_requests(tmp_path):
+    path = str(tmp_path / "recording.jsonl")
+    api = ConcurrentAPI()
+    results = RecordingAPI(api, path).bulk_create_many(packages())
+    # One group of 3 requests, recorded as 3 calls in package order
+    assert api.groups == [3]
+    calls = read_recording(path)
+    assert [call["size"] for call in calls] == [1, 2, 3]
+    assert [call["ids"] for call in calls] == [
+        [obj["id"] for obj in result] for result in results
+    ]
+
+
+def test_replay_of_concurrent_requests(tmp_path):
+    path = str(tmp_path / "recording.jsonl")
+    results = RecordingAPI(ConcurrentAPI(), path).bulk_create_many(packages())
+    replay = ReplayAPI(path, str(tmp_path / "replay.cursor"))
+    assert replay.bulk_create_many(packages()) == results
+    assert replay.summary()["mismatches"] == 0
@@ -0,0 +1,98 @@
+from api3_http import StableAPI3
+from collections import Counter
+from framing import FrameCodec
+from object_log import ObjectLog
+import challenge3
+import json
+import os
+import pytest
+
+CATALOG = os.path.join(
+    os.path.dirname(os.path.dirname(__file__)), "product_groups.json"
+)
+
+
+class CrashingAPI(StableAPI3):
+    """API3 that crashes on the bulk request after `calls` of them"""
+
+    def __init__(self, calls: int):
+        super().__init__()
+        self.calls = calls
+
+    def bulk_create(self, data: list):
+        if not self.calls:
+            raise Exception("API crashed")
+        self.calls -= 1
+        return super().bulk_create(data)
+
+
+def record(number: int):
+    return number, {"id": f"new-{number}", "name": f"group {number}"}
+
+
+def cut(path: str, size: int):
+    # A crash while appending leaves only the start of the last line or frame
+    os.truncate(path, os.path.getsize(path) - size)
+
+
+@pytest.mark.parametrize("codec", [None, FrameCodec("zlib")])
+def test_repair_discards_a_cut_final_record(codec, tmp_path):
+    path = str(tmp_path / "objects.log")
+    log = ObjectLog(path, codec=codec)
+    for number in (1, 2, 3):
+        assert log.append([record(number)])
+    complete = os.path.getsize(path)
+    assert log.append([record(4)])
+    cut(path, 5)
+
+    log = ObjectLog(path, codec=codec)
+    assert [source_id for source_id, _ in log] == [1, 2, 3]
+    log.repair()
+    assert os.path.getsize(path) == complete
+    assert log.append([record(5)])
+    assert [source_id for source_id, _ in ObjectLog(path)] == [1, 2, 3, 5]
+
+
+def test_cut_frame_is_repaired_before_the_next_append(tmp_path):
+    path = str(tmp_path / "objects.log")
+    log = ObjectLog(path, codec=FrameCodec("zlib"))
+    assert log.append([record(1)])
+    assert log.append([record(2)])
+    cut(path, 1)
+
+    log = ObjectLog(path, codec=FrameCodec("zlib"))
+    assert log.count() == 1
+    # The first append truncates the cut frame, the new one is readable
+    assert log.append([record(3)])
+    assert [source_id for source_id, _ in ObjectLog(path)] == [1, 3]
+
+
+def migrate(api, tmp_path, codec):
+    challenge = challenge3.Challenge(bounded_memory=True)
+    challenge.api = api
+    challenge.codec = codec
+    challenge.object_log = ObjectLog(str(tmp_path / "objects.log"), codec=codec)
+    challenge.LAST_PATH = str(tmp_path / "last.bkp")
+    challenge.PACKAGE_SIZE = 100
+    with open(CATALOG, "r") as file:
+        products = json.load(file)
+    return challenge.save_products_bounded(products), products
+
+
+@pytest.mark.parametrize("codec", [None, FrameCodec("zlib")])
+def test_resume_after_a_crash_while_appending(codec, tmp_path):
+    saved, products = migrate(CrashingAPI(30), tmp_path, codec)
+    assert not saved
+    cut(str(tmp_path / "objects.log"), 7)
+
+    saved, products = migrate(StableAPI3(), tmp_path, codec)
+    assert saved
+    log = list(ObjectLog(str(tmp_path / "objects.log")))
+    # Every record of the catalog is on the log once, with its parent created
+    assert Counter(source_id for source_id, _ in log) == Counter(
+        product["id"] for product in products
+    )
+    identifiers = {obj["id"] for _, obj in log}
+    assert all(
+        obj["parent_id"] in identifiers for _, obj in log if obj.get("parent_id")
+    )
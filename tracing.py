@@ -0,0 +1,243 @@
+from contextlib import contextmanager
+from subprocess import call
+import argparse
+import functools
+import json
+import os
+import threading
+import time
+
+
+class TraceRecorder:
+    """Class TraceRecorder to write a timeline in Chrome trace event format
+
+    Every phase of the migration (parse, plan, resolve, transform, API calls
+    and checkpoints) is a complete event ("X") with the process id, thread
+    id and wall clock timestamps, so the events of every execution (and of
+    the runner, with the crashes and restarts) share one timeline.
+
+    The events are appended to one file, one per line, after a "[" written
+    by `reset()` (or by the first event of a new or empty file). The array is never closed (a crash can happen at any
+    time), which the trace viewers (chrome://tracing, Perfetto) accept.
+    Events shorter than `min_duration` seconds are dropped, so the calls
+    made for every product don't flood the file.
+    """
+
+    # Phase (category) of each method of a challenge
+    PHASES = {
+        "get_products": "parse",
+        "filter_products": "plan",
+        "get_depths": "plan",
+        "order_by_depth": "plan",
+        "count_pending_children": "plan",
+        "load_id_map": "plan",
+        "load_created": "plan",
+        "source_keys": "plan",
+        "get_ancestors": "resolve",
+        "get_ancestor_names": "resolve",
+        "add_ancestors": "resolve",
+        "build_package": "resolve",
+        "transform_package": "transform",
+        "pack_products": "transform",
+        "save_objects": "checkpoint",
+        "save_last_execution": "checkpoint",
+    }
+    API_METHODS = ("create", "bulk_create", "bulk_create_many", "get_by_keys")
+
+    def __init__(self, path: str = "/tmp/trace.json", min_duration: float = 0.0001):
+        """Function to initialize the class
+
+        Args:
+            path (str): The path of the trace file (appended)
+            min_duration (float): The shortest event written (seconds)
+
+        """
+        self.path = path
+        self.min_duration = min_duration
+        self.pid = os.getpid()
+        self.file = None
+
+    def reset(self):
+        """Function to start a new trace file"""
+        with open(self.path, "w") as file:
+            file.write("[\n")
+
+    def now(self):
+        """Function to get the timestamp of the trace (microseconds)"""
+        return time.time() * 1e6
+
+    def write(self, event: dict):
+        """Function to append an event (flushed, a crash may come next)
+
+        Args:
+            event (dict): The trace event
+
+        """
+        if self.file is None:
+            # Line buffered, every event reaches the file before a crash
+            self.file = open(self.path, "a", buffering=1)
+            # A trace not started by the runner opens the array itself
+            if not self.file.tell():
+                self.file.write("[\n")
+        event.setdefault("pid", self.pid)
+        event.setdefault("tid", threading.get_ident() % 1000000)
+        self.file.write(json.dumps(event) + ",\n")
+
+    def process_name(self, name: str):
+        """Function to name the process of this recorder on the timeline
+
+        Args:
+            name (str): The name of the process
+
+        """
+        self.write({"name": "process_name", "ph": "M", "args": {"name": name}})
+
+    def instant(self, name: str, args: dict = None, scope: str = "p"):
+        """Function to write an instant event (e.g. a crash)
+
+        Args:
+            name (str): The name of the event
+            args (dict): The arguments shown with the event
+            scope (str): "g" (all processes), "p" (process) or "t" (thread)
+
+        """
+        self.write(
+            {"name": name, "ph": "i", "s": scope, "ts": self.now(), "args": args or {}}
+        )
+
+    def complete(
+        self, name: str, category: str, start: float, end: float, args: dict = None
+    ):
+        """Function to write a complete event
+
+        Args:
+            name (str): The name of the event
+            category (str): The category (phase) of the event
+            start (float): The timestamp of the start (microseconds)
+            end (float): The timestamp of the end (microseconds)
+            args (dict): The arguments shown with the event
+
+        """
+        if end - start < self.min_duration * 1e6:
+            return
+        self.write(
+            {
+                "name": name,
+                "cat": category,
+                "ph": "X",
+                "ts": start,
+                "dur": end - start,
+                "args": args or {},
+            }
+        )
+
+    @contextmanager
+    def phase(self, name: str, category: str = None):
+        """Function to trace a block of code as a complete event
+
+        Args:
+            name (str): The name of the event
+            category (str): The category (default the name)
+
+        """
+        start = self.now()
+        try:
+            yield
+        finally:
+            self.complete(name, category or name, start, self.now())
+
+    def wrap(self, name: str, category: str, function):
+        """Function to wrap a function as a complete event
+
+        Args:
+            name (str): The name of the event
+            category (str): The category of the event
+            function: The function to wrap
+
+        Returns:
+            The wrapped function
+
+        """
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with self.phase(name, category):
+                return function(*args, **kwargs)
+
+        return wrapper
+
+    def instrument(self, obj, methods: dict):
+        """Function to replace methods of an object by traced versions
+
+        Args:
+            obj: The object with the methods
+            methods (dict): The category of each method name
+
+        """
+        for method, category in methods.items():
+            if hasattr(obj, method):
+                setattr(obj, method, self.wrap(method, category, getattr(obj, method)))
+
+    def instrument_challenge(self, challenge):
+        """Function to trace the phases of a challenge
+
+        Args:
+            challenge: A Challenge object (challenge2.py or challenge3.py)
+
+        """
+        self.instrument(challenge, self.PHASES)
+        self.instrument(challenge.api, {method: "api" for method in self.API_METHODS})
+        self.instrument(challenge.object_log, {"append": "checkpoint"})
+
+    def close(self):
+        """Function to close the trace file"""
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+
+def runner_tracer(argv: list, name: str):
+    """
+    Function to start the trace of a runner if `--trace` is on its options
+
+    Args:
+        argv (list): The command line arguments forwarded to the challenge
+        name (str): The name of the runner process on the timeline
+
+    Returns:
+        tracer (TraceRecorder): The trace of the runner, None if disabled
+
+    """
+    parser = argparse.ArgumentParser(add_help=False)
+    parser.add_argument("--trace", nargs="?", const="/tmp/trace.json")
+    options, _ = parser.parse_known_args(argv)
+    if not options.trace:
+        return None
+    # The executions are always traced, however short
+    tracer = TraceRecorder(options.trace, min_duration=0)
+    tracer.reset()
+    tracer.process_name(name)
+    return tracer
+
+
+def run_traced(command: list, tracer: TraceRecorder = None):
+    """
+    Function to execute a challenge once, traced as an execution
+
+    Args:
+        command (list): The command of the challenge
+        tracer (TraceRecorder): The trace of the runner (None to disable)
+
+    Returns:
+        status (int): The exit status of the challenge
+
+    """
+    if not tracer:
+        return call(command)
+    start = tracer.now()
+    status = call(command)
+    tracer.complete("execution", "runner", start, tracer.now(), {"status": status})
+    # Signal 0 is a crash, the next execution is a restart
+    if not status:
+        tracer.instant("crash", scope="g")
+    return status
@@ -0,0 +1,211 @@
+from concurrent.futures import ProcessPoolExecutor
+import struct
+
+try:
+    # Python 3.8+
+    from multiprocessing import shared_memory
+except ImportError:
+    shared_memory = None
+
+
+class TreeSnapshot:
+    """Class TreeSnapshot to share the product tree with worker processes
+
+    The catalog is published once into a shared memory block as flat arrays,
+    so a worker attaches to it by name instead of receiving a pickled copy
+    of the products:
+
+        count, blob size (2 x 8 bytes)
+        ids (count x int64)
+        parent indices (count x int64, -1 for the roots)
+        name offsets (count + 1 x uint64) on the name blob
+        name blob (the UTF-8 names, one after the other)
+
+    The parent index is the position of the first product with the parent
+    id (duplicated products are the same product group).
+    """
+
+    HEADER = struct.Struct("<QQ")
+
+    def __init__(self, memory):
+        """Function to initialize the class (use publish() or attach())
+
+        Args:
+            memory (shared_memory.SharedMemory): The shared memory block
+
+        """
+        self.memory = memory
+        self.name = memory.name
+        count, blob_size = self.HEADER.unpack_from(memory.buf)
+        self.count = count
+        # Views of the arrays on the block, nothing is copied
+        offset = self.HEADER.size
+        self.ids = memory.buf[offset : offset + 8 * count].cast("q")
+        offset += 8 * count
+        self.parents = memory.buf[offset : offset + 8 * count].cast("q")
+        offset += 8 * count
+        self.offsets = memory.buf[offset : offset + 8 * (count + 1)].cast("Q")
+        offset += 8 * (count + 1)
+        self.blob = memory.buf[offset : offset + blob_size]
+
+    @classmethod
+    def publish(cls, products: list):
+        """Function to write the products into a new shared memory block
+
+        Args:
+            products (list): The list of all products
+
+        Returns:
+            snapshot (TreeSnapshot): The snapshot, owner of the block
+
+        Raises:
+            Exception: If shared memory isn't available (Python < 3.8)
+
+        """
+        if shared_memory is None:
+            raise Exception("Shared memory snapshots need Python 3.8 or newer")
+        positions = {}
+        for position, product in enumerate(products):
+            positions.setdefault(product["id"], position)
+        names = [product["name"].encode() for product in products]
+        count = len(products)
+        blob_size = sum(len(name) for name in names)
+        size = cls.HEADER.size + 8 * (3 * count + 1) + blob_size
+        memory = shared_memory.SharedMemory(create=True, size=max(size, 1))
+        cls.HEADER.pack_into(memory.buf, 0, count, blob_size)
+        offset = cls.HEADER.size
+        parents = [
+            -1 if product["parent_id"] is None else positions[product["parent_id"]]
+            for product in products
+        ]
+        name_offsets = [0]
+        for name in names:
+            name_offsets.append(name_offsets[-1] + len(name))
+        for layout, values in (
+            ("q", [product["id"] for product in products]),
+            ("q", parents),
+            ("Q", name_offsets),
+        ):
+            struct.pack_into(f"<{len(values)}{layout}", memory.buf, offset, *values)
+            offset += 8 * len(values)
+        memory.buf[offset : offset + blob_size] = b"".join(names)
+        return cls(memory)
+
+    @classmethod
+    def attach(cls, name: str):
+        """Function to attach to a published snapshot (read only use)
+
+        Args:
+            name (str): The name of the shared memory block
+
+        Returns:
+            snapshot (TreeSnapshot): The snapshot
+
+        """
+        return cls(shared_memory.SharedMemory(name=name))
+
+    def __len__(self):
+        """Function to get the number of products"""
+        return self.count
+
+    def product_name(self, position: int):
+        """Function to get the name of a product
+
+        Args:
+            position (int): The position of the product on the catalog
+
+        Returns:
+            str: The name of the product
+
+        """
+        return bytes(
+            self.blob[self.offsets[position] : self.offsets[position + 1]]
+        ).decode()
+
+    def ancestor_names(self, position: int):
+        """Function to get the names of all ancestors of a product
+
+        Args:
+            position (int): The position of the product on the catalog
+
+        Returns:
+            names (list): The ancestors names, from the root to the parent
+
+        """
+        names = []
+        parent = self.parents[position]
+        while parent != -1:
+            names.append(self.product_name(parent))
+            parent = self.parents[parent]
+        names.reverse()
+        return names
+
+    def ranges(self, workers: int):
+        """Function to split the products into one range for each worker
+
+        Args:
+            workers (int): The number of workers
+
+        Returns:
+            ranges (list): (start, stop) positions of each range
+
+        """
+        bounds = [self.count * number // workers for number in range(workers + 1)]
+        return [
+            (start, stop) for start, stop in zip(bounds, bounds[1:]) if stop > start
+        ]
+
+    def map(self, function, workers: int):
+        """Function to run a function on ranges of products in worker processes
+
+        Only the name of the block and the range go to each worker.
+
+        Args:
+            function: Module level function called as function(name, start, stop)
+            that returns a list
+            workers (int): The number of worker processes
+
+        Returns:
+            results (list): The results of all ranges, in catalog order
+
+        """
+        results = []
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = [
+                executor.submit(function, self.name, start, stop)
+                for start, stop in self.ranges(workers)
+            ]
+            for future in futures:
+                results.extend(future.result())
+        return results
+
+    def close(self):
+        """Function to release the views and detach from the block"""
+        for view in (self.ids, self.parents, self.offsets, self.blob):
+            view.release()
+        self.memory.close()
+
+    def unlink(self):
+        """Function to release and remove the block (owner only)"""
+        self.close()
+        self.memory.unlink()
+
+
+def ancestor_names(name: str, start: int, stop: int):
+    """
+    Function to get the ancestors names of a range of products (on a worker)
+
+    Args:
+        name (str): The name of the shared memory block
+        start (int): The position of the first product
+        stop (int): The position after the last product
+
+    Returns:
+        names (list): The ancestors names of each product of the range
+
+    """
+    snapshot = TreeSnapshot.attach(name)
+    try:
+        return [snapshot.ancestor_names(position) for position in range(start, stop)]
+    finally:
+        snapshot.close()
@@ -0,0 +1,221 @@
+import json
+import logging
+import sys
+
+
+class CatalogValidator:
+    """Class CatalogValidator to check a product catalog before the migration
+
+    All checks are made with dictionaries and a single walk up the tree per
+    product, so a bad catalog is found before any API call is made.
+
+    Errors (the catalog can't be migrated):
+        orphans: Products whose `parent_id` doesn't exist
+        cycles: Products whose chain of parents never reaches a root
+        conflicting_ids: Ids used by products with different content
+
+    Warnings (the catalog can be migrated):
+        duplicated_ids: Ids of identical products listed more than once
+        missing_children: (parent_id, id) pairs where the parent doesn't list
+        the product on its `children_ids`
+        wrong_children: (id, child_id) pairs where the listed child doesn't
+        exist or isn't a descendant of the product
+    """
+
+    ERRORS = ("orphans", "cycles", "conflicting_ids")
+    WARNINGS = ("duplicated_ids", "missing_children", "wrong_children")
+
+    def __init__(self, strict: bool = False):
+        """Function to initialize the class
+
+        Args:
+            strict (bool): Handle the warnings as errors
+
+        """
+        self.strict = strict
+
+    def index_products(self, products: list, report: dict):
+        """Function to index products by id and find the duplicated ids
+
+        Args:
+            products (list): The list of products to index
+            report (dict): The report to add the duplicated ids
+
+        Returns:
+            index (dict): The products indexed by their ids
+
+        """
+        index = {}
+        for product in products:
+            identifier = product["id"]
+            if identifier not in index:
+                index[identifier] = product
+            elif index[identifier] != product:
+                report["conflicting_ids"].add(identifier)
+            else:
+                report["duplicated_ids"].add(identifier)
+        return index
+
+    def find_broken_chains(self, index: dict, report: dict):
+        """Function to find orphans and cycles walking up each chain only once
+
+        Args:
+            index (dict): The products indexed by their ids
+            report (dict): The report to add the orphans and the cycles
+
+        Returns:
+            broken (set): Ids of products that can't reach a root
+
+        """
+        # Ids already walked (the walk number that visited them)
+        visited = {}
+        broken = set()
+        for walk, identifier in enumerate(index):
+            path = []
+            current = identifier
+            while current is not None and current not in visited:
+                if current not in index:
+                    # The last product of the path points to a missing parent
+                    report["orphans"].add(path[-1])
+                    break
+                visited[current] = walk
+                path.append(current)
+                current = index[current]["parent_id"]
+            else:
+                if current is not None and visited[current] == walk:
+                    # Came back to a product of this same walk
+                    cycle = path[path.index(current) :]
+                    report["cycles"].append(cycle)
+                    broken.update(cycle)
+                elif current is None or current not in broken:
+                    continue
+            broken.update(path)
+        return broken
+
+    def find_mismatches(self, index: dict, broken: set, report: dict):
+        """Function to compare `children_ids` with the `parent_id` of products
+
+        `children_ids` may list every descendant and not only the direct
+        children, so a listed child is valid if the product is on its chain.
+
+        Args:
+            index (dict): The products indexed by their ids
+            broken (set): Ids of products that can't reach a root
+            report (dict): The report to add the mismatches
+
+        """
+        children = {
+            identifier: set(product["children_ids"])
+            for identifier, product in index.items()
+        }
+        for identifier, product in index.items():
+            parent_identifier = product["parent_id"]
+            if (
+                parent_identifier in index
+                and identifier not in children[parent_identifier]
+            ):
+                report["missing_children"].append((parent_identifier, identifier))
+            for child in children[identifier]:
+                if child not in index:
+                    report["wrong_children"].append((identifier, child))
+                    continue
+                if child in broken:
+                    continue
+                current = index[child]["parent_id"]
+                while current is not None and current != identifier:
+                    current = index[current]["parent_id"]
+                if current is None:
+                    report["wrong_children"].append((identifier, child))
+
+    def validate(self, products: list):
+        """Function to run all the checks on a list of products
+
+        Args:
+            products (list): The list of products to validate
+
+        Returns:
+            report (dict): The problems found for each check
+
+        """
+        report = {
+            "orphans": set(),
+            "cycles": [],
+            "conflicting_ids": set(),
+            "duplicated_ids": set(),
+            "missing_children": [],
+            "wrong_children": [],
+        }
+        index = self.index_products(products, report)
+        broken = self.find_broken_chains(index, report)
+        self.find_mismatches(index, broken, report)
+        return report
+
+    def is_valid(self, report: dict):
+        """Function to check if a report allows the migration
+
+        Args:
+            report (dict): The report returned by validate()
+
+        Returns:
+            bool: True if there are no errors (nor warnings on strict mode)
+
+        """
+        checks = self.ERRORS + self.WARNINGS if self.strict else self.ERRORS
+        return not any(report[check] for check in checks)
+
+    def log_report(self, report: dict):
+        """Function to log the problems found on a report
+
+        Args:
+            report (dict): The report returned by validate()
+
+        """
+        for check in self.ERRORS + self.WARNINGS:
+            if not report[check]:
+                continue
+            error = check in self.ERRORS or self.strict
+            sample = sorted(report[check], key=str)[:10]
+            message = f"{len(report[check])} {check.replace('_', ' ')}: {sample}"
+            if error:
+                logging.error(f"[ERROR] Invalid catalog, {message}")
+            else:
+                logging.warning(f"[WARNING] Catalog has {message}")
+
+    def check(self, products: list):
+        """Function to validate the products and log the problems
+
+        Args:
+            products (list): The list of products to validate
+
+        Returns:
+            bool: True if the products can be migrated, otherwise False
+
+        """
+        report = self.validate(products)
+        self.log_report(report)
+        return self.is_valid(report)
+
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format="%(name)s: %(levelname)s - %(message)s")
+
+
+def main():
+    """
+    Main function to validate a catalog file (default `product_groups.json`)
+
+    Returns:
+        bool: True if the catalog is valid, otherwise False
+
+    """
+    filename = sys.argv[1] if len(sys.argv) > 1 else "product_groups.json"
+    with open(filename, "r") as file:
+        products = json.load(file)
+    valid = CatalogValidator(strict="--strict" in sys.argv).check(products)
+    if valid:
+        logging.info(f"[INFO] {filename} is valid ({len(products)} products)")
+    return valid
+
+
+if __name__ == "__main__":
+    sys.exit(0 if main() else 1)